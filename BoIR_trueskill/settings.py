@@ -9,7 +9,23 @@ env = environ.Env(
     SESSION_COOKIE_SECURE=(bool, True),
     CSRF_COOKIE_SECURE=(bool, True),
     STATIC_URL=(str, '/static/'),
-    STATIC_ROOT=(str, '')
+    STATIC_ROOT=(str, ''),
+    LEADERBOARDS_LOG_LEVEL=(str, 'INFO'),
+    SERVER_TIMING=(bool, False),
+    METRICS=(bool, False),
+    METRICS_PATH=(str, ''),
+    LEADERBOARD_GENERATIONS_KEPT=(int, 5),
+    CONN_MAX_AGE=(int, 60),
+    SQLITE_JOURNAL_MODE=(str, 'WAL'),
+    SQLITE_SYNCHRONOUS=(str, 'NORMAL'),
+    SQLITE_CACHE_SIZE=(int, -20000),
+    SQLITE_MMAP_SIZE=(int, 256 * 2 ** 20),
+    REPLICA_DATABASE_URL=(str, ''),
+    CACHE_URL=(str, ''),
+    SIMULATION_CACHE_URL=(str, 'locmemcache://simulations'),
+    WARM_CACHES=(bool, True),
+    PARALLEL_REPLAY=(bool, False),
+    CHECKPOINT_INTERVAL=(int, 50)
 )
 BASE_DIR = environ.Path(__file__) - 2
 
@@ -37,6 +53,23 @@ CHALLONGE_API_KEY = env('CHALLONGE_API_KEY')
 
 ALLOWED_HOSTS = env('ALLOWED_HOSTS')
 
+# Number of leaderboard generations kept after recalculation, older ones can be restored with rollback_leaderboards
+LEADERBOARD_GENERATIONS_KEPT = env('LEADERBOARD_GENERATIONS_KEPT')
+# Replays mixed, unseeded and seeded leaderboards in separate processes, worth it once the history is large enough
+# to outweigh starting the processes
+PARALLEL_REPLAY = env('PARALLEL_REPLAY')
+# Rating state is saved every CHECKPOINT_INTERVAL tournaments and after the last one, so a recalculation replays only
+# the tournaments after the latest checkpoint that wasn't invalidated by a change. 0 disables checkpoints.
+CHECKPOINT_INTERVAL = env('CHECKPOINT_INTERVAL')
+
+# Adds Server-Timing headers with view, SQL and cache statistics to leaderboard responses
+SERVER_TIMING = env('SERVER_TIMING')
+
+# Exposes request latency, cache and recalculation metrics at /metrics in Prometheus format. Workers share the numbers
+# through a SQLite file at METRICS_PATH
+METRICS = env('METRICS')
+METRICS_PATH = env('METRICS_PATH') or os.path.join(BASE_DIR, 'metrics.sqlite3')
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -49,6 +82,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'leaderboards.middleware.MetricsMiddleware',
+    'leaderboards.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +117,42 @@ DATABASES = {
     # If there is no DATABASE_URL in .env, it will read from local db.sqlite3 file
     'default': env.db(default='sqlite:///db.sqlite3')
 }
+# Connections are kept open between requests for CONN_MAX_AGE seconds (0 closes them after every request)
+DATABASES['default']['CONN_MAX_AGE'] = env('CONN_MAX_AGE')
+
+# Optional read-only replica used by public leaderboard endpoints, it has to be kept in sync with default database
+# outside of Django (e.g. streaming replication, or litestream/copy of SQLite file)
+if env('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = env.db('REPLICA_DATABASE_URL')
+    DATABASES['replica']['CONN_MAX_AGE'] = env('CONN_MAX_AGE')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['leaderboards.routers.ReplicaRouter']
+
+# Cache shared by all worker processes, so a view computed by one worker is served by the others. If there is no
+# CACHE_URL in .env, files in the cache directory are used, e.g. CACHE_URL=memcache://127.0.0.1:11211 selects memcached
+# and CACHE_URL=locmemcache:// a per-process cache. Only one worker recomputes an expired view with the file cache or a
+# backend with atomic add (memcached, redis), not with e.g. a database cache.
+CACHES = {
+    'default': env.cache_url_config(env('CACHE_URL') or f"filecache://{os.path.join(BASE_DIR, 'cache')}"),
+    # Results of the tournament simulator endpoint, any POST can add one, so they are kept out of the default cache
+    # where they would push out the views. Per process by default.
+    'simulations': env.cache_url_config(env('SIMULATION_CACHE_URL')),
+}
+
+# Tests use a per-process cache, so running them doesn't clear the cache of the site
+TEST_RUNNER = 'BoIR_trueskill.test_runner.TestRunner'
+
+# Renders cached views right after a recalculation publishes new leaderboards, so visitors don't wait for them
+WARM_CACHES = env('WARM_CACHES')
+
+# Pragmas applied to every new SQLite connection. WAL lets readers work while imports and recalculations write,
+# negative cache_size is in KiB and mmap_size is in bytes
+SQLITE_PRAGMAS = {
+    'journal_mode': env('SQLITE_JOURNAL_MODE'),
+    'synchronous': env('SQLITE_SYNCHRONOUS'),
+    'cache_size': env('SQLITE_CACHE_SIZE'),
+    'mmap_size': env('SQLITE_MMAP_SIZE'),
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -119,3 +190,19 @@ USE_TZ = True
 
 STATIC_ROOT = env('STATIC_ROOT')
 STATIC_URL = env('STATIC_URL')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'leaderboards': {
+            'handlers': ['console'],
+            'level': env('LEADERBOARDS_LOG_LEVEL'),
+        },
+    },
+}
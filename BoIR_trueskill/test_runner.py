@@ -0,0 +1,29 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Tests clear and fill the cache, the configured one may be the cache of a running site
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    },
+    'simulations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-simulations',
+    },
+}
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs tests with a per-process cache instead of CACHES, tests of the file cache configure their own directory
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = override_settings(CACHES=TEST_CACHES)
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,4 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
 from .models import *
 from django.apps import apps
 
@@ -7,7 +10,14 @@ app = apps.get_app_config('leaderboards')
 for model_name, model in app.models.items():
     admin.site.register(model)
 
+admin.site.unregister(Player)
+admin.site.unregister(PlayerAlias)
+admin.site.unregister(Team)
+admin.site.unregister(AllowedScore)
+admin.site.unregister(Ruleset)
 admin.site.unregister(Tournament)
+admin.site.unregister(RecalculationRun)
+admin.site.unregister(LeaderboardGeneration)
 
 
 class TournamentVodInLine(admin.TabularInline):
@@ -15,16 +25,168 @@ class TournamentVodInLine(admin.TabularInline):
     fields = ['url', 'description']
 
 
-class MatchInLine(admin.StackedInline):
+class PlayerAliasInLine(admin.TabularInline):
+    model = PlayerAlias
+    fields = ['alias']
+    extra = 1
+
+
+class PlayerAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+    inlines = [PlayerAliasInLine]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Players are also found by any alias they used, regardless of its case and spacing
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        player_ids = PlayerAlias.objects.resolve([search_term]).values()
+        if player_ids:
+            results |= queryset.filter(id__in=player_ids)
+        return results, may_have_duplicates
+
+
+class PlayerAliasAdmin(admin.ModelAdmin):
+    list_display = ('alias', 'normalized_alias', 'player')
+    list_select_related = ['player']
+    search_fields = ['normalized_alias', 'player__name']
+    autocomplete_fields = ['player']
+
+
+class TeamAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+    list_select_related = ['tournament']
+    list_display = ('name', 'tournament')
+
+
+class AllowedScoreAdmin(admin.ModelAdmin):
+    search_fields = ['score']
+
+
+class RulesetAdmin(admin.ModelAdmin):
+    search_fields = ['ruleset']
+
+
+admin.site.register(Player, PlayerAdmin)
+admin.site.register(PlayerAlias, PlayerAliasAdmin)
+admin.site.register(Team, TeamAdmin)
+admin.site.register(AllowedScore, AllowedScoreAdmin)
+admin.site.register(Ruleset, RulesetAdmin)
+
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """
+    Autocomplete widget that renders the selected option from the object already loaded with the form instance,
+    instead of querying it for every form of the inline
+    """
+    selected_object = None
+
+    def optgroups(self, name, value, attr=None):
+        selected_choices = {str(v) for v in value if str(v) not in self.choices.field.empty_values}
+        if self.selected_object is None or selected_choices != {str(self.selected_object.pk)}:
+            return super().optgroups(name, value, attr)
+        default = (None, [], 0)
+        if not self.is_required:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        default[1].append(self.create_option(name, self.selected_object.pk,
+                                             self.choices.field.label_from_instance(self.selected_object),
+                                             selected_choices, len(default[1])))
+        return [default]
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset showing a single page of related objects, selected by page_parameter GET parameter
+    """
+    per_page = 50
+    page_parameter = 'page'
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            self.paginator = Paginator(super().get_queryset(), self.per_page)
+            self.page = self.paginator.get_page(self.page_number)
+        return self.page.object_list
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        for field in form.fields.values():
+            widget = getattr(field.widget, 'widget', field.widget)  # Unwrap RelatedFieldWidgetWrapper
+            if isinstance(widget, LoadedAutocompleteSelect) and form.instance.pk is not None:
+                widget.selected_object = getattr(form.instance, widget.field.name)
+        return form
+
+
+class MatchInLine(admin.TabularInline):
     model = Match
-    raw_id_fields = ('winner', 'loser', 'winner_team', 'loser_team')
+    formset = PaginatedInlineFormSet
+    template = 'admin/leaderboards/edit_inline/paginated_tabular.html'
+    fields = ('winner', 'loser', 'winner_team', 'loser_team', 'score', 'ruleset', 'description')
+    autocomplete_fields = ('winner', 'loser', 'winner_team', 'loser_team', 'score', 'ruleset')
+    extra = 1
+
+    def get_queryset(self, request):
+        # Tournament is used by the title of every row
+        return super().get_queryset(request).select_related('tournament', *self.autocomplete_fields).order_by('id')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        # Page is a GET parameter of the change form, so it's kept when the form is submitted
+        return type(formset.__name__, (formset,), {'page_parameter': 'match_page',
+                                                   'page_number': request.GET.get('match_page')})
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = LoadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 class TournamentAdmin(admin.ModelAdmin):
     class Media:
         js = ('/static/admin/js/hide_team_fields.js',)
 
+    list_display = ('name', 'date', 'ruleset', 'winner', 'notability')
+    list_select_related = ('ruleset', 'winner')
+    list_filter = ('ruleset', 'notability')
+    search_fields = ('name', 'challonge_id')
+    date_hierarchy = 'date'
+    autocomplete_fields = ('winner', 'winner_team')
     inlines = [TournamentVodInLine, MatchInLine]
 
 
 admin.site.register(Tournament, TournamentAdmin)
+
+
+class RecalculationRunAdmin(admin.ModelAdmin):
+    list_display = ('created', 'generation', 'duration', 'loading_time', 'rating_time', 'sorting_time', 'export_time',
+                    'matches_processed', 'rating_updates', 'rows_created', 'rows_updated', 'rows_deleted', 'queries')
+    readonly_fields = [field.name for field in RecalculationRun._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(RecalculationRun, RecalculationRunAdmin)
+
+
+class LeaderboardGenerationAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'created', 'published', 'is_live')
+    readonly_fields = ('created', 'published')
+    actions = ['publish_generation']
+
+    def is_live(self, obj):
+        return obj == LeaderboardGeneration.objects.live()
+    is_live.boolean = True
+
+    def has_add_permission(self, request):
+        return False
+
+    def publish_generation(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one generation to publish', level=messages.ERROR)
+            return
+        generation = queryset.get()
+        generation.publish()
+        self.message_user(request, f'{generation} is live')
+    publish_generation.short_description = 'Publish selected generation'
+
+
+admin.site.register(LeaderboardGeneration, LeaderboardGenerationAdmin)
@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
 
 
 class LeaderboardsConfig(AppConfig):
     name = 'leaderboards'
+
+    def ready(self):
+        from .db import apply_sqlite_pragmas
+        from .models import Tournament, Match, Ruleset, AllowedScore
+        from .signals import invalidate_tournament_checkpoints, invalidate_match_checkpoints, \
+            invalidate_all_checkpoints
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='leaderboards_sqlite_pragmas')
+        # Queryset update() and bulk operations don't send signals, checkpoints have to be deleted by their callers
+        for signal in (pre_save, post_delete):
+            signal.connect(invalidate_tournament_checkpoints, sender=Tournament,
+                           dispatch_uid='leaderboards_tournament_checkpoints')
+            signal.connect(invalidate_match_checkpoints, sender=Match, dispatch_uid='leaderboards_match_checkpoints')
+        for model in (Ruleset, AllowedScore):
+            post_save.connect(invalidate_all_checkpoints, sender=model,
+                              dispatch_uid=f'leaderboards_{model._meta.model_name}_checkpoints')
@@ -0,0 +1,169 @@
+import os
+import time
+from functools import wraps
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest
+from django.urls import reverse, resolve
+from django.utils.cache import patch_response_headers
+
+# Id of the live leaderboard generation, part of every view cache key so publishing a generation invalidates them
+GENERATION_KEY = 'leaderboards:generation'
+# How long a worker may recompute a view before other workers stop waiting for it, in seconds
+LOCK_TIMEOUT = 30
+# How long workers without a stale copy wait for the recomputed view, in seconds
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+# Views decorated with cache_view, referenced by their url names, with arguments of every page they serve
+CACHED_VIEWS = (
+    ('index', [()]),
+    ('get_leaderboard', [('mixed',), ('unseeded',), ('seeded',)]),
+    ('get_ratings', [('mixed',), ('unseeded',), ('seeded',)]),
+)
+
+
+def set_generation(generation_id):
+    cache.set(GENERATION_KEY, generation_id, None)
+
+
+def get_generation():
+    """
+    Returns id of the live generation, 0 before the first one is published. It is read from the database only when
+    the shared cache lost it, always from the primary, a lagging replica would store an old generation until the next
+    publish.
+    """
+    generation_id = cache.get(GENERATION_KEY)
+    if generation_id is None:
+        from leaderboards.models import LeaderboardGeneration
+        live = LeaderboardGeneration.objects.using(DEFAULT_DB_ALIAS).live()
+        generation_id = live.id if live is not None else 0
+        set_generation(generation_id)
+    return generation_id
+
+
+def acquire_lock(lock_key):
+    """
+    Returns True if this worker got the lock. cache.add is atomic in memcached or redis, but FileBasedCache implements
+    it as has_key followed by set, so with the file cache the lock is a file next to the entries created with O_EXCL.
+    Locks older than LOCK_TIMEOUT are left by a crashed worker and are taken over.
+    """
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        return cache.add(lock_key, True, LOCK_TIMEOUT)
+    path = lock_file(backend, lock_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if os.path.getmtime(path) > time.time() - LOCK_TIMEOUT:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:  # Released in the meantime
+                pass
+    return False
+
+
+def release_lock(lock_key):
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        cache.delete(lock_key)
+        return
+    try:
+        os.remove(lock_file(backend, lock_key))
+    except FileNotFoundError:
+        pass
+
+
+def lock_file(backend, lock_key):
+    # Suffix differs from entries, so cache.clear() and culling don't remove locks
+    return f'{backend._key_to_file(lock_key)}.lock'
+
+
+def view_cache_key(path):
+    return f'leaderboards:view:{get_generation()}:{path}'
+
+
+def cache_view(timeout, stale_timeout=60 * 60):
+    """
+    Caches GET responses of the view in the shared cache, similarly to cache_page. On a miss only one worker
+    recomputes the view, others serve the expired copy (kept for stale_timeout after expiry) or wait for the new one.
+    Only one worker per miss is guaranteed with the file cache (see acquire_lock) or a backend with atomic add such as
+    memcached or redis. Sets request.cache_status to 'hit', 'stale' or 'miss'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = view_cache_key(request.get_full_path())
+            entry = cache.get(key)  # (expiry timestamp, response)
+            if entry is not None and entry[0] > time.time():
+                request.cache_status = 'hit'
+                return entry[1]
+
+            lock_key = f'{key}:lock'
+            locked = acquire_lock(lock_key)
+            if not locked:
+                if entry is not None:
+                    request.cache_status = 'stale'
+                    return entry[1]
+                deadline = time.monotonic() + LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        request.cache_status = 'hit'
+                        return entry[1]
+
+            request.cache_status = 'miss'
+            try:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    patch_response_headers(response, timeout)
+                    cache.set(key, (time.time() + timeout, response), timeout + stale_timeout)
+            finally:
+                if locked:  # A worker that gave up waiting mustn't release the lock of the one recomputing
+                    release_lock(lock_key)
+            return response
+        return wrapper
+    return decorator
+
+
+def view_request(path):
+    """
+    GET request of the path as the handler would build it, without going through the middleware
+    """
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    request.META['SERVER_NAME'] = hosts[0] if hosts else 'localhost'
+    request.META['SERVER_PORT'] = '443' if settings.SECURE_SSL_REDIRECT else '80'
+    request.resolver_match = resolve(path)
+    return request
+
+
+def warm_views(force=False):
+    """
+    Renders every page of CACHED_VIEWS into the cache under the keys used by the views
+
+    :param force: Recompute pages that are already cached
+    :return: Dictionary of paths and their cache status
+    """
+    statuses = {}
+    for url_name, arguments in CACHED_VIEWS:
+        for args in arguments:
+            path = reverse(url_name, args=args)
+            if force:
+                cache.delete(view_cache_key(path))
+            request = view_request(path)
+            match = request.resolver_match
+            match.func(request, *match.args, **match.kwargs)
+            statuses[path] = request.cache_status
+    return statuses
@@ -0,0 +1,26 @@
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    connection_created receiver applying SQLITE_PRAGMAS setting to new SQLite connections
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@contextmanager
+def execute_wrapper(wrapper, handler=connections):
+    """
+    Installs the execute wrapper on connections of all databases, so queries sent to the replica are seen as well
+    """
+    with ExitStack() as stack:
+        for connection in handler.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
@@ -1,12 +1,52 @@
 from django.core.management.base import BaseCommand
 from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
-from leaderboards.models import Tournament, Player, Leaderboard
+from leaderboards.trueskill_scripts.waves import schedule_waves, wave_statistics
+from leaderboards.models import Tournament, Player, Leaderboard, RecalculationRun, RatingCheckpoint, \
+    MatchRatingChange, HeadToHead
+from leaderboards.profiling import add_profiling_arguments, profiling
 
 
 class Command(BaseCommand):
-    help = 'Takes no argument. Recalculates and recreates leaderboards'
+    help = 'Recalculates and recreates leaderboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parallel',
+                            action='store_true',
+                            dest='parallel',
+                            help='Replays every leaderboard in its own process (default: PARALLEL_REPLAY setting)')
+        parser.add_argument('--force',
+                            action='store_true',
+                            dest='force',
+                            help='Recalculates even when tournaments and matches did not change since the last run')
+        parser.add_argument('--full',
+                            action='store_true',
+                            dest='full',
+                            help='Deletes rating checkpoints and replays the whole history, implies --force')
+        parser.add_argument('--waves',
+                            action='store_true',
+                            dest='waves',
+                            help='Prints how many dependency waves every leaderboard replay splits into')
+        add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
-        TrueskillCalculations(tournament_model=Tournament, player_model=Player,
-                              leaderboard_model=Leaderboard).create_leaderboards()
+        if options['full']:
+            RatingCheckpoint.objects.all().delete()
+        calculations = TrueskillCalculations(tournament_model=Tournament, player_model=Player,
+                                             leaderboard_model=Leaderboard, run_model=RecalculationRun,
+                                             checkpoint_model=RatingCheckpoint, change_model=MatchRatingChange,
+                                             head_to_head_model=HeadToHead,
+                                             parallel=options['parallel'] or None,
+                                             force=options['force'] or options['full'])
+        with profiling('calculate_trueskill', options, self.stdout):
+            calculations.create_leaderboards()
+        self.stdout.write(calculations.metrics.summary())
+        if options['waves']:
+            self.write_wave_statistics(calculations)
+
+    def write_wave_statistics(self, calculations):
+        steps = calculations.partition(calculations.load_tournaments())
+        for leaderboard_type, leaderboard_steps in steps.items():
+            statistics = wave_statistics(schedule_waves(leaderboard_steps))
+            self.stdout.write(f'{leaderboard_type}: {statistics.steps} steps in {statistics.waves} waves, '
+                              f'max width {statistics.max_width}, mean width {statistics.mean_width:.2f}')
 
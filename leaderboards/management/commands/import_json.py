@@ -9,6 +9,7 @@ from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 
 from leaderboards.models import *
+from leaderboards.profiling import add_profiling_arguments, profiling
 from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
 
 
@@ -29,8 +30,13 @@ class Command(BaseCommand):
                             action='store_true',
                             dest='add_user',
                             help='Adds tournament organizers into database as users')
+        add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
+        with profiling('import_json', options, self.stdout):
+            self.import_tournaments(options)
+
+    def import_tournaments(self, options):
         if options['bulk']:
             for infile in sorted(
                     glob.glob(
@@ -49,9 +55,15 @@ class Command(BaseCommand):
                     continue
                 self.add_tournament(tournament_data, options)
         self.stdout.write('Calculating trueskill...')
-        TrueskillCalculations(tournament_model=Tournament,
-                              leaderboard_model=Leaderboard,
-                              player_model=Player).create_leaderboards()
+        calculations = TrueskillCalculations(tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard,
+                                             player_model=Player,
+                                             run_model=RecalculationRun,
+                                             checkpoint_model=RatingCheckpoint,
+                                             change_model=MatchRatingChange,
+                                             head_to_head_model=HeadToHead)
+        calculations.create_leaderboards()
+        self.stdout.write(calculations.metrics.summary())
 
     def add_tournament(self, tournament_data, options):
         new_tournament = Tournament(
@@ -64,8 +76,9 @@ class Command(BaseCommand):
             description=tournament_data['description']
         )
         new_tournament.save()
+        player_ids = self.resolve_players(self.player_names(tournament_data), options)
         if new_tournament.ruleset.ruleset == 'team':
-            self.add_team(tournament_data, new_tournament, options)
+            self.add_team(tournament_data, new_tournament, player_ids)
         if options['add_user']:
             self.add_user(tournament_data, new_tournament)
         for match in tournament_data['matchups']:
@@ -77,18 +90,10 @@ class Command(BaseCommand):
                                                            loser_team=match_loser,
                                                            score=score)
             else:
-                match_winner = self.check_player_in_db(match['winner'], options)
-                match_loser = self.check_player_in_db(match['loser'], options)
-                db_match = new_tournament.match_set.create(winner=match_winner,
-                                                           loser=match_loser,
+                db_match = new_tournament.match_set.create(winner_id=player_ids[match['winner']],
+                                                           loser_id=player_ids[match['loser']],
                                                            score=score)
 
-                # Also update the "last_played" field for each player in the database
-                match_winner.last_played = tournament_data['date']
-                match_winner.save()
-                match_loser.last_played = tournament_data['date']
-                match_loser.save()
-
             if 'description' in match:
                 db_match.description = match['description']
             if 'ruleset' in match:
@@ -100,8 +105,7 @@ class Command(BaseCommand):
                 for round_number, round_details in enumerate(match['ruleset_per_round'], 1):
                     db_round = RulesetPerRound(round_number=round_number,
                                                match=db_match,
-                                               winner=Player.objects.get(
-                                                   playeralias__alias=round_details['winner'].lower()))
+                                               winner_id=player_ids[round_details['winner']])
                     if round_details['ruleset'] == "":  # Forfeits should have null/blank here
                         pass
                     else:
@@ -109,11 +113,16 @@ class Command(BaseCommand):
                     db_round.save()
             db_match.save()
 
+        # Also update the "last_played" field for each player in the database
+        if new_tournament.ruleset.ruleset != 'team':
+            Player.objects.filter(id__in={player_ids[match[side]] for match in tournament_data['matchups']
+                                          for side in ('winner', 'loser')}).update(last_played=tournament_data['date'])
+
         if 'winner' in tournament_data and tournament_data['winner'] != 'n/a':
             if new_tournament.ruleset.ruleset == 'team':
                 new_tournament.winner_team = Team.objects.get(tournament=new_tournament, name=tournament_data['winner'])
             else:
-                new_tournament.winner = Player.objects.get(playeralias__alias=tournament_data['winner'].lower())
+                new_tournament.winner_id = player_ids[tournament_data['winner']]
         for video in tournament_data['videos']:
             Vod(tournament=new_tournament,
                 description=video['description'],
@@ -121,13 +130,26 @@ class Command(BaseCommand):
         new_tournament.save()
         self.stdout.write(self.style.SUCCESS(f"Successfully added {tournament_data['name']} tournament"))
 
-    def add_team(self, tournament_data, new_tournament, options):
+    @staticmethod
+    def player_names(tournament_data):
+        """
+        Returns names of all players mentioned in the tournament, in order of their first appearance
+        """
+        names = []
+        if tournament_data['ruleset'] == 'team':
+            names += [player for team in tournament_data['teams'] for player in team['participants']]
+        else:
+            names += [match[side] for match in tournament_data['matchups'] for side in ('winner', 'loser')]
+            names += [round_details['winner'] for match in tournament_data['matchups']
+                      for round_details in match.get('ruleset_per_round', [])]
+            if tournament_data.get('winner', 'n/a') != 'n/a':
+                names.append(tournament_data['winner'])
+        return list(dict.fromkeys(names))
+
+    def add_team(self, tournament_data, new_tournament, player_ids):
         for team in tournament_data['teams']:
             db_team = Team.objects.get_or_create(tournament=new_tournament, name=team['name'])[0]
-            for player in team['participants']:
-                db_player = self.check_player_in_db(player, options)
-                db_team.members.add(db_player)
-            db_team.save()
+            db_team.members.add(*[player_ids[player] for player in team['participants']])
 
     def add_user(self, tournament_data, tournament):
         for organizer in tournament_data['organizer']:
@@ -146,17 +168,25 @@ class Command(BaseCommand):
             tournament_organizer.is_superuser = False
         return tournament_organizer
 
-    def check_player_in_db(self, player_name, options):
-        if PlayerAlias.objects.filter(alias=player_name.lower()).exists():
-            pass
-        else:
-            if options['verification']:
-                self.new_player_prompt(player_name)
-            else:
-                new_player = Player.objects.create(name=player_name)
-                new_player.playeralias_set.create(alias=player_name.lower())
-                new_player.save()
-        return Player.objects.get(playeralias__alias=player_name.lower())
+    def resolve_players(self, player_names, options):
+        """
+        Maps player names to player ids with one query, players (or aliases with --verify) are added for unknown names
+        """
+        player_ids = PlayerAlias.objects.resolve(player_names)
+        added = {}  # Normalized aliases added during this import, names may differ only in case
+        for player_name in player_names:
+            if player_name in player_ids:
+                continue
+            normalized_alias = normalize_alias(player_name)
+            if normalized_alias not in added:
+                if options['verification']:
+                    added[normalized_alias] = self.new_player_prompt(player_name)
+                else:
+                    new_player = Player.objects.create(name=player_name)
+                    new_player.playeralias_set.create(alias=player_name)
+                    added[normalized_alias] = new_player.id
+            player_ids[player_name] = added[normalized_alias]
+        return player_ids
 
     def new_player_prompt(self, player_name):
         self.stdout.write('Players in the database:')
@@ -169,12 +199,12 @@ class Command(BaseCommand):
             user_input = input('(y/n):')
         if user_input in 'nN':
             new_player = Player.objects.create(name=player_name)
-            new_player.playeralias_set.create(alias=player_name.lower())
-            new_player.save()
+            new_player.playeralias_set.create(alias=player_name)
             self.stdout.write(self.style.SUCCESS('Successfully added new player into database'))
+            return new_player.id
         else:
             chosen_pk = input('Choose a player by typing in his number:')
             chosen_player = Player.objects.get(pk=chosen_pk)
-            chosen_player.playeralias_set.create(alias=player_name.lower())
-            chosen_player.save()
+            chosen_player.playeralias_set.create(alias=player_name)
             self.stdout.write(self.style.SUCCESS(f'Successfully added new alias for {chosen_player}'))
+            return chosen_player.id
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from leaderboards.cache import warm_views
+from leaderboards.models import LeaderboardGeneration
+
+
+class Command(BaseCommand):
+    help = 'Publishes an older leaderboard generation. Without argument, the one created before the live generation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('generation_id', nargs='?', type=int)
+
+    def handle(self, *args, **options):
+        live = LeaderboardGeneration.objects.live()
+        if options['generation_id'] is not None:
+            try:
+                generation = LeaderboardGeneration.objects.get(id=options['generation_id'])
+            except LeaderboardGeneration.DoesNotExist:
+                raise CommandError(f"Generation {options['generation_id']} doesn't exist")
+        else:
+            generation = LeaderboardGeneration.objects.filter(id__lt=live.id).first() if live else None
+            if generation is None:
+                raise CommandError('There is no older generation to roll back to')
+        generation.publish()
+        self.stdout.write(self.style.SUCCESS(f'{generation} is live, it replaced {live}'))
+        if settings.WARM_CACHES:
+            # Registered after publish, so views are rendered once the generation they are cached under is set
+            transaction.on_commit(self.warm_views)
+
+    def warm_views(self):
+        statuses = warm_views()
+        self.stdout.write(f'Rendered {len(statuses)} cached pages')
@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from leaderboards.snapshots import get_snapshot
+from leaderboards.trueskill_scripts.simulation import FORMATS, SINGLE_ELIMINATION, bracket_indices, \
+    rounds_to_winner, simulate
+
+BYE = '-'
+
+
+class Command(BaseCommand):
+    help = 'Simulates a tournament from live ratings and prints probabilities of every entrant reaching every round'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rating_type',
+                            choices=['mixed', 'unseeded', 'seeded'],
+                            help='Leaderboard the ratings are taken from')
+        parser.add_argument('entrants',
+                            nargs='+',
+                            help=f'Names or aliases of entrants in bracket order, {BYE} for a bye in single '
+                                 f'elimination')
+        parser.add_argument('--format',
+                            choices=FORMATS,
+                            default=SINGLE_ELIMINATION,
+                            dest='format',
+                            help=f'Tournament format (default: {SINGLE_ELIMINATION})')
+        parser.add_argument('--rounds',
+                            type=int,
+                            dest='rounds',
+                            help='Number of Swiss rounds (default: rounds of a single elimination bracket)')
+        parser.add_argument('--simulations',
+                            type=int,
+                            default=100000,
+                            dest='simulations',
+                            help='Number of simulated tournaments (default: 100000)')
+        parser.add_argument('--workers',
+                            type=int,
+                            default=os.cpu_count(),
+                            dest='workers',
+                            help='Number of worker processes (default: number of CPUs)')
+        parser.add_argument('--seed',
+                            type=int,
+                            dest='seed',
+                            help='Seed of the random generator, for reproducible results')
+
+    def handle(self, *args, **options):
+        single_elimination = options['format'] == SINGLE_ELIMINATION
+        entrants = [None if single_elimination and name == BYE else name for name in options['entrants']]
+        names, bracket = bracket_indices(entrants)
+        if len(names) < 2 or len(set(names)) != len(names):
+            raise CommandError('Entrants must contain at least two different names, each only once')
+        rounds = options['rounds'] or rounds_to_winner(names)
+
+        start = time.perf_counter()
+        snapshot = get_snapshot(options['rating_type'])
+        mu, sigma, rated, _ = snapshot.entrant_ratings(names)
+        probabilities = simulate(options['format'], mu, sigma, options['simulations'], bracket=bracket,
+                                 rounds=rounds, workers=options['workers'], seed=options['seed'])
+        self.stdout.write(f'Simulated {options["simulations"]} tournaments in {time.perf_counter() - start:.2f}s')
+
+        if single_elimination:
+            columns = [f'R{round_number}' for round_number in range(1, probabilities.shape[1])] + ['Win']
+        else:
+            columns = [f'{wins}W' for wins in range(probabilities.shape[1] - 1)] + ['First']
+        width = max(len('Entrant'), *(len(name) + 1 for name in names)) + 1
+        self.stdout.write('Entrant'.ljust(width) + ''.join(column.rjust(8) for column in columns))
+        for name, is_rated, results in zip(names, rated, probabilities):
+            label = name if is_rated else f'{name}*'
+            self.stdout.write(label.ljust(width) + ''.join(f'{result:8.1%}' for result in results))
+        if not rated.all():
+            self.stdout.write('* not rated, simulated with the initial rating')
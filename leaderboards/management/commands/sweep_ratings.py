@@ -0,0 +1,85 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from leaderboards.models import Tournament
+from leaderboards.trueskill_scripts.evaluation import evaluate_parameters, init_worker
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
+
+
+class Command(BaseCommand):
+    help = 'Scores predictive accuracy of rating settings over a parameter grid, using the whole match history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tournament-limit',
+                            nargs='+',
+                            type=int,
+                            default=[2],
+                            dest='tournament_limit',
+                            help='Tournament limits to try, only matches between players over the limit are scored')
+        parser.add_argument('--seeded-multiplier',
+                            nargs='+',
+                            type=int,
+                            default=[1, 2, 3, 4, 5, 6],
+                            dest='seeded_multiplier',
+                            help='Seeded multipliers to try')
+        parser.add_argument('--mixed-multiplier',
+                            nargs='+',
+                            type=int,
+                            default=[1, 2, 3, 4],
+                            dest='mixed_multiplier',
+                            help='Mixed multipliers to try')
+        parser.add_argument('--workers',
+                            type=int,
+                            default=os.cpu_count(),
+                            dest='workers',
+                            help='Number of worker processes (default: number of CPUs)')
+        parser.add_argument('--top',
+                            type=int,
+                            default=20,
+                            dest='top',
+                            help='Number of best settings shown (default: 20)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        history = TrueskillCalculations(tournament_model=Tournament).load_tournaments()
+        grid = [
+            {'tournament_limit': tournament_limit, 'seeded_multiplier': seeded_multiplier,
+             'mixed_multiplier': mixed_multiplier}
+            for tournament_limit, seeded_multiplier, mixed_multiplier in itertools.product(
+                options['tournament_limit'], options['seeded_multiplier'], options['mixed_multiplier'])
+        ]
+        self.stdout.write(f'Evaluating {len(grid)} settings on {sum(len(t.matches) for t in history)} matches...')
+        if options['workers'] > 1:
+            # History is sent to every worker once, tasks carry only the parameters
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                     initargs=(history,)) as executor:
+                results = list(executor.map(evaluate_parameters, grid))
+        else:
+            results = [evaluate_parameters(parameters, history) for parameters in grid]
+
+        results = [(parameters, scores) for parameters, scores in results if 'mixed' in scores]
+        results.sort(key=lambda result: result[1]['mixed']['log_loss'])
+        # Tournament limit doesn't change ratings, only which matches are scored, so log losses of different limits are
+        # computed over different matches and are ranked separately
+        for number, tournament_limit in enumerate(options['tournament_limit']):
+            if number:
+                self.stdout.write('')
+            self.write_ranking([result for result in results if result[0]['tournament_limit'] == tournament_limit],
+                               options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Sweep finished in {time.perf_counter() - start:.1f}s'))
+
+    def write_ranking(self, results, top):
+        self.stdout.write(f'{"#":>3} {"limit":>5} {"seeded":>6} {"mixed":>5} | {"log loss":>8} {"hit rate":>8} '
+                          f'{"matches":>7} | {"unseeded":>8} {"seeded":>8}')
+        for place, (parameters, scores) in enumerate(results[:top], start=1):
+            unseeded = scores.get('unseeded', {}).get('log_loss', float('nan'))
+            seeded = scores.get('seeded', {}).get('log_loss', float('nan'))
+            self.stdout.write(
+                f'{place:>3} {parameters["tournament_limit"]:>5} {parameters["seeded_multiplier"]:>6} '
+                f'{parameters["mixed_multiplier"]:>5} | {scores["mixed"]["log_loss"]:>8.4f} '
+                f'{scores["mixed"]["hit_rate"]:>8.2%} {scores["mixed"]["matches"]:>7} | '
+                f'{unseeded:>8.4f} {seeded:>8.4f}')
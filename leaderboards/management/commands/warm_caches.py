@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from leaderboards.cache import warm_views
+
+
+class Command(BaseCommand):
+    help = 'Renders every cached page (index, leaderboards and ratings of all types) into the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force',
+                            action='store_true',
+                            dest='force',
+                            help='Recomputes pages that are already cached, e.g. after a deploy changed them')
+
+    def handle(self, *args, **options):
+        for path, cache_status in warm_views(force=options['force']).items():
+            self.stdout.write(f'{path}: {"already cached" if cache_status == "hit" else "rendered"}')
+        self.stdout.write(self.style.SUCCESS('Caches are warm'))
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from leaderboards import prometheus
+from leaderboards.db import execute_wrapper
+
+# Views that get Server-Timing headers and latency metrics, referenced by their url names
+TIMED_VIEWS = ('index', 'get_leaderboard', 'get_ratings', 'get_rating_changes', 'get_head_to_head', 'predict',
+               'seeding', 'simulate_tournament', 'search_players')
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and time spent executing them
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+def get_cache_status(request):
+    """
+    Returns 'hit', 'stale' or 'miss' for responses that went through cache_view and None for uncached views
+    """
+    return getattr(request, 'cache_status', None)
+
+
+class ServerTimingMiddleware:
+    """
+    Adds Server-Timing header with total time, SQL time, number of queries and cache status to TIMED_VIEWS responses.
+    Enabled with SERVER_TIMING setting.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with execute_wrapper(timer):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        if request.resolver_match is None or request.resolver_match.url_name not in TIMED_VIEWS:
+            return response
+        metrics = [
+            f'total;dur={total * 1000:.2f}',
+            f'sql;dur={timer.duration * 1000:.2f};desc="{timer.queries} queries"',
+        ]
+        cache_status = get_cache_status(request)
+        if cache_status is not None:
+            metrics.append(f'cache;desc={cache_status}')
+        response['Server-Timing'] = ', '.join(metrics)
+        response['X-SQL-Queries'] = str(timer.queries)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records latency and cache status of TIMED_VIEWS responses for the metrics endpoint. Enabled with METRICS setting.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        if request.resolver_match is not None and request.resolver_match.url_name in TIMED_VIEWS:
+            prometheus.observe_request(request.resolver_match.url_name, duration, get_cache_status(request))
+        return response
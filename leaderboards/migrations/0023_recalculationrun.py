@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0022_auto_20200320_1401'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecalculationRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField()),
+                ('loading_time', models.FloatField()),
+                ('rating_time', models.FloatField()),
+                ('sorting_time', models.FloatField()),
+                ('export_time', models.FloatField()),
+                ('tournaments_loaded', models.IntegerField(default=0)),
+                ('matches_processed', models.IntegerField(default=0)),
+                ('rating_updates', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
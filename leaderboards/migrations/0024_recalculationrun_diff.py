@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0023_recalculationrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recalculationrun',
+            name='rows_created',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recalculationrun',
+            name='rows_deleted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recalculationrun',
+            name='rows_updated',
+            field=models.IntegerField(default=0),
+        ),
+    ]
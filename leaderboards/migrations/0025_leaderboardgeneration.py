@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0024_recalculationrun_diff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardGeneration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('published', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='leaderboard',
+            name='generation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='leaderboards.leaderboardgeneration'),
+        ),
+        migrations.AddField(
+            model_name='recalculationrun',
+            name='generation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='leaderboards.leaderboardgeneration'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['generation', 'leaderboard_type'], name='leaderboard_generat_be7c92_idx'),
+        ),
+    ]
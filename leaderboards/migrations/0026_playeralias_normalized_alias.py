@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0025_leaderboardgeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playeralias',
+            name='normalized_alias',
+            field=models.CharField(editable=False, max_length=200, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:20
+
+from django.db import migrations
+
+
+def populate_normalized_alias(apps, schema_editor):
+    """
+    Fills normalized aliases and deletes aliases of a player that normalize to one the player already has, the oldest
+    alias is kept. Aliases of different players normalizing to the same one have to be resolved by an admin first.
+    """
+    PlayerAlias = apps.get_model('leaderboards', 'PlayerAlias')
+    kept = {}
+    duplicates = []
+    conflicts = []
+    for alias in PlayerAlias.objects.order_by('id'):
+        alias.normalized_alias = ' '.join(alias.alias.split()).casefold()
+        original = kept.get(alias.normalized_alias)
+        if original is None:
+            kept[alias.normalized_alias] = alias
+        elif original.player_id == alias.player_id:
+            duplicates.append(alias.id)
+        else:
+            conflicts.append(f'alias {alias.id} "{alias.alias}" of player {alias.player_id} collides with alias '
+                             f'{original.id} "{original.alias}" of player {original.player_id}')
+    if conflicts:
+        raise RuntimeError('Aliases of different players differ only in case or whitespace, rename or delete them '
+                           'before migrating:\n' + '\n'.join(conflicts))
+    PlayerAlias.objects.filter(id__in=duplicates).delete()
+    PlayerAlias.objects.bulk_update(kept.values(), ['normalized_alias'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0026_playeralias_normalized_alias'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_normalized_alias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_players(apps, schema_editor):
+    """
+    Creates search terms (suffixes of normalized text) of all player names and aliases
+    """
+    Player = apps.get_model('leaderboards', 'Player')
+    PlayerAlias = apps.get_model('leaderboards', 'PlayerAlias')
+    PlayerSearchTerm = apps.get_model('leaderboards', 'PlayerSearchTerm')
+
+    def terms(player_id, text, alias_id=None):
+        normalized = ' '.join(text.split()).casefold()
+        return [PlayerSearchTerm(player_id=player_id, alias_id=alias_id, term=normalized[offset:], offset=offset)
+                for offset in range(len(normalized)) if normalized[offset] != ' ']
+
+    search_terms = []
+    for player_id, name in Player.objects.values_list('id', 'name'):
+        search_terms += terms(player_id, name)
+    for alias_id, player_id, alias in PlayerAlias.objects.values_list('id', 'player_id', 'alias'):
+        search_terms += terms(player_id, alias, alias_id)
+    PlayerSearchTerm.objects.bulk_create(search_terms, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0028_playeralias_normalized_alias_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=200)),
+                ('offset', models.PositiveSmallIntegerField()),
+                ('alias', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='leaderboards.playeralias')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leaderboards.player')),
+            ],
+        ),
+        migrations.RunPython(index_players, migrations.RunPython.noop),
+    ]
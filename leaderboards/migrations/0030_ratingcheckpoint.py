@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0029_playersearchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('tournaments', models.IntegerField()),
+                ('parameters', models.CharField(max_length=200)),
+                ('state', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leaderboards.tournament')),
+            ],
+            options={
+                'ordering': ['-date', '-tournament_id'],
+            },
+        ),
+    ]
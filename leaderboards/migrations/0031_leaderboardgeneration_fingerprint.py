@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0030_ratingcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardgeneration',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def replay_from_start(apps, schema_editor):
+    """
+    Rating changes are written only for replayed matches, so the next recalculation has to replay the whole history
+    instead of skipping it or continuing from a checkpoint
+    """
+    apps.get_model('leaderboards', 'RatingCheckpoint').objects.all().delete()
+    apps.get_model('leaderboards', 'LeaderboardGeneration').objects.update(fingerprint='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0031_leaderboardgeneration_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchRatingChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leaderboard_type', models.CharField(max_length=200)),
+                ('mu_before', models.FloatField()),
+                ('sigma_before', models.FloatField()),
+                ('mu_after', models.FloatField()),
+                ('sigma_after', models.FloatField()),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leaderboards.match')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leaderboards.player')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='matchratingchange',
+            index=models.Index(fields=['player', 'leaderboard_type', 'match'], name='leaderboard_player__d87530_idx'),
+        ),
+        migrations.RunPython(replay_from_start, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def replay_from_start(apps, schema_editor):
+    """
+    Head-to-head records are refreshed only for replayed tournaments, so the next recalculation has to replay the whole
+    history to build all of them
+    """
+    apps.get_model('leaderboards', 'RatingCheckpoint').objects.all().delete()
+    apps.get_model('leaderboards', 'LeaderboardGeneration').objects.update(fingerprint='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0032_matchratingchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeadToHead',
+            fields=[
+                ('pair', models.CharField(max_length=41, primary_key=True, serialize=False)),
+                ('low_wins', models.IntegerField(default=0)),
+                ('high_wins', models.IntegerField(default=0)),
+                ('draws', models.IntegerField(default=0)),
+                ('rulesets', models.TextField(default='{}')),
+                ('last_played', models.DateField(db_index=True)),
+                ('player_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='leaderboards.player')),
+                ('player_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='leaderboards.player')),
+            ],
+        ),
+        migrations.RunPython(replay_from_start, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Q, F, Exists, Subquery, Count, Min, Max, Value
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.conf import settings
+from django.utils import timezone
+from leaderboards.cache import set_generation
 from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
 
 
@@ -13,6 +20,12 @@ class Player(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding or 'name' in (kwargs.get('update_fields') or ['name']):
+            PlayerSearchTerm.index(self.id, self.name, replace=not adding)
+
 
 class Stat(models.Model):
     name = models.CharField(max_length=200)
@@ -52,13 +65,77 @@ class AllowedScore(models.Model):
         return self.score
 
 
+def normalize_alias(name):
+    """
+    Case-insensitive form of player name with collapsed whitespace, used to match aliases
+    """
+    return ' '.join(name.split()).casefold()
+
+
+class PlayerAliasQuerySet(models.QuerySet):
+    def resolve(self, names):
+        """
+        Maps player names to ids of players with matching aliases, with a single query
+
+        :return: Dictionary of names and player ids, names without alias are left out
+        """
+        player_ids = dict(self.filter(normalized_alias__in={normalize_alias(name) for name in names}).values_list(
+            'normalized_alias', 'player_id'))
+        return {name: player_ids[normalize_alias(name)] for name in names if normalize_alias(name) in player_ids}
+
+
 class PlayerAlias(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     alias = models.CharField(max_length=200)
+    normalized_alias = models.CharField(max_length=200, unique=True, editable=False)
+
+    objects = PlayerAliasQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.player} - {self.alias}'
 
+    def clean(self):
+        self.normalized_alias = normalize_alias(self.alias)
+        if PlayerAlias.objects.filter(normalized_alias=self.normalized_alias).exclude(pk=self.pk).exists():
+            raise ValidationError({'alias': 'This alias already belongs to a player'})
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        self.normalized_alias = normalize_alias(self.alias)
+        super().save(*args, **kwargs)
+        PlayerSearchTerm.index(self.player_id, self.alias, alias=self, replace=not adding)
+
+
+def search_terms(text):
+    """
+    Suffixes of normalized text with their offsets, every substring of the text is a prefix of one of them
+    """
+    normalized = normalize_alias(text)
+    return [(normalized[offset:], offset) for offset in range(len(normalized)) if normalized[offset] != ' ']
+
+
+class PlayerSearchTermQuerySet(models.QuerySet):
+    def search(self, query):
+        """
+        Players whose name or alias contains the query, with their live ratings, found with a single query. Players
+        whose name or alias starts with the query come first.
+
+        :return: Values with player__name, offset and <leaderboard type>_mu/_sigma of every leaderboard type
+        """
+        query = normalize_alias(query)
+        # Same rows as LeaderboardQuerySet.live(), without generation both sides are 0. A single subquery per rating
+        # keeps the query cheap to compile, which is most of the time this query takes.
+        live_generation = Coalesce(Subquery(LeaderboardGeneration.objects.published().values('id')[:1]), Value(0))
+        ratings = {
+            f'{leaderboard_type}_{field}': Max(f'player__leaderboard__{field}', filter=Q(
+                player__leaderboard__leaderboard_type=leaderboard_type, rating_generation=live_generation))
+            for leaderboard_type in ('mixed', 'unseeded', 'seeded') for field in ('mu', 'sigma')
+        }
+        # Range scan over the term index, '\uffff' sorts after any character of the Basic Multilingual Plane
+        return self.filter(term__gte=query, term__lt=query + '\uffff').alias(
+            rating_generation=Coalesce('player__leaderboard__generation', Value(0))).values('player__name').annotate(
+            offset=Min('offset'), **ratings).order_by('offset', 'player__name')
+
 
 class Tournament(models.Model):
     name = models.CharField(max_length=200)
@@ -81,7 +158,10 @@ class Tournament(models.Model):
         super().save()
         if create_leaderboards:
             TrueskillCalculations(tournament_model=self.__class__, leaderboard_model=Leaderboard,
-                                  player_model=Player).create_leaderboards()
+                                  player_model=Player, run_model=RecalculationRun,
+                                  checkpoint_model=RatingCheckpoint,
+                                  change_model=MatchRatingChange,
+                                  head_to_head_model=HeadToHead).create_leaderboards()
 
 
 class Team(models.Model):
@@ -145,7 +225,55 @@ class Vod(models.Model):
         return f'{self.tournament}: {self.description}'
 
 
+class LeaderboardGenerationQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(published__isnull=False).order_by('-published')
+
+    def live(self):
+        return self.published().first()
+
+
+class LeaderboardGeneration(models.Model):  # Complete set of leaderboards created by a single recalculation
+    created = models.DateTimeField(auto_now_add=True)
+    published = models.DateTimeField(null=True, blank=True, db_index=True)  # The last published generation is live
+    fingerprint = models.CharField(max_length=64, blank=True)  # Hash of the rating inputs the generation was made from
+
+    objects = LeaderboardGenerationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'Generation {self.id}'
+
+    def publish(self):
+        """
+        Makes this generation live, also used to roll back to an older generation
+        """
+        self.published = timezone.now()
+        self.save(update_fields=['published'])
+        # Cached views are keyed by the live generation, they are invalidated only once the new one is visible
+        transaction.on_commit(lambda: set_generation(self.id))
+
+
+class LeaderboardQuerySet(models.QuerySet):
+    def live(self):
+        """
+        Rows of the live generation, rows without generation are live until the first generation is published
+        """
+        published = LeaderboardGeneration.objects.published()
+        return self.filter(Q(generation=Subquery(published.values('id')[:1]))
+                           | Q(generation__isnull=True) & ~Exists(published))
+
+    def of_generation(self, generation_id):
+        """
+        Rows of the generation with the id returned by get_generation, 0 are the rows without generation
+        """
+        return self.filter(generation_id=generation_id or None)
+
+
 class Leaderboard(models.Model):
+    generation = models.ForeignKey(LeaderboardGeneration, null=True, blank=True, on_delete=models.CASCADE)
     leaderboard_type = models.CharField(max_length=200)
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     exposure = models.FloatField(null=True)  # Default sorting value
@@ -154,8 +282,205 @@ class Leaderboard(models.Model):
     tournaments_played = models.IntegerField(default=0)
     matches_played = models.IntegerField(default=0)
 
+    objects = LeaderboardQuerySet.as_manager()
+
     class Meta:
         ordering = ['-exposure']
+        indexes = [models.Index(fields=['generation', 'leaderboard_type'])]
 
     def __str__(self):
         return f'{self.leaderboard_type}: {self.exposure}.{self.player}'
+
+
+class RecalculationRun(models.Model):  # Timings and counters of a single leaderboard recalculation
+    created = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField()
+    loading_time = models.FloatField()
+    rating_time = models.FloatField()
+    sorting_time = models.FloatField()
+    export_time = models.FloatField()
+    tournaments_loaded = models.IntegerField(default=0)
+    matches_processed = models.IntegerField(default=0)
+    rating_updates = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_deleted = models.IntegerField(default=0)
+    queries = models.IntegerField(default=0)
+    generation = models.ForeignKey(LeaderboardGeneration, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.created}: {self.duration:.3f}s'
+
+
+class PlayerSearchTerm(models.Model):  # Suffix of a player name or alias, used for substring search of players
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    alias = models.ForeignKey(PlayerAlias, null=True, blank=True, on_delete=models.CASCADE)  # Null for player name
+    term = models.CharField(max_length=200, db_index=True)
+    offset = models.PositiveSmallIntegerField()  # Position of the suffix, 0 for the whole name
+
+    objects = PlayerSearchTermQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.player}: {self.term}'
+
+    @classmethod
+    def index(cls, player_id, text, alias=None, replace=True):
+        """
+        Creates search terms of player name or alias
+
+        :param alias: PlayerAlias the text comes from, None for player name
+        :param replace: Delete old terms of the name or alias first
+        """
+        if replace:
+            # Terms of an alias are deleted by the alias alone, it may have been moved from another player
+            old_terms = cls.objects.filter(alias=alias) if alias is not None else cls.objects.filter(
+                player_id=player_id, alias__isnull=True)
+            old_terms.delete()
+        cls.objects.bulk_create(cls(player_id=player_id, alias=alias, term=term, offset=offset)
+                                for term, offset in search_terms(text))
+
+
+class RatingCheckpointQuerySet(models.QuerySet):
+    def invalidate(self, *dates):
+        """
+        Deletes checkpoints that include tournaments from any of the dates on, dates can also be subqueries
+        """
+        condition = Q()
+        for date in dates:
+            condition |= Q(date__gte=date)
+        return self.filter(condition).delete()
+
+
+class RatingCheckpoint(models.Model):  # Rating state after all tournaments up to the tournament, ordered by date and id
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE)
+    date = models.DateField(db_index=True)  # Date of the tournament
+    tournaments = models.IntegerField()  # Number of tournaments included
+    parameters = models.CharField(max_length=200)  # Rating parameters the state was calculated with
+    state = models.TextField()  # JSON of player ratings and counters of every leaderboard type, keyed by player id
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = RatingCheckpointQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-date', '-tournament_id']
+
+    def __str__(self):
+        return f'{self.date}: {self.tournament}'
+
+
+class MatchRatingChange(models.Model):  # Rating of a player before and after a match, written by every replay
+    match = models.ForeignKey(Match, on_delete=models.CASCADE)
+    leaderboard_type = models.CharField(max_length=200)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    mu_before = models.FloatField()
+    sigma_before = models.FloatField()
+    mu_after = models.FloatField()
+    sigma_after = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['player', 'leaderboard_type', 'match'])]
+
+    def __str__(self):
+        return f'{self.leaderboard_type}: {self.player} {self.mu_before:.2f} -> {self.mu_after:.2f}'
+
+    @property
+    def exposure_change(self):
+        return (self.mu_after - 3 * self.sigma_after) - (self.mu_before - 3 * self.sigma_before)
+
+
+def head_to_head_key(player_id, opponent_id):
+    """
+    Primary key of the HeadToHead record of two players, the same for both orders of the players
+    """
+    return f'{min(player_id, opponent_id)}-{max(player_id, opponent_id)}'
+
+
+# Player pairs refreshed with a single query, every pair takes 4 query variables, which stays under the 999 variables
+# SQLite allows by default
+HEAD_TO_HEAD_BATCH_SIZE = 200
+
+
+class HeadToHeadQuerySet(models.QuerySet):
+    def refresh(self, after=None):
+        """
+        Recalculates records from matches with a single aggregation grouped by player pair and ruleset. Old records are
+        deleted before the new ones are inserted, call it in a transaction (the export phase of a recalculation) so
+        readers never see the pairs missing.
+
+        :param after: Date, only pairs that played since the date or whose record is from the date on are recalculated
+        :return: Number of records written
+        """
+        matches = Match.objects.filter(winner__isnull=False, loser__isnull=False)
+        if after is None:
+            records = self.aggregate_records(matches)
+            self.all().delete()
+            self.bulk_create(records, batch_size=1000)
+            return len(records)
+
+        # Pairs are collected first with indexed lookups, the records are then rebuilt only from the matches of those
+        # pairs. A pair that lost its recent matches is found only by its record.
+        pairs = matches.filter(tournament__date__gte=after).annotate(
+            low=Least('winner_id', 'loser_id'), high=Greatest('winner_id', 'loser_id')).values_list('low', 'high') \
+            .union(self.filter(last_played__gte=after).values_list('player_low_id', 'player_high_id'))
+        pairs = sorted(pairs)
+        records = []
+        for start in range(0, len(pairs), HEAD_TO_HEAD_BATCH_SIZE):
+            batch = pairs[start:start + HEAD_TO_HEAD_BATCH_SIZE]
+            condition = Q()
+            for low, high in batch:
+                condition |= Q(winner_id=low, loser_id=high) | Q(winner_id=high, loser_id=low)
+            records.extend(self.aggregate_records(matches.filter(condition)))
+            self.filter(pk__in=[head_to_head_key(low, high) for low, high in batch]).delete()
+        self.bulk_create(records, batch_size=1000)
+        return len(records)
+
+    def aggregate_records(self, matches):
+        """
+        :return: List of unsaved records of all player pairs of the matches
+        """
+        draw = Q(score__score='draw')
+        rows = matches.annotate(low=Least('winner_id', 'loser_id'), high=Greatest('winner_id', 'loser_id'),
+                                ruleset_name=Coalesce('ruleset__ruleset', 'tournament__ruleset__ruleset', Value(''))) \
+            .values('low', 'high', 'ruleset_name').annotate(
+                low_wins=Count('id', filter=Q(winner_id=F('low')) & ~draw),
+                high_wins=Count('id', filter=Q(winner_id=F('high')) & ~draw),
+                draws=Count('id', filter=draw),
+                last_played=Max('tournament__date')).order_by()
+
+        records = {}
+        rulesets = {}
+        for row in rows:
+            key = head_to_head_key(row['low'], row['high'])
+            if key not in records:
+                records[key] = self.model(pair=key, player_low_id=row['low'], player_high_id=row['high'],
+                                          last_played=row['last_played'])
+                rulesets[key] = {}
+            record = records[key]
+            record.low_wins += row['low_wins']
+            record.high_wins += row['high_wins']
+            record.draws += row['draws']
+            record.last_played = max(record.last_played, row['last_played'])
+            rulesets[key][row['ruleset_name']] = [row['low_wins'], row['high_wins'], row['draws']]
+        for key, record in records.items():
+            record.rulesets = json.dumps(rulesets[key], sort_keys=True)
+        return list(records.values())
+
+
+class HeadToHead(models.Model):  # Results of all matches between two players, the player with the lower id is low
+    pair = models.CharField(max_length=41, primary_key=True)  # head_to_head_key of the players
+    player_low = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    player_high = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    low_wins = models.IntegerField(default=0)
+    high_wins = models.IntegerField(default=0)
+    draws = models.IntegerField(default=0)
+    rulesets = models.TextField(default='{}')  # JSON of [low wins, high wins, draws] by ruleset name
+    last_played = models.DateField(db_index=True)  # Date of the last meeting
+
+    objects = HeadToHeadQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.player_low} {self.low_wins}-{self.high_wins} {self.player_high}'
@@ -0,0 +1,68 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+
+def add_profiling_arguments(parser):
+    parser.add_argument('--profile',
+                        action='store_true',
+                        dest='profile',
+                        help='Runs the command under cProfile and saves pstats file with a summary')
+    parser.add_argument('--profile-memory',
+                        action='store_true',
+                        dest='profile_memory',
+                        help='Traces memory allocations with tracemalloc and saves a summary')
+    parser.add_argument('--profile-dir',
+                        default='profiles',
+                        dest='profile_dir',
+                        help='Directory in which profiling results are saved (default: profiles)')
+    parser.add_argument('--profile-top',
+                        type=int,
+                        default=30,
+                        dest='profile_top',
+                        help='Number of functions and allocation sites listed in the summary (default: 30)')
+
+
+@contextmanager
+def profiling(name, options, stdout):
+    """
+    Profiles the code inside the block according to options added by add_profiling_arguments. Results are written
+    into <profile_dir>/<name>-<timestamp>.pstats and <profile_dir>/<name>-<timestamp>.txt
+    """
+    if not options['profile'] and not options['profile_memory']:
+        yield
+        return
+    os.makedirs(options['profile_dir'], exist_ok=True)
+    base_path = os.path.join(options['profile_dir'], f"{name}-{timezone.now().strftime('%Y%m%d-%H%M%S')}")
+    profiler = cProfile.Profile() if options['profile'] else None
+    if options['profile_memory']:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        summary = io.StringIO()
+        if profiler:
+            profiler.dump_stats(f'{base_path}.pstats')
+            summary.write(f'Hot functions (top {options["profile_top"]} by cumulative time)\n')
+            stats = pstats.Stats(profiler, stream=summary)
+            stats.sort_stats('cumulative').print_stats(options['profile_top'])
+        if options['profile_memory']:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary.write(f'Memory: peak {peak / 2 ** 20:.1f} MiB, still allocated {current / 2 ** 20:.1f} MiB\n')
+            summary.write(f'Largest allocation sites (top {options["profile_top"]})\n')
+            for statistic in snapshot.statistics('lineno')[:options['profile_top']]:
+                summary.write(f'{statistic}\n')
+        with open(f'{base_path}.txt', 'w') as summary_file:
+            summary_file.write(summary.getvalue())
+        stdout.write(f'Profiling results saved to {base_path}.*')
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+
+from django.conf import settings
+
+# Upper bounds of request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+def get_store():
+    """
+    Returns metrics store of the current thread, every worker process writes into the same METRICS_PATH file
+    """
+    store = getattr(_local, 'store', None)
+    if store is None or store.path != settings.METRICS_PATH:
+        store = _local.store = MetricsStore(settings.METRICS_PATH)
+    return store
+
+
+class MetricsStore:
+    """
+    Counters kept in a local SQLite file, so that they are shared between worker processes without any service
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS samples ('
+                                'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+                                'PRIMARY KEY (name, labels))')
+
+    def increment(self, samples):
+        """
+        :param samples: Dictionary of (name, labels) keys and values they are incremented by
+        """
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, value) for (name, labels), value in samples.items()])
+
+    def samples(self):
+        return {(name, labels): value for name, labels, value in self.connection.execute(
+            'SELECT name, labels, value FROM samples')}
+
+    def clear(self):
+        self.connection.execute('DELETE FROM samples')
+
+
+def observe_request(view, duration, cache_status=None):
+    samples = {
+        ('leaderboards_request_duration_seconds_sum', f'view="{view}"'): duration,
+        ('leaderboards_request_duration_seconds_count', f'view="{view}"'): 1,
+    }
+    for bucket in LATENCY_BUCKETS:
+        if duration <= bucket:
+            samples[('leaderboards_request_duration_seconds_bucket', f'view="{view}",le="{bucket}"')] = 1
+    if cache_status is not None:
+        samples[('leaderboards_cache_requests_total', f'view="{view}",result="{cache_status}"')] = 1
+    get_store().increment(samples)
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(views, gauges):
+    """
+    Renders collected metrics in Prometheus text exposition format
+
+    :param views: Url names of views with latency histograms
+    :param gauges: List of (name, help, value) tuples computed at scrape time
+    """
+    samples = get_store().samples()
+    lines = [
+        '# HELP leaderboards_request_duration_seconds Time spent handling the request',
+        '# TYPE leaderboards_request_duration_seconds histogram',
+    ]
+    for view in views:
+        count = samples.get(('leaderboards_request_duration_seconds_count', f'view="{view}"'), 0)
+        for bucket in LATENCY_BUCKETS:
+            value = samples.get(('leaderboards_request_duration_seconds_bucket', f'view="{view}",le="{bucket}"'), 0)
+            lines.append(f'leaderboards_request_duration_seconds_bucket{{view="{view}",le="{bucket}"}} '
+                         f'{format_value(value)}')
+        lines.append(f'leaderboards_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {format_value(count)}')
+        total = samples.get(('leaderboards_request_duration_seconds_sum', f'view="{view}"'), 0)
+        lines.append(f'leaderboards_request_duration_seconds_sum{{view="{view}"}} {format_value(total)}')
+        lines.append(f'leaderboards_request_duration_seconds_count{{view="{view}"}} {format_value(count)}')
+    lines.append('# HELP leaderboards_cache_requests_total Cached view lookups by result')
+    lines.append('# TYPE leaderboards_cache_requests_total counter')
+    for view in views:
+        for result in ('hit', 'stale', 'miss'):
+            value = samples.get(('leaderboards_cache_requests_total', f'view="{view}",result="{result}"'), 0)
+            lines.append(f'leaderboards_cache_requests_total{{view="{view}",result="{result}"}} '
+                         f'{format_value(value)}')
+    for name, description, value in gauges:
+        if value is None:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,43 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_DATABASE = 'replica'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def use_replica(view):
+    """
+    Makes all reads done by the view go to the replica database, when ReplicaRouter is enabled
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _read_from_replica.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _read_from_replica.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Sends reads of views decorated with use_replica to the read-only replica, everything else including all writes,
+    admin and management commands uses the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and REPLICA_DATABASE in settings.DATABASES:
+            return REPLICA_DATABASE
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,62 @@
+from django.db.models import Subquery
+from django.db.models.signals import pre_save
+
+from leaderboards.models import Tournament, Match, RatingCheckpoint
+
+# Fields ratings are calculated from, saving a row with none of them changed keeps the checkpoints
+TOURNAMENT_RATING_FIELDS = ('date', 'ruleset_id')
+MATCH_RATING_FIELDS = ('tournament_id', 'winner_id', 'loser_id', 'ruleset_id', 'score_id')
+
+
+def stored_values(instance, fields, *related):
+    """
+    Values of the fields as they are stored in the database, None for a row that wasn't saved yet
+    """
+    if instance.pk is None:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values(*fields, *related).first()
+
+
+def rating_fields_changed(stored, instance, fields):
+    # to_python makes e.g. a date assigned as a string comparable with the stored one
+    return any(stored[field] != instance._meta.get_field(field).to_python(getattr(instance, field))
+               for field in fields)
+
+
+def invalidate_tournament_checkpoints(sender, instance, signal, **kwargs):
+    """
+    pre_save and post_delete receiver of Tournament, deletes checkpoints from the old and the new date on. Saves that
+    don't change the date or the ruleset, e.g. of the description, keep them.
+    """
+    if signal is not pre_save:
+        RatingCheckpoint.objects.invalidate(instance.date)
+        return
+    stored = stored_values(instance, TOURNAMENT_RATING_FIELDS)
+    if stored is None:
+        RatingCheckpoint.objects.invalidate(instance.date)
+    elif rating_fields_changed(stored, instance, TOURNAMENT_RATING_FIELDS):
+        RatingCheckpoint.objects.invalidate(instance.date, stored['date'])
+
+
+def invalidate_match_checkpoints(sender, instance, signal, **kwargs):
+    """
+    pre_save and post_delete receiver of Match, deletes checkpoints from the date of the old and the new tournament on.
+    Saves that don't change the tournament, players, ruleset or score keep them.
+    """
+    tournament_date = Subquery(Tournament.objects.filter(pk=instance.tournament_id).values('date'))
+    if signal is not pre_save:
+        RatingCheckpoint.objects.invalidate(tournament_date)
+        return
+    stored = stored_values(instance, MATCH_RATING_FIELDS, 'tournament__date')
+    if stored is None:
+        RatingCheckpoint.objects.invalidate(tournament_date)
+    elif rating_fields_changed(stored, instance, MATCH_RATING_FIELDS):
+        RatingCheckpoint.objects.invalidate(tournament_date, stored['tournament__date'])
+
+
+def invalidate_all_checkpoints(sender, instance, created, **kwargs):
+    """
+    post_save receiver of Ruleset and AllowedScore, renaming them can change how any match is rated
+    """
+    if not created:
+        RatingCheckpoint.objects.all().delete()
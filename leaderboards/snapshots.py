@@ -0,0 +1,70 @@
+import numpy as np
+import trueskill
+
+from leaderboards.cache import get_generation
+from leaderboards.models import Leaderboard, PlayerAlias
+
+# RatingSnapshot of every leaderboard type, kept in memory of the process until a new generation is published
+_snapshots = {}
+
+
+class RatingSnapshot:
+    """
+    Live ratings of a leaderboard in NumPy arrays, players are addressed by their index
+    """
+
+    def __init__(self, rating_type, generation):
+        self.generation = generation
+        # Rows of the generation the cache announced, not whatever the database considers live, a lagging replica would
+        # otherwise fill the snapshot of the new generation with the old ratings. Generation 0 is the rows without one.
+        rows = list(Leaderboard.objects.of_generation(generation).filter(leaderboard_type=rating_type).order_by()
+                    .values_list('player_id', 'player__name', 'mu', 'sigma'))
+        self.names = [name for _, name, _, _ in rows]
+        self.index_by_id = {player_id: index for index, (player_id, _, _, _) in enumerate(rows)}
+        self.index_by_name = {name: index for index, name in enumerate(self.names)}
+        self.mu = np.array([mu for _, _, mu, _ in rows], dtype=float)
+        self.sigma = np.array([sigma for _, _, _, sigma in rows], dtype=float)
+
+    def resolve(self, names):
+        """
+        Maps names to indices, names that aren't player names are looked up among aliases with a single query
+
+        :return: Dictionary of names and indices, names of unknown or unrated players are left out
+        """
+        indices = {name: self.index_by_name[name] for name in names if name in self.index_by_name}
+        unknown = [name for name in names if name not in indices]
+        if unknown:
+            for name, player_id in PlayerAlias.objects.resolve(unknown).items():
+                if player_id in self.index_by_id:
+                    indices[name] = self.index_by_id[player_id]
+        return indices
+
+    def entrant_ratings(self, names):
+        """
+        Ratings of a list of entrants, entrants that can't be resolved get the initial rating
+
+        :return: Arrays of means, standard deviations and whether the entrant is rated, and the resolved indices
+        """
+        indices = self.resolve(names)
+        env = trueskill.global_env()
+        mu = np.full(len(names), float(env.mu))
+        sigma = np.full(len(names), float(env.sigma))
+        rated = np.array([name in indices for name in names], dtype=bool)
+        players = np.array([indices[name] for name in names if name in indices], dtype=np.intp)
+        mu[rated], sigma[rated] = self.mu[players], self.sigma[players]
+        return mu, sigma, rated, indices
+
+
+def get_snapshot(rating_type):
+    generation = get_generation()
+    snapshot = _snapshots.get(rating_type)
+    if snapshot is None or snapshot.generation != generation:
+        snapshot = RatingSnapshot(rating_type, generation)
+        # No rows usually means the replica hasn't received the generation yet, the next request loads it again
+        if snapshot.names:
+            _snapshots[rating_type] = snapshot
+    return snapshot
+
+
+def clear_snapshots():
+    _snapshots.clear()
@@ -1,16 +1,16 @@
 django.jQuery(document).ready(function () {
+        // Matches both rows of the tournament form and cells and headers of the tabular match inline
+        var team_fields = ".field-winner_team, .field-loser_team, th.column-winner_team, th.column-loser_team";
+        var player_fields = ".field-winner, .field-loser, th.column-winner, th.column-loser";
+
         function hide_fields() {
             if (django.jQuery("#id_ruleset option:selected").text() !== "team") {
-                django.jQuery(".form-row.field-winner_team").hide();
-                django.jQuery(".form-row.field-loser_team").hide();
-                django.jQuery(".form-row.field-winner").show();
-                django.jQuery(".form-row.field-loser").show();
+                django.jQuery(team_fields).hide();
+                django.jQuery(player_fields).show();
             }
             else {
-                django.jQuery(".form-row.field-winner_team").show();
-                django.jQuery(".form-row.field-loser_team").show();
-                django.jQuery(".form-row.field-winner").hide();
-                django.jQuery(".form-row.field-loser").hide();
+                django.jQuery(team_fields).show();
+                django.jQuery(player_fields).hide();
             }
         }
 
@@ -18,5 +18,8 @@ django.jQuery(document).ready(function () {
         django.jQuery("#id_ruleset").change(function () {
             hide_fields();
         });
+        django.jQuery(document).on("formset:added", function () {
+            hide_fields();
+        });
     }
-);
\ No newline at end of file
+);
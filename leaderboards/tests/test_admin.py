@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from leaderboards.models import AllowedScore, Match, Player, Ruleset, Tournament
+
+
+class TournamentAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        ruleset = Ruleset.objects.create(ruleset='unseeded')
+        score = AllowedScore.objects.create(score='2-1')
+        self.tournament = Tournament.objects.create(name='Big Tournament', date='2018-05-10', ruleset=ruleset)
+        players = [Player.objects.create(name=f'Player_{number}') for number in range(10)]
+        Match.objects.bulk_create(
+            Match(tournament=self.tournament, winner=players[number % 10], loser=players[(number + 1) % 10],
+                  score=score, ruleset=ruleset)
+            for number in range(120))
+
+    def change_url(self):
+        return reverse('admin:leaderboards_tournament_change', args=[self.tournament.id])
+
+    def test_match_inline_is_paginated(self):
+        response = self.client.get(self.change_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(50, response.context['inline_admin_formsets'][1].formset.initial_form_count())
+        self.assertContains(response, '?match_page=3')
+        response = self.client.get(self.change_url(), {'match_page': 3})
+        formset = response.context['inline_admin_formsets'][1].formset
+        self.assertEqual(20, formset.initial_form_count())
+        self.assertEqual(list(Match.objects.order_by('id')[100:]), [form.instance for form in formset.initial_forms])
+
+    def test_match_rows_dont_query_related_objects(self):
+        self.client.get(self.change_url())
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(self.change_url())
+        with CaptureQueriesContext(connection) as last_page:
+            self.client.get(self.change_url(), {'match_page': 3})
+        self.assertEqual(len(full_page.captured_queries), len(last_page.captured_queries))
+
+    def test_saving_a_page_keeps_other_matches(self):
+        response = self.client.get(self.change_url(), {'match_page': 3})
+        data = self.formset_post_data(response)
+        data['match_set-0-DELETE'] = 'on'
+        response = self.client.post(f'{self.change_url()}?match_page=3', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(119, Match.objects.count())
+        self.assertFalse(Match.objects.filter(id=data['match_set-0-id']).exists())
+
+    def formset_post_data(self, response):
+        data = {}
+        for admin_formset in response.context['inline_admin_formsets']:
+            formset = admin_formset.formset
+            for name, field in formset.management_form.fields.items():
+                data[f'{formset.prefix}-{name}'] = formset.management_form[name].value()
+            for form in formset.initial_forms:
+                for name in form.fields:
+                    value = form[name].value()
+                    if value is not None:
+                        data[form.add_prefix(name)] = value
+        form = response.context['adminform'].form
+        for name in form.fields:
+            value = form[name].value()
+            if value is not None:
+                data[name] = value
+        return data
+
+    def test_changelist_search(self):
+        Tournament.objects.create(name='Other Tournament', date='2018-06-10')
+        response = self.client.get(reverse('admin:leaderboards_tournament_changelist'), {'q': 'big'})
+        self.assertContains(response, 'Big Tournament')
+        self.assertNotContains(response, 'Other Tournament')
+
+    def test_player_autocomplete(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'Player_1', 'app_label': 'leaderboards', 'model_name': 'match', 'field_name': 'winner'})
+        self.assertEqual(['Player_1'], [result['text'] for result in response.json()['results']])
@@ -0,0 +1,81 @@
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from leaderboards.management.commands.import_json import Command as ImportJsonCommand
+from leaderboards.models import Match, Player, PlayerAlias, Tournament, normalize_alias
+from leaderboards.tests.test_query_budgets import tournament_json
+
+
+class PlayerAliasTests(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(name='Cool Player')
+        PlayerAlias.objects.create(player=self.player, alias='Cool  Player')
+
+    def test_normalize_alias(self):
+        self.assertEqual('cool player', normalize_alias(' Cool \t PLAYER '))
+        self.assertEqual('strasse', normalize_alias('STRAßE'))
+
+    def test_resolve(self):
+        other = Player.objects.create(name='Other')
+        PlayerAlias.objects.create(player=other, alias='other')
+        with self.assertNumQueries(1):
+            player_ids = PlayerAlias.objects.resolve(['cool player', 'COOL PLAYER ', 'OTHER', 'unknown'])
+        self.assertEqual({'cool player': self.player.id, 'COOL PLAYER ': self.player.id, 'OTHER': other.id},
+                         player_ids)
+
+    def test_duplicate_alias(self):
+        with self.assertRaises(ValidationError):
+            PlayerAlias(player=Player.objects.create(name='Impostor'), alias='cool player').full_clean()
+
+
+class PopulateNormalizedAliasTests(TestCase):
+    migration = import_module('leaderboards.migrations.0027_populate_normalized_alias')
+
+    def create_aliases(self, *aliases):
+        """
+        Creates aliases as they were before normalized aliases, save() would fill them and the unique constraint would
+        reject the collisions
+        """
+        PlayerAlias.objects.bulk_create(PlayerAlias(player=player, alias=alias, normalized_alias=f'old {number}')
+                                        for number, (player, alias) in enumerate(aliases))
+
+    def test_duplicates_of_the_same_player_are_merged(self):
+        player = Player.objects.create(name='Cool Player')
+        self.create_aliases((player, 'Cool Player'), (player, 'cool  player'), (player, 'Other'))
+        self.migration.populate_normalized_alias(apps, None)
+        self.assertEqual([('Cool Player', 'cool player'), ('Other', 'other')],
+                         list(PlayerAlias.objects.order_by('id').values_list('alias', 'normalized_alias')))
+
+    def test_collisions_between_players_abort(self):
+        player = Player.objects.create(name='Cool Player')
+        impostor = Player.objects.create(name='Impostor')
+        self.create_aliases((player, 'Cool Player'), (impostor, 'COOL PLAYER'))
+        with self.assertRaisesRegex(RuntimeError, f'"COOL PLAYER" of player {impostor.id}'):
+            self.migration.populate_normalized_alias(apps, None)
+        self.assertEqual(2, PlayerAlias.objects.count())
+
+
+class ImportAliasTests(TestCase):
+    def import_tournament(self, tournament_data):
+        ImportJsonCommand(stdout=StringIO()).add_tournament(tournament_data, {'verification': False,
+                                                                              'add_user': False})
+        return Tournament.objects.get(name=tournament_data['name'])
+
+    def test_existing_alias_is_used(self):
+        player = Player.objects.create(name='Champion')
+        PlayerAlias.objects.create(player=player, alias='player_1')
+        tournament = self.import_tournament(tournament_json())
+        self.assertEqual(player, tournament.winner)
+        self.assertEqual(player, Match.objects.get(winner__name='Champion').winner)
+        self.assertFalse(Player.objects.filter(name='Player_1').exists())
+
+    def test_names_differing_in_case_are_one_player(self):
+        tournament_data = tournament_json()
+        tournament_data['matchups'][1]['loser'] = 'PLAYER_1'
+        self.import_tournament(tournament_data)
+        self.assertEqual(1, Player.objects.filter(name__iexact='player_1').count())
+        self.assertEqual(1, Match.objects.filter(loser__name='Player_1').count())
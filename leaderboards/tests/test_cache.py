@@ -0,0 +1,116 @@
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+
+from leaderboards import cache as view_cache
+from leaderboards.models import LeaderboardGeneration
+
+
+class CacheViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+
+        @view_cache.cache_view(60)
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'response {self.calls}')
+        self.view = view
+
+    def lock(self, path='/view'):
+        """
+        Takes the lock of the view like another worker recomputing it
+        """
+        lock_key = f'{view_cache.view_cache_key(path)}:lock'
+        self.assertTrue(view_cache.acquire_lock(lock_key))
+        self.addCleanup(view_cache.release_lock, lock_key)
+        return lock_key
+
+    def get(self, path='/view'):
+        request = self.factory.get(path)
+        response = self.view(request)
+        return request.cache_status, response.content.decode()
+
+    def test_miss_then_hit(self):
+        self.assertEqual(('miss', 'response 1'), self.get())
+        self.assertEqual(('hit', 'response 1'), self.get())
+        self.assertEqual(('miss', 'response 2'), self.get('/view?page=2'))
+
+    def test_expired_entry_is_recomputed(self):
+        self.get()
+        with mock.patch('leaderboards.cache.time.time', return_value=time.time() + 61):
+            self.assertEqual(('miss', 'response 2'), self.get())
+
+    def test_stale_entry_served_while_other_worker_recomputes(self):
+        self.get()
+        key = view_cache.view_cache_key('/view')
+        cache.set(key, (time.time() - 1, cache.get(key)[1]))  # Expired, the lock file age uses the real clock
+        self.lock()
+        self.assertEqual(('stale', 'response 1'), self.get())
+        self.assertEqual(1, self.calls)
+
+    def test_waits_for_other_worker_without_stale_entry(self):
+        key = view_cache.view_cache_key('/view')
+        self.lock()
+
+        def other_worker_finishes(seconds):
+            cache.set(key, (time.time() + 60, HttpResponse('other worker')))
+        with mock.patch('leaderboards.cache.time.sleep', side_effect=other_worker_finishes):
+            self.assertEqual(('hit', 'other worker'), self.get())
+        self.assertEqual(0, self.calls)
+
+    def test_gives_up_waiting_for_stuck_worker(self):
+        lock_key = self.lock()
+        with mock.patch.object(view_cache, 'LOCK_WAIT', 0):
+            self.assertEqual(('miss', 'response 1'), self.get())
+        # The lock still belongs to the other worker
+        self.assertFalse(view_cache.acquire_lock(lock_key))
+
+    def test_lock_is_exclusive_until_released(self):
+        lock_key = 'leaderboards:test:lock'
+        self.assertTrue(view_cache.acquire_lock(lock_key))
+        self.assertFalse(view_cache.acquire_lock(lock_key))
+        view_cache.release_lock(lock_key)
+        self.assertTrue(view_cache.acquire_lock(lock_key))
+        view_cache.release_lock(lock_key)
+
+    def test_lock_of_crashed_worker_is_taken_over(self):
+        lock_key = self.lock()
+        with mock.patch('leaderboards.cache.time.time', return_value=time.time() + view_cache.LOCK_TIMEOUT + 1):
+            self.assertTrue(view_cache.acquire_lock(lock_key))
+
+    def test_publishing_generation_invalidates_views(self):
+        self.get()
+        generation = LeaderboardGeneration.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            generation.publish()
+        self.assertEqual(('miss', 'response 2'), self.get())
+        self.assertEqual(('hit', 'response 2'), self.get())
+
+    def test_lost_generation_is_read_from_database(self):
+        self.get()
+        generation = LeaderboardGeneration.objects.create()
+        generation.publish()  # Cache keeps the old generation until the commit
+        cache.delete(view_cache.GENERATION_KEY)
+        self.assertEqual(('miss', 'response 2'), self.get())
+        self.assertEqual(generation.id, cache.get(view_cache.GENERATION_KEY))
+
+
+class FileCacheViewTests(CacheViewTests):
+    """
+    The same tests with the file cache, which locks with files instead of cache.add
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache_override = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}})
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+        super().setUp()
@@ -0,0 +1,137 @@
+import glob
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from leaderboards.cache import GENERATION_KEY, view_cache_key
+from leaderboards.models import Leaderboard, LeaderboardGeneration, Match, Player, Ruleset, Tournament
+
+
+def create_tournament_with_match(name, date, ruleset, winner, loser):
+    tournament = Tournament.objects.create(name=name, date=date,
+                                           ruleset=Ruleset.objects.get_or_create(ruleset=ruleset)[0])
+    Match.objects.create(tournament=tournament, ruleset=tournament.ruleset,
+                         winner=Player.objects.get_or_create(name=winner)[0],
+                         loser=Player.objects.get_or_create(name=loser)[0])
+    return tournament
+
+
+class ProfilingTests(TestCase):
+
+    def test_calculate_trueskill_with_profile(self):
+        create_tournament_with_match('Tournament 1', '2018-05-10', 'unseeded', 'player_1', 'player_2')
+        create_tournament_with_match('Tournament 2', '2018-05-11', 'unseeded', 'player_1', 'player_2')
+        with tempfile.TemporaryDirectory() as profile_dir:
+            call_command('calculate_trueskill', profile=True, profile_memory=True, profile_dir=profile_dir,
+                         stdout=StringIO())
+            pstats_files = glob.glob(os.path.join(profile_dir, 'calculate_trueskill-*.pstats'))
+            summary_files = glob.glob(os.path.join(profile_dir, 'calculate_trueskill-*.txt'))
+            self.assertEqual(1, len(pstats_files))
+            self.assertEqual(1, len(summary_files))
+            with open(summary_files[0]) as summary_file:
+                summary = summary_file.read()
+        self.assertIn('Hot functions', summary)
+        self.assertIn('create_leaderboards', summary)
+        self.assertIn('Memory: peak', summary)
+        self.assertEqual(2, Leaderboard.objects.live().filter(leaderboard_type='mixed').count())
+
+    def test_calculate_trueskill_without_profile(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            call_command('calculate_trueskill', profile_dir=profile_dir, stdout=StringIO())
+            self.assertEqual([], os.listdir(profile_dir))
+
+
+class SweepRatingsTests(TestCase):
+
+    def setUp(self):
+        create_tournament_with_match('Tournament 1', '2018-05-10', 'unseeded', 'player_1', 'player_2')
+        create_tournament_with_match('Tournament 2', '2018-05-11', 'seeded', 'player_1', 'player_2')
+        create_tournament_with_match('Tournament 3', '2018-05-12', 'unseeded', 'player_2', 'player_1')
+
+    def test_sweep_in_single_process(self):
+        output = StringIO()
+        call_command('sweep_ratings', tournament_limit=[0], seeded_multiplier=[1, 4], mixed_multiplier=[2],
+                     workers=1, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertIn('Evaluating 2 settings on 3 matches', lines[0])
+        # Header, two ranked settings and the summary
+        self.assertEqual(5, len(lines))
+
+    def test_tournament_limits_are_ranked_separately(self):
+        output = StringIO()
+        call_command('sweep_ratings', tournament_limit=[0, 1], seeded_multiplier=[1, 4], mixed_multiplier=[2],
+                     workers=1, stdout=output)
+        lines = output.getvalue().splitlines()
+        # A table of every limit, each ranked from the first place
+        self.assertEqual('', lines[4])
+        self.assertEqual([('1', '0'), ('2', '0'), ('1', '1'), ('2', '1')],
+                         [tuple(line.split()[:2]) for line in lines[2:4] + lines[6:8]])
+
+    def test_sweep_in_process_pool(self):
+        single_process = StringIO()
+        process_pool = StringIO()
+        call_command('sweep_ratings', tournament_limit=[0], seeded_multiplier=[1, 4], mixed_multiplier=[1, 2],
+                     workers=1, stdout=single_process)
+        call_command('sweep_ratings', tournament_limit=[0], seeded_multiplier=[1, 4], mixed_multiplier=[1, 2],
+                     workers=2, stdout=process_pool)
+        self.assertEqual(single_process.getvalue().splitlines()[1:-1], process_pool.getvalue().splitlines()[1:-1])
+
+
+class RollbackLeaderboardsTests(TestCase):
+
+    def test_rollback_to_previous_generation(self):
+        first, second, third = [LeaderboardGeneration.objects.create() for _ in range(3)]
+        third.publish()
+        call_command('rollback_leaderboards', stdout=StringIO())
+        self.assertEqual(second, LeaderboardGeneration.objects.live())
+        call_command('rollback_leaderboards', stdout=StringIO())
+        self.assertEqual(first, LeaderboardGeneration.objects.live())
+        with self.assertRaises(CommandError):
+            call_command('rollback_leaderboards', stdout=StringIO())
+
+    def test_rollback_warms_caches(self):
+        cache.clear()
+        first, second = [LeaderboardGeneration.objects.create() for _ in range(2)]
+        second.publish()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rollback_leaderboards', stdout=StringIO())
+        self.assertEqual(first.id, cache.get(GENERATION_KEY))
+        self.assertIsNotNone(cache.get(view_cache_key(reverse('get_ratings', args=['mixed']))))
+
+    def test_rollback_to_chosen_generation(self):
+        first, second = [LeaderboardGeneration.objects.create() for _ in range(2)]
+        first.publish()
+        call_command('rollback_leaderboards', second.id, stdout=StringIO())
+        self.assertEqual(second, LeaderboardGeneration.objects.live())
+        with self.assertRaises(CommandError):
+            call_command('rollback_leaderboards', second.id + 1, stdout=StringIO())
+
+
+class WarmCachesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_tournament_with_match('Tournament', '2018-05-10', 'unseeded', 'Player_1', 'Player_2')
+
+    def test_warm_caches(self):
+        call_command('warm_caches', stdout=StringIO())
+        for leaderboard_type in ['mixed', 'unseeded', 'seeded']:
+            self.assertIsNotNone(cache.get(view_cache_key(reverse('get_leaderboard', args=[leaderboard_type]))))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'))
+            self.client.get(reverse('get_leaderboard', args=['seeded']))
+            self.client.get(reverse('get_ratings', args=['unseeded']))
+
+    def test_recalculation_warms_caches(self):
+        tournament = create_tournament_with_match('Tournament 2', '2018-05-11', 'unseeded', 'Player_1', 'Player_2')
+        Player.objects.update(last_played='2018-05-11')
+        with self.captureOnCommitCallbacks(execute=True):
+            tournament.save(create_leaderboards=True)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_ratings', args=['mixed']))
+        self.assertIn('Player_1', response.json()['data'])
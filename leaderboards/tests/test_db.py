@@ -0,0 +1,59 @@
+import os
+import tempfile
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase
+
+from leaderboards.db import execute_wrapper
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SqlitePragmasTests(TestCase):
+
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(settings.SQLITE_PRAGMAS['cache_size'], cursor.fetchone()[0])
+
+    def test_file_database_pragmas(self):
+        """
+        Journal mode can't be changed for the in-memory test database, so it is checked on a database file
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            default = connections['default']
+            wrapper = type(default)({**default.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')},
+                                    alias='pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(settings.SQLITE_PRAGMAS['journal_mode'].lower(), cursor.fetchone()[0])
+                    cursor.execute('PRAGMA synchronous')
+                    synchronous = ['OFF', 'NORMAL', 'FULL', 'EXTRA'][cursor.fetchone()[0]]
+                    self.assertEqual(settings.SQLITE_PRAGMAS['synchronous'].upper(), synchronous)
+            finally:
+                wrapper.close()
+
+
+class ExecuteWrapperTests(SimpleTestCase):
+
+    def test_queries_of_every_database_are_wrapped(self):
+        memory = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        handler = ConnectionHandler({'default': memory, 'replica': memory})
+        aliases = []
+
+        def record_alias(execute, sql, params, many, context):
+            if sql == 'SELECT 1':  # New connections also run SQLITE_PRAGMAS
+                aliases.append(context['connection'].alias)
+            return execute(sql, params, many, context)
+
+        try:
+            with execute_wrapper(record_alias, handler):
+                for alias in ('default', 'replica'):
+                    with handler[alias].cursor() as cursor:
+                        cursor.execute('SELECT 1')
+        finally:
+            handler.close_all()
+        self.assertEqual(['default', 'replica'], aliases)
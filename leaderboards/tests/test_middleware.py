@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from leaderboards import prometheus
+from leaderboards.cache import get_generation
+from leaderboards.models import Leaderboard, Player, RecalculationRun, LeaderboardGeneration
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Leaderboard.objects.create(leaderboard_type='mixed', player=Player.objects.create(name='Player_1'), mu=25,
+                                   sigma=3, exposure=16)
+        get_generation()  # Kept in the cache on a running site, only the view queries are counted
+
+    def test_cache_miss_and_hit(self):
+        response = self.client.get(reverse('index'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('cache;desc=miss', response['Server-Timing'])
+        self.assertEqual('3', response['X-SQL-Queries'])
+        response = self.client.get(reverse('index'))
+        self.assertIn('cache;desc=hit', response['Server-Timing'])
+        self.assertEqual('0', response['X-SQL-Queries'])
+
+    def test_ratings_view(self):
+        response = self.client.get(reverse('get_ratings', args=['mixed']))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('cache;desc=miss', response['Server-Timing'])
+
+    def test_other_urls_are_not_timed(self):
+        response = self.client.get('/admin/login/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class ServerTimingDisabledTests(TestCase):
+    def test_no_header_by_default(self):
+        response = self.client.get(reverse('get_ratings', args=['mixed']))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS=True,
+                                                   METRICS_PATH=os.path.join(self.metrics_dir.name, 'metrics.db'))
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.metrics_dir.cleanup()
+
+    def test_latency_and_cache_metrics(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.get(reverse('get_ratings', args=['mixed']))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('leaderboards_request_duration_seconds_count{view="index"} 2', content)
+        self.assertIn('leaderboards_request_duration_seconds_bucket{view="index",le="+Inf"} 2', content)
+        self.assertIn('leaderboards_request_duration_seconds_count{view="get_ratings"} 1', content)
+        self.assertIn('leaderboards_request_duration_seconds_count{view="get_leaderboard"} 0', content)
+        self.assertIn('leaderboards_cache_requests_total{view="index",result="hit"} 1', content)
+        self.assertIn('leaderboards_cache_requests_total{view="index",result="miss"} 1', content)
+
+    def test_metrics_are_shared_between_stores(self):
+        """
+        Separate stores, like the ones in different worker processes, should add up into the same numbers
+        """
+        prometheus.MetricsStore(settings.METRICS_PATH).increment({('leaderboards_cache_requests_total',
+                                                                   'view="index",result="hit"'): 1})
+        prometheus.observe_request('index', 0.02, 'hit')
+        content = prometheus.render(['index'], [])
+        self.assertIn('leaderboards_cache_requests_total{view="index",result="hit"} 2', content)
+        self.assertIn('leaderboards_request_duration_seconds_bucket{view="index",le="0.01"} 0', content)
+        self.assertIn('leaderboards_request_duration_seconds_bucket{view="index",le="0.025"} 1', content)
+
+    def test_recalculation_gauges(self):
+        generation = LeaderboardGeneration.objects.create()
+        generation.publish()
+        RecalculationRun.objects.create(duration=1.5, loading_time=0.5, rating_time=0.5, sorting_time=0.25,
+                                        export_time=0.25, generation=generation)
+        content = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('leaderboards_recalculation_duration_seconds 1.5', content)
+        self.assertIn('leaderboards_generation_age_seconds', content)
+        self.assertIn(f'leaderboards_generation_id {generation.id}', content)
+
+    def test_metrics_disabled(self):
+        with override_settings(METRICS=False):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,148 @@
+import datetime
+from io import StringIO
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from leaderboards.cache import get_generation
+from leaderboards.management.commands.import_json import Command as ImportJsonCommand
+from leaderboards.models import Player, Leaderboard, Tournament, Ruleset, Match, PlayerAlias, MatchRatingChange, \
+    HeadToHead
+from leaderboards.tests.utils import QueryBudgetMixin, INDEX_QUERY_BUDGET, LEADERBOARD_QUERY_BUDGET, \
+    RATINGS_QUERY_BUDGET, SEARCH_QUERY_BUDGET, RATING_CHANGES_QUERY_BUDGET, HEAD_TO_HEAD_QUERY_BUDGET, \
+    REPLAY_QUERY_BUDGET, UNCHANGED_REPLAY_QUERY_BUDGET, IMPORT_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET, \
+    REPLAY_QUERY_TIME_BUDGET, IMPORT_QUERY_TIME_BUDGET
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
+
+
+def create_replay_fixture():
+    """
+    Creates 4 tournaments, one for every ruleset that counts towards leaderboards, with 8 players and 12 matches each
+    """
+    players = [Player.objects.create(name=f'player_{number}', last_played=datetime.date(2018, 5, 10))
+               for number in range(8)]
+    for day, ruleset_name in enumerate(['unseeded', 'seeded', 'diversity', 'mixed'], start=1):
+        ruleset = Ruleset.objects.get_or_create(ruleset=ruleset_name)[0]
+        tournament = Tournament.objects.create(name=f'{ruleset_name} tournament', date=f'2018-05-{day:02}',
+                                               ruleset=ruleset)
+        for number in range(12):
+            Match.objects.create(tournament=tournament, winner=players[number % 8], loser=players[(number + 3) % 8],
+                                 ruleset=ruleset)
+
+
+def tournament_json():
+    return {
+        'name': 'Imported Tournament',
+        'challonge_id': None,
+        'challonge': None,
+        'date': '2018-05-10',
+        'notability': 'minor',
+        'ruleset': 'unseeded',
+        'description': None,
+        'winner': 'Player_1',
+        'videos': [{'description': 'Finals', 'url': 'https://example.com/finals'}],
+        'matchups': [{'winner': f'Player_{number}', 'loser': f'Player_{number + 4}', 'score': '2-1'}
+                     for number in range(1, 5)],
+    }
+
+
+def create_leaderboards():
+    return TrueskillCalculations(tournament_model=Tournament, leaderboard_model=Leaderboard,
+                                 player_model=Player).create_leaderboards()
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        create_replay_fixture()
+        create_leaderboards()
+        get_generation()  # Stored by publish on commit, which TestCase doesn't run
+
+    def test_index(self):
+        with self.assertQueryBudget(INDEX_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_leaderboard(self):
+        for leaderboard_type in ['mixed', 'seeded', 'unseeded']:
+            with self.assertQueryBudget(LEADERBOARD_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+                response = self.client.get(reverse('get_leaderboard', args=[leaderboard_type]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_get_ratings(self):
+        for rating_type in ['mixed', 'seeded', 'unseeded']:
+            with self.assertQueryBudget(RATINGS_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+                response = self.client.get(reverse('get_ratings', args=[rating_type]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_get_rating_changes(self):
+        TrueskillCalculations(tournament_model=Tournament, leaderboard_model=Leaderboard, player_model=Player,
+                              change_model=MatchRatingChange, force=True).create_leaderboards()
+        player = Player.objects.get(name='player_0')
+        with self.assertQueryBudget(RATING_CHANGES_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+            response = self.client.get(reverse('get_rating_changes', args=['mixed', player.id]))
+        self.assertEqual(12, len(response.json()['data']))
+
+    def test_get_head_to_head(self):
+        HeadToHead.objects.refresh()
+        player, opponent = Player.objects.filter(name__in=['player_0', 'player_3'])
+        with self.assertQueryBudget(HEAD_TO_HEAD_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+            response = self.client.get(reverse('get_head_to_head', args=[player.id, opponent.id]))
+        self.assertEqual(8, sum(response.json()['wins']))
+
+    def test_search_players(self):
+        with self.assertQueryBudget(SEARCH_QUERY_BUDGET, VIEW_QUERY_TIME_BUDGET):
+            response = self.client.get(reverse('search_players'), {'q': 'player'})
+        self.assertEqual(8, len(response.json()['data']))
+
+    def test_cached_views_dont_hit_database(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('get_leaderboard', args=['mixed']))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'))
+            self.client.get(reverse('get_leaderboard', args=['mixed']))
+
+
+class ReplayQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_full_replay(self):
+        create_replay_fixture()
+        with self.assertQueryBudget(REPLAY_QUERY_BUDGET, REPLAY_QUERY_TIME_BUDGET):
+            create_leaderboards()
+        self.assertEqual(Leaderboard.objects.live().filter(leaderboard_type='mixed').count(), 8)
+
+    def test_replay_loading_doesnt_grow_with_matches(self):
+        """
+        Loading the match history should take the same amount of queries no matter how many matches there are
+        """
+        create_replay_fixture()
+        small_replay = TrueskillCalculations(tournament_model=Tournament, leaderboard_model=Leaderboard,
+                                             player_model=Player)
+        small_replay.create_leaderboards()
+        tournament = Tournament.objects.get(name='unseeded tournament')
+        for _ in range(50):
+            Match.objects.create(tournament=tournament, winner=Player.objects.get(name='player_0'),
+                                 loser=Player.objects.get(name='player_1'), ruleset=tournament.ruleset)
+        big_replay = TrueskillCalculations(tournament_model=Tournament, leaderboard_model=Leaderboard,
+                                           player_model=Player)
+        with self.assertQueryBudget(REPLAY_QUERY_BUDGET):
+            big_replay.create_leaderboards()
+        self.assertEqual(small_replay.metrics.queries['loading'], big_replay.metrics.queries['loading'])
+
+    def test_unchanged_replay_doesnt_write(self):
+        create_replay_fixture()
+        create_leaderboards()
+        with self.assertQueryBudget(UNCHANGED_REPLAY_QUERY_BUDGET) as context:
+            create_leaderboards()
+        self.assertFalse([query for query in context.captured_queries
+                          if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+
+
+class ImportQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_import_single_tournament(self):
+        options = {'verification': False, 'add_user': False}
+        command = ImportJsonCommand(stdout=StringIO())
+        with self.assertQueryBudget(IMPORT_QUERY_BUDGET, IMPORT_QUERY_TIME_BUDGET):
+            command.add_tournament(tournament_json(), options)
+        self.assertEqual(Match.objects.count(), 4)
+        self.assertEqual(PlayerAlias.objects.count(), 8)
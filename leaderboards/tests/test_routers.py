@@ -0,0 +1,31 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from leaderboards.models import Leaderboard
+from leaderboards.routers import ReplicaRouter, use_replica
+
+REPLICA_DATABASE = {'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    @mock.patch.dict(settings.DATABASES, REPLICA_DATABASE)
+    def test_reads_of_decorated_views_go_to_replica(self):
+        view = use_replica(lambda: (self.router.db_for_read(Leaderboard), self.router.db_for_write(Leaderboard)))
+        self.assertEqual(('replica', 'default'), view())
+        self.assertEqual('default', self.router.db_for_read(Leaderboard))
+
+    def test_without_replica_everything_goes_to_default(self):
+        databases = {'default': settings.DATABASES['default']}
+        with mock.patch.dict(settings.DATABASES, databases, clear=True):
+            view = use_replica(lambda: self.router.db_for_read(Leaderboard))
+            self.assertEqual('default', view())
+
+    def test_migrations_only_on_default(self):
+        self.assertTrue(self.router.allow_migrate('default', 'leaderboards'))
+        self.assertFalse(self.router.allow_migrate('replica', 'leaderboards'))
@@ -1,8 +1,26 @@
+import datetime
+import itertools
+import json
+import math
+import time
+from io import StringIO
+from unittest import mock
+
+import numpy as np
 import trueskill
+from django.core.management import call_command
+from django.db import models
 from django.test import TestCase
 
-from leaderboards.models import Player, Leaderboard, Tournament, Ruleset, Match, Team
-from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
+from leaderboards.models import Player, Leaderboard, Tournament, Ruleset, Match, Team, RecalculationRun, \
+    LeaderboardGeneration, RatingCheckpoint, AllowedScore, MatchRatingChange, HeadToHead, head_to_head_key
+from leaderboards.trueskill_scripts.batch import RatingArrays, rate_1vs1_batch, replay_waves_batched, \
+    win_probabilities, match_qualities
+from leaderboards.trueskill_scripts.evaluation import PredictionScorer, win_probability
+from leaderboards.trueskill_scripts.seeding import assignment, pair_first_round, seed_order
+from leaderboards.trueskill_scripts.simulation import CHUNK_SIZE, SINGLE_ELIMINATION, SWISS, bracket_indices, simulate
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations, replay_steps
+from leaderboards.trueskill_scripts.waves import WaveStatistics, replay_waves, schedule_waves, wave_statistics
 
 
 def create_tournament(name, date, ruleset):
@@ -38,7 +56,7 @@ def create_leaderboard_without_limit():
 
 
 def get_rating(player, leaderboard_type):
-    return Leaderboard.objects.get(player__name=player, leaderboard_type=leaderboard_type)
+    return Leaderboard.objects.live().get(player__name=player, leaderboard_type=leaderboard_type)
 
 
 class TrueskillCalculationsTests(TestCase):
@@ -1004,3 +1022,697 @@ class TrueskillCalculationsTests(TestCase):
         self.assertEqual(db_player_1.tournaments_played, 2)
         self.assertEqual(db_player_2.tournaments_played, 3)
         self.assertEqual(db_player_3.tournaments_played, 1)
+
+
+class RecalculationMetricsTests(TestCase):
+
+    def test_recalculation_run_is_saved(self):
+        """
+        Every phase of the recalculation should be timed and saved together with counters
+        """
+        unseeded = create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded')
+        seeded = create_tournament('Seeded Tournament', '2018-05-11', 'seeded')
+        create_match('player_1', 'player_2', unseeded)
+        create_match('player_1', 'player_3', unseeded)
+        create_match('player_2', 'player_1', seeded)
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player,
+                                             run_model=RecalculationRun)
+        calculations.create_leaderboards()
+        run = RecalculationRun.objects.get()
+        self.assertEqual(2, run.tournaments_loaded)
+        self.assertEqual(3, run.matches_processed)
+        # Unseeded matches update mixed and unseeded leaderboards, seeded match is counted 4 times in mixed
+        self.assertEqual(2 * 2 + 4 + 1, run.rating_updates)
+        self.assertEqual(3 + 3 + 2, run.rows_written)
+        self.assertEqual(calculations.metrics.total_queries, run.queries)
+        self.assertGreater(run.queries, 0)
+        self.assertAlmostEqual(run.loading_time + run.rating_time + run.sorting_time + run.export_time, run.duration)
+
+    def test_recalculation_without_run_model(self):
+        create_match('player_1', 'player_2', create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded'))
+        create_leaderboard_without_limit()
+        self.assertFalse(RecalculationRun.objects.exists())
+
+
+class ParallelReplayTests(TestCase):
+
+    def setUp(self):
+        unseeded = create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded')
+        seeded = create_tournament('Seeded Tournament', '2018-05-11', 'seeded')
+        mixed = create_tournament('Mixed Tournament', '2018-05-12', 'mixed')
+        multiple = create_tournament('Multiple Tournament', '2018-05-13', 'multiple')
+        create_match('player_1', 'player_2', unseeded)
+        create_match('player_3', 'player_1', unseeded)
+        create_match('player_2', 'player_3', seeded)
+        create_match('player_1', 'player_2', mixed)
+        create_match('player_4', 'player_1', multiple, 'seeded')
+        create_match('player_4', 'player_2', multiple, 'diversity')
+        create_match('player_3', 'player_4', multiple, 'multiple')
+        create_match('player_1', 'player_3', create_tournament('Team Tournament', '2018-05-14', 'team'))
+
+    def replay(self, parallel):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player, parallel=parallel,
+                                             force=True)
+        calculations.create_leaderboards()
+        return calculations
+
+    def test_same_results_as_sequential_replay(self):
+        sequential = self.replay(parallel=False)
+        sequential_rows = list(Leaderboard.objects.live().values_list('leaderboard_type', 'player__name', 'mu',
+                                                                      'sigma', 'tournaments_played', 'matches_played'))
+        parallel = self.replay(parallel=True)
+        self.assertIsNone(parallel.generation)  # Nothing changed compared to the sequential replay
+        for racers in ('racers', 'unseeded_racers', 'seeded_racers'):
+            self.assertEqual(getattr(sequential, racers).keys(), getattr(parallel, racers).keys())
+            for player, racer in getattr(sequential, racers).items():
+                self.assertEqual(racer['rating'], getattr(parallel, racers)[player]['rating'])
+                self.assertEqual(racer['tournaments_played'], getattr(parallel, racers)[player]['tournaments_played'])
+                self.assertEqual(racer['matches_played'], getattr(parallel, racers)[player]['matches_played'])
+        for counter in ('matches_processed', 'rating_updates'):
+            self.assertEqual(sequential.metrics.counters[counter], parallel.metrics.counters[counter])
+        self.assertEqual(sequential_rows, list(Leaderboard.objects.live().values_list(
+            'leaderboard_type', 'player__name', 'mu', 'sigma', 'tournaments_played', 'matches_played')))
+
+    def test_partition(self):
+        calculations = TrueskillCalculations(tournament_model=Tournament)
+        steps = calculations.partition(calculations.load_tournaments())
+        self.assertEqual([1, 1, 4, 2, 4, 1], [step.repeats for step in steps['mixed']])
+        self.assertEqual(4, len(steps['unseeded']))
+        self.assertEqual(['player_2', 'player_4'], [step.match.winner for step in steps['seeded']])
+
+
+class WaveSchedulerTests(TestCase):
+
+    def setUp(self):
+        unseeded = create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded')
+        seeded = create_tournament('Seeded Tournament', '2018-05-11', 'seeded')
+        create_match('player_1', 'player_2', unseeded)
+        create_match('player_3', 'player_4', unseeded)
+        create_match('player_1', 'player_3', unseeded)
+        create_match('player_5', 'player_6', unseeded)
+        create_match('player_2', 'player_4', seeded)
+        create_match('player_6', 'player_1', seeded)
+        calculations = TrueskillCalculations(tournament_model=Tournament)
+        self.steps = calculations.partition(calculations.load_tournaments())
+
+    def test_no_player_twice_in_wave(self):
+        waves = schedule_waves(self.steps['mixed'])
+        self.assertEqual([[('player_1', 'player_2'), ('player_3', 'player_4'), ('player_5', 'player_6')],
+                          [('player_1', 'player_3'), ('player_2', 'player_4')],
+                          [('player_6', 'player_1')]],
+                         [[(step.match.winner, step.match.loser) for step in wave] for wave in waves])
+        self.assertEqual(WaveStatistics(steps=6, waves=3, max_width=3, mean_width=2.0), wave_statistics(waves))
+
+    def test_same_results_as_sequential_replay(self):
+        for steps in self.steps.values():
+            sequential_racers, sequential_updates = replay_steps(steps)
+            racers, rating_updates = replay_waves(schedule_waves(steps))
+            self.assertEqual(sequential_updates, rating_updates)
+            self.assertEqual(sequential_racers, racers)
+
+    def test_batched_replay(self):
+        for steps in self.steps.values():
+            sequential_racers, sequential_updates = replay_steps(steps)
+            racers, rating_updates = replay_waves_batched(schedule_waves(steps))
+            self.assertEqual(sequential_updates, rating_updates)
+            self.assertEqual(sequential_racers.keys(), racers.keys())
+            for player, racer in sequential_racers.items():
+                self.assertAlmostEqual(racer['rating'].mu, racers[player]['rating'].mu, places=9)
+                self.assertAlmostEqual(racer['rating'].sigma, racers[player]['rating'].sigma, places=9)
+                self.assertEqual(racer['tournaments_played'], racers[player]['tournaments_played'])
+                self.assertEqual(racer['matches_played'], racers[player]['matches_played'])
+
+    def test_empty_stream(self):
+        self.assertEqual([], schedule_waves([]))
+        self.assertEqual(WaveStatistics(steps=0, waves=0, max_width=0, mean_width=0.0), wave_statistics([]))
+
+    def test_command_prints_statistics(self):
+        out = StringIO()
+        call_command('calculate_trueskill', '--waves', stdout=out)
+        self.assertIn('mixed: 6 steps in 3 waves, max width 3, mean width 2.00', out.getvalue())
+
+
+class BatchKernelTests(TestCase):
+
+    def test_matches_rate_1vs1(self):
+        random = np.random.default_rng(0)
+        mu = random.uniform(0, 50, 600)
+        sigma = random.uniform(0.5, 25 / 3, 600)
+        winners = np.arange(300)
+        losers = np.arange(300, 600)
+        batch_mu, batch_sigma = mu.copy(), sigma.copy()
+        rate_1vs1_batch(batch_mu, batch_sigma, winners, losers)
+        for winner, loser in zip(winners, losers):
+            expected = trueskill.rate_1vs1(trueskill.Rating(mu[winner], sigma[winner]),
+                                           trueskill.Rating(mu[loser], sigma[loser]))
+            for rating, index in zip(expected, (winner, loser)):
+                self.assertAlmostEqual(rating.mu, batch_mu[index], places=9)
+                self.assertAlmostEqual(rating.sigma, batch_sigma[index], places=9)
+
+    def test_win_probabilities_and_qualities(self):
+        mu = np.array([35., 20., 25.])
+        sigma = np.array([2., 4., 3.])
+        probabilities = win_probabilities(mu[:, None], sigma[:, None], mu[None, :], sigma[None, :])
+        qualities = match_qualities(mu[:, None], sigma[:, None], mu[None, :], sigma[None, :])
+        for player in range(3):
+            for opponent in range(3):
+                rating = trueskill.Rating(mu[player], sigma[player])
+                opponent_rating = trueskill.Rating(mu[opponent], sigma[opponent])
+                self.assertAlmostEqual(win_probability(rating, opponent_rating), probabilities[player, opponent])
+                self.assertAlmostEqual(trueskill.quality_1vs1(rating, opponent_rating), qualities[player, opponent])
+
+    def test_rating_arrays(self):
+        ratings = RatingArrays()
+        self.assertEqual([0, 1, 0], list(ratings.indices(['player_1', 'player_2', 'player_1'])))
+        self.assertEqual([2], list(ratings.indices(['player_3'])))
+        self.assertEqual(3, len(ratings))
+        self.assertEqual(trueskill.Rating(), ratings.rating('player_3'))
+
+
+class RatingCheckpointTests(TestCase):
+
+    def setUp(self):
+        self.tournaments = [create_tournament(f'Tournament {day}', f'2018-05-{day:02}', ruleset)
+                            for day, ruleset in enumerate(['unseeded', 'seeded', 'mixed', 'unseeded', 'seeded'],
+                                                          start=1)]
+        for number, tournament in enumerate(self.tournaments):
+            create_match(f'player_{number}', f'player_{number + 1}', tournament)
+            create_match(f'player_{number + 2}', f'player_{number}', tournament)
+
+    def calculate(self, checkpoints=True, **kwargs):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player,
+                                             checkpoint_model=RatingCheckpoint if checkpoints else None,
+                                             checkpoint_interval=2, **kwargs)
+        calculations.create_leaderboards()
+        return calculations
+
+    def assertCheckpoints(self, tournaments):
+        self.assertEqual(tournaments, list(RatingCheckpoint.objects.values_list('tournaments', flat=True)))
+
+    def assertSameAsFullReplay(self, calculations):
+        full = self.calculate(checkpoints=False, force=True)
+        self.assertIsNone(full.generation)  # Live leaderboards are already the same
+        for racers in ('racers', 'unseeded_racers', 'seeded_racers'):
+            self.assertEqual(getattr(full, racers), getattr(calculations, racers))
+
+    def test_checkpoints_on_interval_and_after_last_tournament(self):
+        calculations = self.calculate()
+        self.assertCheckpoints([5, 4, 2])
+        self.assertEqual(3, calculations.metrics.counters['checkpoints_created'])
+        self.assertEqual(self.tournaments[-1], RatingCheckpoint.objects.first().tournament)
+
+    def test_new_tournament_replays_from_last_checkpoint(self):
+        self.calculate()
+        create_match('player_1', 'player_6', create_tournament('Tournament 6', '2018-05-06', 'mixed'))
+        calculations = self.calculate()
+        self.assertEqual(1, calculations.metrics.counters['tournaments_loaded'])
+        self.assertEqual(5, calculations.metrics.counters['tournaments_restored'])
+        self.assertCheckpoints([6, 4, 2])  # Checkpoint after the previous last tournament is replaced
+        self.assertSameAsFullReplay(calculations)
+
+    def test_unchanged_history_replays_nothing(self):
+        self.calculate()
+        calculations = self.calculate(force=True)
+        self.assertEqual(0, calculations.metrics.counters['tournaments_loaded'])
+        self.assertIsNone(calculations.generation)
+        self.assertCheckpoints([5, 4, 2])
+
+    def test_back_dated_change_replays_from_earlier_checkpoint(self):
+        self.calculate()
+        create_match('player_6', 'player_0', self.tournaments[2])
+        self.assertCheckpoints([2])
+        calculations = self.calculate()
+        self.assertEqual(3, calculations.metrics.counters['tournaments_loaded'])
+        self.assertEqual(2, calculations.metrics.counters['tournaments_restored'])
+        self.assertCheckpoints([5, 4, 2])
+        self.assertSameAsFullReplay(calculations)
+
+    def test_moving_tournament_invalidates_from_old_date(self):
+        self.calculate()
+        self.tournaments[1].date = '2018-05-10'
+        self.tournaments[1].save()
+        self.assertCheckpoints([])
+        self.assertSameAsFullReplay(self.calculate())
+
+    def test_edits_of_other_fields_keep_checkpoints(self):
+        self.calculate()
+        tournament = Tournament.objects.get(pk=self.tournaments[0].pk)
+        tournament.description = 'Fixed description'
+        tournament.date = '2018-05-01'  # The same date, as the admin submits it
+        tournament.save()
+        match = Match.objects.filter(tournament=tournament).first()
+        match.save()
+        self.assertCheckpoints([5, 4, 2])
+        match.winner, match.loser = match.loser, match.winner
+        match.save()
+        self.assertCheckpoints([])
+
+    def test_deleting_match_invalidates_checkpoints(self):
+        self.calculate()
+        Match.objects.filter(tournament=self.tournaments[3]).first().delete()
+        self.assertCheckpoints([2])
+        self.assertSameAsFullReplay(self.calculate())
+
+    def test_ruleset_change_invalidates_all_checkpoints(self):
+        self.calculate()
+        ruleset = self.tournaments[4].ruleset
+        ruleset.ruleset = 'unseeded'
+        ruleset.save()
+        self.assertCheckpoints([])
+
+    def test_checkpoints_of_other_parameters_are_ignored(self):
+        self.calculate()
+        calculations = self.calculate(seeded_multiplier=3)
+        self.assertEqual(5, calculations.metrics.counters['tournaments_loaded'])
+
+    def test_parallel_replay_continues_from_checkpoint(self):
+        self.calculate()
+        create_match('player_1', 'player_6', create_tournament('Tournament 6', '2018-05-06', 'mixed'))
+        calculations = self.calculate(parallel=True)
+        self.assertEqual(1, calculations.metrics.counters['tournaments_loaded'])
+        self.assertCheckpoints([6, 4, 2])
+        self.assertSameAsFullReplay(calculations)
+
+
+class InputsFingerprintTests(TestCase):
+
+    def setUp(self):
+        self.tournament = create_tournament('Tournament', '2018-05-10', 'unseeded')
+        self.match = create_match('player_1', 'player_2', self.tournament)
+        create_match('player_3', 'player_1', self.tournament)
+        self.calculate()
+
+    def calculate(self, **kwargs):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player, **kwargs)
+        calculations.create_leaderboards()
+        return calculations
+
+    def test_fingerprint_is_stored_with_generation(self):
+        self.assertEqual(self.calculate(force=True).fingerprint, LeaderboardGeneration.objects.live().fingerprint)
+
+    def test_irrelevant_edit_skips_recalculation(self):
+        self.tournament.description = 'Edited description'
+        self.tournament.notability = 'major'
+        self.tournament.save()
+        calculations = self.calculate()
+        self.assertEqual(1, calculations.metrics.counters['skipped'])
+        self.assertEqual(0, calculations.metrics.counters['tournaments_loaded'])
+        self.assertIsNone(calculations.generation)
+
+    def test_rating_relevant_edits_recalculate(self):
+        self.match.ruleset = Ruleset.objects.create(ruleset='seeded')
+        self.match.save()
+        self.assertEqual(0, self.calculate().metrics.counters['skipped'])
+        self.match.score = AllowedScore.objects.create(score='draw')
+        self.match.save()
+        self.assertEqual(0, self.calculate().metrics.counters['skipped'])
+        self.assertEqual(0, self.calculate(seeded_multiplier=3).metrics.counters['skipped'])
+
+    def test_force(self):
+        self.assertEqual(0, self.calculate(force=True).metrics.counters['skipped'])
+
+    def test_unchanged_leaderboards_update_fingerprint(self):
+        create_match('player_1', 'player_2', create_tournament('Team Tournament', '2018-05-11', 'team'))
+        calculations = self.calculate()
+        self.assertIsNone(calculations.generation)
+        self.assertEqual(calculations.fingerprint, LeaderboardGeneration.objects.live().fingerprint)
+        self.assertEqual(1, self.calculate().metrics.counters['skipped'])
+
+    def test_command_force(self):
+        out = StringIO()
+        call_command('calculate_trueskill', stdout=out)
+        call_command('calculate_trueskill', stdout=out)
+        self.assertIn('skipped=1', out.getvalue())
+        out = StringIO()
+        call_command('calculate_trueskill', '--force', stdout=out)
+        self.assertNotIn('skipped', out.getvalue())
+
+
+class MatchRatingChangeTests(TestCase):
+
+    def setUp(self):
+        self.unseeded_match = create_match('player_1', 'player_2',
+                                           create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded'))
+        self.seeded_match = create_match('player_2', 'player_3',
+                                         create_tournament('Seeded Tournament', '2018-05-11', 'seeded'))
+
+    def calculate(self, **kwargs):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player,
+                                             change_model=MatchRatingChange, force=True, **kwargs)
+        calculations.create_leaderboards()
+        return calculations
+
+    def changes(self):
+        return list(MatchRatingChange.objects.order_by('match_id', 'leaderboard_type', 'player_id').values_list(
+            'match_id', 'leaderboard_type', 'player__name', 'mu_before', 'sigma_before', 'mu_after', 'sigma_after'))
+
+    def test_changes_of_every_leaderboard(self):
+        calculations = self.calculate()
+        self.assertEqual(8, calculations.metrics.counters['rating_changes_written'])
+        self.assertEqual([(self.unseeded_match.id, 'mixed', 'player_1'), (self.unseeded_match.id, 'mixed', 'player_2'),
+                          (self.unseeded_match.id, 'unseeded', 'player_1'),
+                          (self.unseeded_match.id, 'unseeded', 'player_2'),
+                          (self.seeded_match.id, 'mixed', 'player_2'), (self.seeded_match.id, 'mixed', 'player_3'),
+                          (self.seeded_match.id, 'seeded', 'player_2'), (self.seeded_match.id, 'seeded', 'player_3')],
+                         [change[:3] for change in self.changes()])
+
+    def test_change_spans_all_repeats(self):
+        calculations = self.calculate()
+        winner = trueskill.rate_1vs1(trueskill.Rating(), trueskill.Rating())[1]  # player_2 lost the first match
+        loser = trueskill.Rating()
+        for _ in range(4):  # seeded_multiplier
+            winner, loser = trueskill.rate_1vs1(winner, loser)
+        change = MatchRatingChange.objects.get(match=self.seeded_match, leaderboard_type='mixed',
+                                               player__name='player_2')
+        self.assertAlmostEqual(calculations.racers['player_2']['rating'].mu, change.mu_after)
+        self.assertAlmostEqual(winner.mu, change.mu_after)
+        self.assertAlmostEqual(winner.sigma, change.sigma_after)
+        self.assertGreater(change.exposure_change, 0)
+
+    def test_draws_are_rated_as_results(self):
+        """
+        Draw scores don't change how a match is rated, it counts as a win of the recorded winner
+        """
+        self.calculate()
+        rated = self.changes()
+        self.seeded_match.score = AllowedScore.objects.create(score='draw')
+        self.seeded_match.save()
+        self.calculate()
+        self.assertEqual(rated, self.changes())
+
+    def test_replay_replaces_changes(self):
+        self.calculate()
+        self.calculate()
+        self.assertEqual(8, MatchRatingChange.objects.count())
+
+    def test_parallel_replay_records_same_changes(self):
+        self.calculate()
+        sequential = self.changes()
+        self.calculate(parallel=True)
+        self.assertEqual(sequential, self.changes())
+
+    def test_checkpoint_keeps_changes_before_it(self):
+        self.calculate(checkpoint_model=RatingCheckpoint, checkpoint_interval=1)
+        full = self.changes()
+        create_match('player_3', 'player_1', create_tournament('Mixed Tournament', '2018-05-12', 'mixed'))
+        calculations = self.calculate(checkpoint_model=RatingCheckpoint, checkpoint_interval=1)
+        self.assertEqual(1, calculations.metrics.counters['tournaments_loaded'])
+        self.assertEqual(4, calculations.metrics.counters['rating_changes_written'])
+        self.assertEqual(full, self.changes()[:8])
+        self.assertEqual(12, MatchRatingChange.objects.count())
+
+    def test_failed_export_keeps_previous_results(self):
+        self.calculate()
+        generation = LeaderboardGeneration.objects.live()
+        changes = self.changes()
+        create_match('player_3', 'player_1', create_tournament('Mixed Tournament', '2018-05-12', 'mixed'))
+        with mock.patch.object(TrueskillCalculations, 'save_checkpoints', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.calculate()
+        self.assertEqual(generation, LeaderboardGeneration.objects.live())
+        self.assertEqual(1, LeaderboardGeneration.objects.count())
+        self.assertEqual(changes, self.changes())
+
+
+class HeadToHeadTests(TestCase):
+
+    def setUp(self):
+        unseeded = create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded')
+        create_match('player_1', 'player_2', unseeded)
+        create_match('player_2', 'player_1', unseeded)
+        create_match('player_2', 'player_1', create_tournament('Seeded Tournament', '2018-05-11', 'seeded'))
+        create_match('player_3', 'player_1', unseeded)
+
+    def calculate(self, **kwargs):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player,
+                                             head_to_head_model=HeadToHead, force=True, **kwargs)
+        calculations.create_leaderboards()
+        return calculations
+
+    def record(self, player, opponent):
+        return HeadToHead.objects.get(pk=head_to_head_key(Player.objects.get(name=player).id,
+                                                          Player.objects.get(name=opponent).id))
+
+    def test_records_of_all_pairs(self):
+        calculations = self.calculate()
+        self.assertEqual(2, calculations.metrics.counters['head_to_head_written'])
+        record = self.record('player_2', 'player_1')
+        self.assertEqual(Player.objects.get(name='player_1'), record.player_low)
+        self.assertEqual((1, 2, 0), (record.low_wins, record.high_wins, record.draws))
+        self.assertEqual({'seeded': [0, 1, 0], 'unseeded': [1, 1, 0]}, json.loads(record.rulesets))
+        self.assertEqual(datetime.date(2018, 5, 11), record.last_played)
+        self.assertEqual((0, 1), (self.record('player_1', 'player_3').low_wins,
+                                  self.record('player_1', 'player_3').high_wins))
+
+    def test_draws_and_match_rulesets(self):
+        tournament = create_tournament('Multiple Tournament', '2018-05-12', 'multiple')
+        match = create_match('player_1', 'player_2', tournament, ruleset='seeded')
+        match.score = AllowedScore.objects.create(score='draw')
+        match.save()
+        create_match('player_1', 'player_2', tournament, ruleset='unseeded')
+        self.calculate()
+        record = self.record('player_1', 'player_2')
+        self.assertEqual((2, 2, 1), (record.low_wins, record.high_wins, record.draws))
+        self.assertEqual({'seeded': [0, 1, 1], 'unseeded': [2, 1, 0]}, json.loads(record.rulesets))
+
+    def test_added_tournament_updates_only_its_pairs(self):
+        self.calculate(checkpoint_model=RatingCheckpoint)
+        create_match('player_1', 'player_2', create_tournament('New Tournament', '2018-05-12', 'unseeded'))
+        with self.assertNumQueries(4):  # Pairs, their matches, deleting and inserting their records
+            self.assertEqual(1, HeadToHead.objects.refresh(after=datetime.date(2018, 5, 12)))
+        record = self.record('player_1', 'player_2')
+        self.assertEqual((2, 2), (record.low_wins, record.high_wins))
+        self.assertEqual(datetime.date(2018, 5, 12), record.last_played)
+        self.assertEqual(2, HeadToHead.objects.count())
+        # Recalculation continues from the checkpoint and refreshes only pairs of the replayed tournaments
+        create_match('player_3', 'player_4', create_tournament('Newer Tournament', '2018-05-13', 'unseeded'))
+        calculations = self.calculate(checkpoint_model=RatingCheckpoint)
+        self.assertEqual(2, calculations.metrics.counters['head_to_head_written'])
+        self.assertEqual(3, HeadToHead.objects.count())
+        self.assertEqual(datetime.date(2018, 5, 10), self.record('player_1', 'player_3').last_played)
+
+    def test_failed_export_keeps_records(self):
+        self.calculate(checkpoint_model=RatingCheckpoint)
+        records = list(HeadToHead.objects.order_by('pair').values())
+        create_match('player_1', 'player_2', create_tournament('New Tournament', '2018-05-12', 'unseeded'))
+        with mock.patch.object(TrueskillCalculations, 'save_checkpoints', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.calculate(checkpoint_model=RatingCheckpoint)
+        self.assertEqual(records, list(HeadToHead.objects.order_by('pair').values()))
+
+    def test_incremental_refresh_is_not_slower_than_full(self):
+        Player.objects.bulk_create([Player(name=f'player_{number}') for number in range(5, 205)])
+        players = list(Player.objects.filter(name__startswith='player_').order_by('id'))
+        ruleset = Ruleset.objects.get(ruleset='unseeded')
+        Tournament.objects.bulk_create([
+            Tournament(name=f'Tournament {number}', date=datetime.date(2019, 1, 1) + datetime.timedelta(days=number),
+                       ruleset=ruleset) for number in range(200)])
+        # SQLite doesn't return the primary keys of bulk created rows
+        tournaments = list(Tournament.objects.filter(date__year=2019).order_by('date'))
+        Match.objects.bulk_create([
+            Match(tournament=tournament, winner=players[(number * 7 + day) % 200],
+                  loser=players[(number * 13 + day * 3 + 1) % 200], ruleset=ruleset)
+            for day, tournament in enumerate(tournaments) for number in range(25)])
+        start = time.perf_counter()
+        HeadToHead.objects.refresh()
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        HeadToHead.objects.refresh(after=tournaments[-5].date)
+        incremental = time.perf_counter() - start
+        self.assertLessEqual(incremental, full)
+        refreshed = list(HeadToHead.objects.order_by('pk').values())
+        HeadToHead.objects.refresh()
+        self.assertEqual(list(HeadToHead.objects.order_by('pk').values()), refreshed)
+
+    def test_deleted_match_is_removed_from_record(self):
+        self.calculate(checkpoint_model=RatingCheckpoint)
+        Match.objects.get(winner__name='player_3').delete()
+        self.calculate(checkpoint_model=RatingCheckpoint)
+        self.assertFalse(HeadToHead.objects.filter(player_high__name='player_3').exists())
+        self.assertEqual(1, HeadToHead.objects.count())
+
+
+class SeedingTests(TestCase):
+
+    def test_assignment_is_optimal(self):
+        random = np.random.default_rng(0)
+        for size in range(1, 7):
+            cost = random.uniform(-5, 5, (size, size))
+            columns = assignment(cost)
+            self.assertEqual(list(range(size)), sorted(columns))
+            best = min(sum(cost[row, column] for row, column in enumerate(permutation))
+                       for permutation in itertools.permutations(range(size)))
+            self.assertAlmostEqual(best, cost[np.arange(size), columns].sum())
+
+    def test_seed_order(self):
+        mu = np.array([25., 30., 30., 40.])
+        sigma = np.array([25 / 3, 2., 2., 8.])
+        self.assertEqual([1, 2, 3, 0], list(seed_order(mu, sigma)))
+
+    def test_pair_first_round(self):
+        # Close match of the second and third seed outweighs the first seed playing the weakest one
+        mu = np.array([40., 30., 29., 20.])
+        sigma = np.ones(4)
+        pairs, bye = pair_first_round(mu, sigma)
+        self.assertIsNone(bye)
+        self.assertEqual([(0, 3), (1, 2)], [(seed, opponent) for seed, opponent, _ in pairs])
+        pairs, bye = pair_first_round(mu[:3], sigma[:3])
+        self.assertEqual(0, bye)
+        self.assertEqual([(1, 2)], [(seed, opponent) for seed, opponent, _ in pairs])
+
+
+class SimulationTests(TestCase):
+
+    def test_single_elimination_matches_exact_probabilities(self):
+        mu = np.array([30., 25., 25., 20.])
+        sigma = np.ones(4)
+        probabilities = win_probabilities(mu[:, None], sigma[:, None], mu[None, :], sigma[None, :])
+        results = simulate(SINGLE_ELIMINATION, mu, sigma, 50000, seed=0)
+        self.assertEqual((4, 3), results.shape)
+        np.testing.assert_array_equal(np.ones(4), results[:, 0])
+        self.assertAlmostEqual(probabilities[0, 1], results[0, 1], delta=0.01)
+        self.assertAlmostEqual(probabilities[2, 3], results[2, 1], delta=0.01)
+        first_wins = probabilities[0, 1] * (probabilities[2, 3] * probabilities[0, 2]
+                                            + probabilities[3, 2] * probabilities[0, 3])
+        self.assertAlmostEqual(first_wins, results[0, 2], delta=0.01)
+        self.assertAlmostEqual(1, results[:, 2].sum())
+
+    def test_single_elimination_byes(self):
+        names, bracket = bracket_indices(['First', None, 'Second', 'Third'])
+        self.assertEqual(['First', 'Second', 'Third'], names)
+        self.assertEqual([0, -1, 1, 2], list(bracket))
+        results = simulate(SINGLE_ELIMINATION, np.full(3, 25.), np.ones(3), 20000, bracket=bracket, seed=0)
+        self.assertEqual(1, results[0, 1])
+        self.assertAlmostEqual(0.5, results[0, 2], delta=0.02)
+        self.assertAlmostEqual(1, results[1:, 1].sum())
+
+    def test_swiss(self):
+        mu = np.array([40., 30., 20., 10., 25.])
+        results = simulate(SWISS, mu, np.ones(5), 20000, rounds=3, seed=0)
+        self.assertEqual((5, 5), results.shape)
+        np.testing.assert_allclose(np.ones(5), results[:, :-1].sum(axis=1))
+        self.assertAlmostEqual(1, results[:, -1].sum())
+        # Every round two matches are played and one player has a bye
+        self.assertAlmostEqual(9, (results[:, :-1] * np.arange(4)).sum())
+        self.assertEqual(0, np.argmax(results[:, -1]))
+
+    def test_workers_and_chunks_give_same_results(self):
+        mu = np.array([30., 25., 25., 20., 28.])
+        sigma = np.ones(5)
+        simulations = CHUNK_SIZE + 10
+        np.testing.assert_array_equal(simulate(SWISS, mu, sigma, simulations, rounds=2, seed=1),
+                                      simulate(SWISS, mu, sigma, simulations, rounds=2, seed=1, workers=2))
+
+
+class LeaderboardExportTests(TestCase):
+
+    def create_leaderboards(self, **kwargs):
+        calculations = TrueskillCalculations(tournament_limit=0, tournament_model=Tournament,
+                                             leaderboard_model=Leaderboard, player_model=Player, **kwargs)
+        calculations.create_leaderboards()
+        return calculations
+
+    def test_changes_are_published_as_new_generation(self):
+        create_match('player_1', 'player_2', create_tournament('Tournament 1', '2018-05-10', 'unseeded'))
+        create_match('player_3', 'player_4', Tournament.objects.create(name='Tournament 2', date='2018-05-11',
+                                                                       ruleset=Ruleset.objects.get()))
+        first = self.create_leaderboards()
+        self.assertEqual(8, first.metrics.counters['rows_created'])
+        self.assertEqual(first.generation, LeaderboardGeneration.objects.live())
+        create_match('player_1', 'player_2', Tournament.objects.get(name='Tournament 1'))
+        second = self.create_leaderboards()
+        self.assertEqual(0, second.metrics.counters['rows_created'])
+        self.assertEqual(4, second.metrics.counters['rows_updated'])
+        self.assertEqual(0, second.metrics.counters['rows_deleted'])
+        self.assertEqual(8, second.metrics.counters['rows_written'])
+        self.assertEqual(second.generation, LeaderboardGeneration.objects.live())
+        self.assertEqual(2, get_rating('player_1', 'mixed').matches_played)
+        # Previous generation is kept untouched for rollback
+        self.assertEqual(1, Leaderboard.objects.get(generation=first.generation, player__name='player_1',
+                                                    leaderboard_type='mixed').matches_played)
+
+    def test_rows_of_removed_players_are_not_published(self):
+        create_match('player_1', 'player_2', create_tournament('Tournament 1', '2018-05-10', 'unseeded'))
+        tournament = Tournament.objects.create(name='Tournament 2', date='2018-05-11', ruleset=Ruleset.objects.get())
+        create_match('player_3', 'player_4', tournament)
+        self.create_leaderboards()
+        tournament.delete()
+        calculations = self.create_leaderboards()
+        self.assertEqual(4, calculations.metrics.counters['rows_deleted'])
+        self.assertEqual(0, calculations.metrics.counters['rows_updated'])
+        self.assertFalse(Leaderboard.objects.live().filter(player__name__in=['player_3', 'player_4']).exists())
+        self.assertEqual(2, Leaderboard.objects.live().filter(leaderboard_type='mixed').count())
+
+    def test_changes_below_tolerance_dont_create_generation(self):
+        create_match('player_1', 'player_2', create_tournament('Tournament 1', '2018-05-10', 'unseeded'))
+        generation = self.create_leaderboards().generation
+        Leaderboard.objects.filter(player__name='player_1').update(mu=models.F('mu') + 1e-12)
+        calculations = self.create_leaderboards()
+        self.assertIsNone(calculations.generation)
+        self.assertEqual(0, calculations.metrics.counters['rows_written'])
+        self.assertEqual(generation, LeaderboardGeneration.objects.live())
+
+    def test_old_generations_are_pruned(self):
+        tournament = create_tournament('Tournament 1', '2018-05-10', 'unseeded')
+        generations = []
+        for _ in range(4):
+            create_match('player_1', 'player_2', tournament)
+            generations.append(self.create_leaderboards(generations_kept=2).generation)
+        self.assertEqual(generations[2:], list(LeaderboardGeneration.objects.order_by('id')))
+        self.assertEqual(2 * 4, Leaderboard.objects.count())
+
+    def test_rollback_to_older_generation(self):
+        tournament = create_tournament('Tournament 1', '2018-05-10', 'unseeded')
+        create_match('player_1', 'player_2', tournament)
+        first = self.create_leaderboards().generation
+        create_match('player_2', 'player_1', tournament)
+        self.create_leaderboards()
+        first.publish()
+        self.assertEqual(first, LeaderboardGeneration.objects.live())
+        self.assertEqual(1, get_rating('player_1', 'mixed').matches_played)
+
+    def test_rows_without_generation_are_live_until_first_generation(self):
+        Leaderboard.objects.create(leaderboard_type='mixed', player=Player.objects.create(name='player_1'))
+        self.assertEqual(1, Leaderboard.objects.live().count())
+        create_match('player_2', 'player_3', create_tournament('Tournament 1', '2018-05-10', 'unseeded'))
+        self.create_leaderboards()
+        self.assertFalse(Leaderboard.objects.live().filter(player__name='player_1').exists())
+        self.assertFalse(Leaderboard.objects.filter(generation__isnull=True).exists())
+
+
+class PredictionScorerTests(TestCase):
+
+    def test_win_probability(self):
+        self.assertAlmostEqual(0.5, win_probability(trueskill.Rating(25), trueskill.Rating(25)))
+        stronger, weaker = trueskill.rate_1vs1(trueskill.Rating(25), trueskill.Rating(25))
+        self.assertGreater(win_probability(stronger, weaker), 0.5)
+        self.assertAlmostEqual(1, win_probability(stronger, weaker) + win_probability(weaker, stronger))
+
+    def test_predictions_use_ratings_before_the_match(self):
+        tourney = create_tournament('Unseeded Tournament', '2018-05-10', 'unseeded')
+        create_match('player_1', 'player_2', tourney)
+        create_match('player_1', 'player_2', tourney)
+        create_match('player_2', 'player_1', tourney)
+        scorer = PredictionScorer(tournament_limit=0, tournament_model=Tournament)
+        scorer.replay(scorer.load_tournaments())
+        results = scorer.results()
+        player_1, player_2 = trueskill.Rating(25), trueskill.Rating(25)
+        probabilities = [0.5]
+        player_1, player_2 = trueskill.rate_1vs1(player_1, player_2)
+        probabilities.append(win_probability(player_1, player_2))
+        player_1, player_2 = trueskill.rate_1vs1(player_1, player_2)
+        probabilities.append(win_probability(player_2, player_1))
+        self.assertEqual(3, results['mixed']['matches'])
+        self.assertAlmostEqual(-sum(math.log(p) for p in probabilities) / 3, results['mixed']['log_loss'])
+        # First match is a coin flip, second one is predicted correctly and the third one is an upset
+        self.assertAlmostEqual((0.5 + 1 + 0) / 3, results['mixed']['hit_rate'])
+        self.assertEqual(results['mixed'], results['unseeded'])
+        self.assertNotIn('seeded', results)
+        # Scoring doesn't write anything
+        self.assertFalse(Leaderboard.objects.exists())
@@ -1,8 +1,17 @@
-from django.core.cache import cache
+import json
+
+import trueskill
+from django.core.cache import cache, caches
 from django.test import TestCase
 from django.urls import reverse
 
-from leaderboards.models import Tournament, Ruleset, Leaderboard, Player
+from leaderboards.cache import set_generation, view_cache_key
+from leaderboards.models import Tournament, Ruleset, Leaderboard, Player, PlayerAlias, LeaderboardGeneration, Match, \
+    MatchRatingChange, HeadToHead
+from leaderboards.snapshots import clear_snapshots
+from leaderboards.trueskill_scripts.evaluation import win_probability
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
+from leaderboards.views import MAX_SIMULATION_WORK
 
 
 def create_ruleset(name):
@@ -413,6 +422,22 @@ class ApiRatingsViewTests(TestCase):
         self.assertJSONEqual(response.content, {'data': {'Player_3': {'mu': 40,
                                                                       'sigma': 5}}})
 
+    def test_ratings_of_generation_in_cache(self):
+        """
+        Ratings come from the generation the response is cached under, not from the one the database sees as live
+        """
+        rating = create_rating('mixed', 'Player_3', 40, 5)
+        set_generation(0)
+        generation = LeaderboardGeneration.objects.create()
+        Leaderboard.objects.create(generation=generation, leaderboard_type='mixed', player=rating.player, mu=30,
+                                   sigma=1)
+        generation.publish()  # Not announced in the cache until the commit
+        response = self.client.get(reverse('get_ratings', args=['mixed']))
+        self.assertEqual(40, response.json()['data']['Player_3']['mu'])
+        set_generation(generation.id)
+        response = self.client.get(reverse('get_ratings', args=['mixed']))
+        self.assertEqual(30, response.json()['data']['Player_3']['mu'])
+
     def test_unknown_with_ratings(self):
         """
         Rating type that's unknown/incorrect should raise 404
@@ -422,3 +447,347 @@ class ApiRatingsViewTests(TestCase):
         create_rating('mixed', 'Player_3', 40, 5)
         response = self.client.get(reverse('get_ratings', args=['unknown']))
         self.assertEqual(response.status_code, 404)
+
+
+class ApiRatingChangesViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        tournament = create_tournament('Tournament', '2018-05-10', create_ruleset('unseeded'))
+        self.player = Player.objects.create(name='player_1')
+        opponent = Player.objects.create(name='player_2')
+        self.first = Match.objects.create(tournament=tournament, winner=self.player, loser=opponent,
+                                          ruleset=tournament.ruleset)
+        self.second = Match.objects.create(tournament=tournament, winner=opponent, loser=self.player,
+                                           ruleset=tournament.ruleset)
+        TrueskillCalculations(tournament_limit=0, tournament_model=Tournament, leaderboard_model=Leaderboard,
+                              player_model=Player, change_model=MatchRatingChange).create_leaderboards()
+
+    def test_changes_newest_first(self):
+        response = self.client.get(reverse('get_rating_changes', args=['unseeded', self.player.id]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual([self.second.id, self.first.id], [change['match'] for change in data])
+        self.assertEqual([False, True], [change['won'] for change in data])
+        self.assertEqual({'tournament': 'Tournament', 'date': '2018-05-10'},
+                         {key: data[1][key] for key in ('tournament', 'date')})
+        self.assertEqual(25, data[1]['before']['mu'])
+        self.assertEqual(data[1]['after'], data[0]['before'])
+
+    def test_changes_ordered_by_tournament_date(self):
+        earlier = create_tournament('Earlier Tournament', '2018-05-01', self.first.ruleset)
+        back_dated = Match.objects.create(tournament=earlier, winner=self.player, loser=Player.objects.get(
+            name='player_2'), ruleset=earlier.ruleset)
+        TrueskillCalculations(tournament_limit=0, tournament_model=Tournament, leaderboard_model=Leaderboard,
+                              player_model=Player, change_model=MatchRatingChange).create_leaderboards()
+        data = self.client.get(reverse('get_rating_changes', args=['unseeded', self.player.id])).json()['data']
+        self.assertEqual([self.second.id, self.first.id, back_dated.id], [change['match'] for change in data])
+        self.assertEqual(data[2]['after'], data[1]['before'])
+
+    def test_player_without_matches(self):
+        response = self.client.get(reverse('get_rating_changes', args=['seeded', self.player.id]))
+        self.assertEqual([], response.json()['data'])
+
+    def test_wrong_rating_type(self):
+        response = self.client.get(reverse('get_rating_changes', args=['wrong', self.player.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiHeadToHeadViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        unseeded = create_tournament('Unseeded Tournament', '2018-05-10', create_ruleset('unseeded'))
+        seeded = create_tournament('Seeded Tournament', '2018-05-11', create_ruleset('seeded'))
+        self.player = Player.objects.create(name='player_1')
+        self.opponent = Player.objects.create(name='player_2')
+        for tournament, winner, loser in [(unseeded, self.player, self.opponent),
+                                          (unseeded, self.opponent, self.player),
+                                          (seeded, self.opponent, self.player)]:
+            Match.objects.create(tournament=tournament, winner=winner, loser=loser, ruleset=tournament.ruleset)
+        HeadToHead.objects.refresh()
+
+    def test_record_from_the_first_player_view(self):
+        response = self.client.get(reverse('get_head_to_head', args=[self.opponent.id, self.player.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({
+            'players': ['player_2', 'player_1'],
+            'wins': [2, 1],
+            'draws': 0,
+            'rulesets': {'seeded': {'wins': [1, 0], 'draws': 0}, 'unseeded': {'wins': [1, 1], 'draws': 0}},
+            'last_played': '2018-05-11',
+        }, response.json())
+        response = self.client.get(reverse('get_head_to_head', args=[self.player.id, self.opponent.id]))
+        self.assertEqual([1, 2], response.json()['wins'])
+
+    def test_players_without_matches(self):
+        stranger = Player.objects.create(name='player_3')
+        response = self.client.get(reverse('get_head_to_head', args=[self.player.id, stranger.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiPredictViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_snapshots()
+        create_rating('mixed', 'Strong', 35, 2)
+        create_rating('mixed', 'Weak', 20, 4)
+        create_rating('mixed', 'Average', 25, 3)
+        Leaderboard.objects.create(leaderboard_type='seeded', player=Player.objects.get(name='Strong'), mu=30, sigma=5)
+        PlayerAlias.objects.create(player=Player.objects.get(name='Weak'), alias='Underdog')
+
+    def predict(self, body, rating_type='mixed', status=200):
+        response = self.client.post(reverse('predict', args=[rating_type]), json.dumps(body),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_pairs(self):
+        response = self.predict({'pairs': [['Strong', 'Weak'], ['Weak', 'Strong'], ['Average', 'underdog']]})
+        self.assertEqual([['Strong', 'Weak'], ['Weak', 'Strong'], ['Average', 'underdog']],
+                         [pair['players'] for pair in response['data']])
+        expected = win_probability(trueskill.Rating(35, 2), trueskill.Rating(20, 4))
+        self.assertAlmostEqual(expected, response['data'][0]['win_probability'])
+        self.assertAlmostEqual(1, response['data'][0]['win_probability'] + response['data'][1]['win_probability'])
+        self.assertAlmostEqual(trueskill.quality_1vs1(trueskill.Rating(25, 3), trueskill.Rating(20, 4)),
+                               response['data'][2]['quality'])
+        self.assertEqual([], response['unknown'])
+
+    def test_pool_matrix(self):
+        response = self.predict({'players': ['Strong', 'Weak', 'Average', 'Strong', 'Nobody']})
+        self.assertEqual(['Strong', 'Weak', 'Average'], response['players'])
+        self.assertEqual(['Nobody'], response['unknown'])
+        self.assertAlmostEqual(0.5, response['win_probability'][0][0])
+        self.assertAlmostEqual(trueskill.quality_1vs1(trueskill.Rating(20, 4), trueskill.Rating(20, 4)),
+                               response['quality'][1][1])
+        self.assertGreater(response['win_probability'][0][1], 0.9)
+        self.assertAlmostEqual(response['quality'][0][2], response['quality'][2][0])
+
+    def test_unknown_and_unrated_players(self):
+        response = self.predict({'pairs': [['Strong', 'Nobody'], ['Strong', 'Average']]}, rating_type='seeded')
+        self.assertEqual([], response['data'])
+        self.assertEqual(['Average', 'Nobody'], response['unknown'])
+
+    def test_new_generation_replaces_snapshot(self):
+        self.predict({'players': ['Strong']})
+        generation = LeaderboardGeneration.objects.create()
+        Leaderboard.objects.create(generation=generation, leaderboard_type='mixed',
+                                   player=Player.objects.get(name='Weak'), mu=40, sigma=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            generation.publish()
+        response = self.predict({'players': ['Strong', 'Weak']})
+        self.assertEqual(['Weak'], response['players'])
+
+    def test_snapshot_waits_for_generation_rows(self):
+        self.predict({'players': ['Strong']})
+        generation = LeaderboardGeneration.objects.create()
+        set_generation(generation.id)  # Published, but its rows haven't reached the database yet
+        self.assertEqual(['Strong'], self.predict({'players': ['Strong']})['unknown'])
+        Leaderboard.objects.create(generation=generation, leaderboard_type='mixed',
+                                   player=Player.objects.get(name='Strong'), mu=40, sigma=1)
+        self.assertEqual(['Strong'], self.predict({'players': ['Strong']})['players'])
+
+    def test_snapshot_is_reused(self):
+        self.predict({'players': ['Strong', 'Weak']})
+        with self.assertNumQueries(0):
+            self.predict({'pairs': [['Strong', 'Weak']]})
+
+    def test_invalid_requests(self):
+        self.assertIn('error', self.predict({}, status=400))
+        self.assertIn('error', self.predict({'pairs': [['Strong']]}, status=400))
+        self.assertIn('error', self.predict({'players': 'Strong'}, status=400))
+        self.assertIn('error', self.predict({'players': ['Strong'] * 300}, status=400))
+        response = self.client.post(reverse('predict', args=['mixed']), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(405, self.client.get(reverse('predict', args=['mixed'])).status_code)
+        response = self.client.post(reverse('predict', args=['wrong']), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiSeedingViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_snapshots()
+        for name, mu, sigma in [('First', 40, 2), ('Second', 35, 2), ('Third', 33, 3), ('Fourth', 30, 1),
+                                ('Fifth', 20, 4)]:
+            create_rating('mixed', name, mu, sigma)
+        PlayerAlias.objects.create(player=Player.objects.get(name='Second'), alias='Runner Up')
+
+    def seeding(self, body, status=200):
+        response = self.client.post(reverse('seeding', args=['mixed']), json.dumps(body),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_seeding_by_conservative_rating(self):
+        response = self.seeding({'entrants': ['fifth', 'Third', 'Newcomer', 'runner up', 'First', 'Fourth']})
+        self.assertEqual(['First', 'runner up', 'Fourth', 'Third', 'fifth', 'Newcomer'],
+                         [entrant['name'] for entrant in response['data']])
+        self.assertEqual([1, 2, 3, 4, 5, 6], [entrant['seed'] for entrant in response['data']])
+        self.assertEqual({'seed': 1, 'name': 'First', 'player': 'First', 'mu': 40, 'sigma': 2, 'exposure': 34},
+                         response['data'][0])
+        self.assertEqual('Second', response['data'][1]['player'])
+        self.assertIsNone(response['data'][5]['player'])
+        self.assertAlmostEqual(0, response['data'][5]['exposure'])
+        self.assertNotIn('pairings', response)
+
+    def test_pairings(self):
+        response = self.seeding({'entrants': ['First', 'Second', 'Third', 'Fourth', 'Fifth'], 'pairings': True})
+        self.assertEqual(1, response['bye'])
+        self.assertEqual(2, len(response['pairings']))
+        seeds = sorted(seed for pairing in response['pairings'] for seed in pairing['seeds'])
+        self.assertEqual([2, 3, 4, 5], seeds)
+        for pairing in response['pairings']:
+            self.assertLessEqual(pairing['seeds'][0], 3)
+            self.assertGreater(pairing['seeds'][1], 3)
+            self.assertGreater(pairing['quality'], 0)
+
+    def test_invalid_requests(self):
+        self.assertIn('error', self.seeding({}, status=400))
+        self.assertIn('error', self.seeding({'entrants': 'First'}, status=400))
+        self.assertIn('error', self.seeding({'entrants': ['First'] * 600}, status=400))
+        response = self.client.post(reverse('seeding', args=['wrong']), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiSimulateTournamentViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['simulations'].clear()
+        clear_snapshots()
+        for name, mu, sigma in [('First', 40, 1), ('Second', 30, 1), ('Third', 29, 1), ('Fourth', 10, 1)]:
+            create_rating('mixed', name, mu, sigma)
+        PlayerAlias.objects.create(player=Player.objects.get(name='Second'), alias='Runner Up')
+
+    def simulate(self, body, status=200):
+        response = self.client.post(reverse('simulate_tournament', args=['mixed']), json.dumps(body),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_single_elimination(self):
+        response = self.simulate({'entrants': ['First', 'Fourth', 'runner up', 'Newcomer'], 'simulations': 5000})
+        self.assertEqual(['First', 'Fourth', 'runner up', 'Newcomer'],
+                         [entrant['name'] for entrant in response['data']])
+        first, fourth, second, newcomer = response['data']
+        self.assertEqual('Second', second['player'])
+        self.assertIsNone(newcomer['player'])
+        self.assertEqual([1, 1], first['rounds'][:1] + fourth['rounds'][:1])
+        self.assertGreater(first['rounds'][1], 0.99)
+        self.assertGreater(first['win'], 0.9)
+        self.assertAlmostEqual(1, sum(entrant['win'] for entrant in response['data']))
+
+    def test_swiss_with_bye(self):
+        response = self.simulate({'format': 'swiss', 'entrants': ['First', 'Second', 'Third'], 'rounds': 2,
+                                  'simulations': 5000})
+        for entrant in response['data']:
+            self.assertEqual(3, len(entrant['wins']))
+            self.assertAlmostEqual(1, sum(entrant['wins']))
+        self.assertGreater(response['data'][0]['first'], 0.5)
+
+    def test_results_are_cached_for_the_generation(self):
+        body = {'entrants': ['First', None, 'Second', 'Third'], 'simulations': 1000}
+        first = self.simulate(body)
+        self.assertEqual(first, self.simulate(body))
+        self.assertEqual(1, first['data'][0]['rounds'][1])
+        generation = LeaderboardGeneration.objects.create()
+        for name, mu in [('First', 10), ('Second', 30), ('Third', 29)]:
+            Leaderboard.objects.create(generation=generation, leaderboard_type='mixed',
+                                       player=Player.objects.get(name=name), mu=mu, sigma=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            generation.publish()
+        self.assertLess(self.simulate(body)['data'][0]['win'], 0.01)
+
+    def test_work_is_capped(self):
+        entrants = [f'Player {number}' for number in range(256)]
+        response = self.simulate({'entrants': entrants})
+        self.assertEqual(MAX_SIMULATION_WORK // (256 * 8), response['simulations'])
+        self.assertIn('error', self.simulate({'entrants': entrants, 'simulations': response['simulations'] + 1},
+                                             status=400))
+        self.assertIn('error', self.simulate({'format': 'swiss', 'entrants': entrants[:64], 'rounds': 20,
+                                              'simulations': 10000}, status=400))
+        # Single elimination plays all rounds of the bracket padded with byes, whatever the request says
+        self.assertEqual(response['simulations'], self.simulate({'entrants': entrants, 'rounds': 1})['simulations'])
+        self.assertEqual(response['simulations'], self.simulate({'entrants': entrants[:129]})['simulations'])
+        self.assertEqual(response['simulations'],
+                         self.simulate({'entrants': entrants[:2] + [None] * 254})['simulations'])
+
+    def test_results_are_kept_out_of_default_cache(self):
+        self.simulate({'entrants': ['First', 'Second'], 'simulations': 100})
+        self.assertEqual(1, len(caches['simulations']._cache))
+        self.assertEqual([], [key for key in cache._cache if 'simulation' in key])
+
+    def test_invalid_requests(self):
+        self.assertIn('error', self.simulate({}, status=400))
+        self.assertIn('error', self.simulate({'entrants': ['First']}, status=400))
+        self.assertIn('error', self.simulate({'entrants': ['First', 'First']}, status=400))
+        self.assertIn('error', self.simulate({'format': 'swiss', 'entrants': ['First', None, 'Second']}, status=400))
+        self.assertIn('error', self.simulate({'format': 'round_robin', 'entrants': ['First', 'Second']}, status=400))
+        self.assertIn('error', self.simulate({'entrants': ['First', 'Second'], 'simulations': 10 ** 9}, status=400))
+        self.assertIn('error', self.simulate({'entrants': ['First', 'Second'], 'simulations': True}, status=400))
+        self.assertIn('error', self.simulate({'format': 'swiss', 'entrants': ['First', 'Second'], 'rounds': True},
+                                             status=400))
+        response = self.client.post(reverse('simulate_tournament', args=['wrong']), '{}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiPlayerSearchViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_rating('mixed', 'SuperPlayer', 30, 4)
+        create_rating('unseeded', 'Player Two', 20, 3)
+        PlayerAlias.objects.create(player=Player.objects.get(name='Player Two'), alias='Duper')
+        Player.objects.create(name='Unrated')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('search_players'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_prefix_and_substring_matches(self):
+        """
+        Players whose name starts with the query should be listed before players containing it
+        """
+        self.assertEqual(['Player Two', 'SuperPlayer'], [player['name'] for player in self.search('PLAYER')])
+
+    def test_alias_match(self):
+        self.assertEqual(['Player Two', 'SuperPlayer'], [player['name'] for player in self.search('uper')])
+        self.assertEqual(['Player Two'], [player['name'] for player in self.search('dup')])
+
+    def test_ratings(self):
+        self.assertEqual([{'name': 'SuperPlayer', 'ratings': {'mixed': {'mu': 30, 'sigma': 4}}}],
+                         self.search('super'))
+        self.assertEqual([{'name': 'Unrated', 'ratings': {}}], self.search('unrated'))
+
+    def test_only_live_ratings(self):
+        player = Player.objects.get(name='SuperPlayer')
+        generation = LeaderboardGeneration.objects.create()
+        Leaderboard.objects.create(generation=generation, leaderboard_type='seeded', player=player, mu=10, sigma=1)
+        generation.publish()
+        self.assertEqual({'seeded': {'mu': 10, 'sigma': 1}}, self.search('super')[0]['ratings'])
+
+    def test_renamed_player(self):
+        player = Player.objects.get(name='Unrated')
+        player.name = 'Renamed'
+        player.save()
+        self.assertEqual([], self.search('unrated'))
+        self.assertEqual(['Renamed'], [player['name'] for player in self.search('renamed')])
+
+    def test_not_cached(self):
+        self.search('super')
+        self.assertIsNone(cache.get(view_cache_key(f"{reverse('search_players')}?q=super")))
+
+    def test_moved_alias(self):
+        alias = PlayerAlias.objects.get(alias='Duper')
+        alias.player = Player.objects.get(name='Unrated')
+        alias.save()
+        self.assertEqual(['Unrated'], [player['name'] for player in self.search('duper')])
+
+    def test_short_query_and_limit(self):
+        self.assertEqual([], self.search('p'))
+        self.assertEqual(1, len(self.search('er', limit=1)))
@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+# Query budgets for the hot paths of the site. If a change makes one of the tests fail, either fix the regression or
+# raise the budget in the same commit and explain why in the review.
+INDEX_QUERY_BUDGET = 3
+LEADERBOARD_QUERY_BUDGET = 1
+RATINGS_QUERY_BUDGET = 1
+SEARCH_QUERY_BUDGET = 1
+RATING_CHANGES_QUERY_BUDGET = 1
+HEAD_TO_HEAD_QUERY_BUDGET = 1
+# Full replay of the fixture created by create_replay_fixture(), including the fingerprint of the rating inputs
+REPLAY_QUERY_BUDGET = 14
+# Replay of the same fixture when leaderboards are already up to date, it stops after comparing the fingerprint
+UNCHANGED_REPLAY_QUERY_BUDGET = 3
+# Importing the tournament returned by tournament_json(), every tournament and match save also deletes rating
+# checkpoints after its date, saves of existing rows first read the stored rating fields to see if they changed
+IMPORT_QUERY_BUDGET = 70
+
+# Total time spent in the database, in seconds. Those are deliberately loose, they are here to catch queries that
+# went from milliseconds to seconds, not to benchmark the test machine.
+VIEW_QUERY_TIME_BUDGET = 0.5
+REPLAY_QUERY_TIME_BUDGET = 2.0
+IMPORT_QUERY_TIME_BUDGET = 2.0
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudgetMixin:
+    """
+    Mixin for TestCase classes that adds assertQueryBudget context manager
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_time=None, using='default'):
+        """
+        Fails when the code inside the block issues more than max_queries queries or spends more than max_time
+        seconds in the database. Unlike assertNumQueries it doesn't fail when the code gets faster.
+        """
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > max_queries:
+            queries = '\n'.join(f'{number}. {query["sql"]}'
+                                for number, query in enumerate(context.captured_queries, start=1))
+            raise QueryBudgetExceeded(f'{executed} queries executed, budget is {max_queries}\n{queries}')
+        if max_time is not None:
+            total_time = sum(float(query['time']) for query in context.captured_queries)
+            if total_time > max_time:
+                raise QueryBudgetExceeded(f'{total_time:.3f}s spent in the database, budget is {max_time}s')
@@ -0,0 +1,137 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+import trueskill
+
+# Coefficients of the erfc approximation used by trueskill, so batched updates match trueskill.rate_1vs1
+ERFC_COEFFICIENTS = (0.17087277, -0.82215223, 1.48851587, -1.13520398, 0.27886807, -0.18628806, 0.09678418,
+                     0.37409196, 1.00002368, -1.26551223)
+
+
+def erfc(x):
+    z = np.abs(x)
+    t = 1. / (1. + z / 2.)
+    polynomial = np.zeros_like(t)
+    for coefficient in ERFC_COEFFICIENTS:
+        polynomial = polynomial * t + coefficient
+    r = t * np.exp(-z * z + polynomial)
+    return np.where(x < 0, 2. - r, r)
+
+
+def cdf(x):
+    return 0.5 * erfc(-x / math.sqrt(2))
+
+
+def pdf(x):
+    return np.exp(-x ** 2 / 2) / math.sqrt(2 * math.pi)
+
+
+def win_probabilities(mu, sigma, opponent_mu, opponent_sigma, env=None):
+    """
+    Element-wise probability that players beat their opponents, arrays are broadcast, so mu[:, None] against
+    mu[None, :] gives the whole matrix
+    """
+    env = env or trueskill.global_env()
+    return cdf((mu - opponent_mu) / np.sqrt(2 * env.beta ** 2 + sigma ** 2 + opponent_sigma ** 2))
+
+
+def match_qualities(mu, sigma, opponent_mu, opponent_sigma, env=None):
+    """
+    Element-wise trueskill.quality_1vs1, the draw probability of the pairs relative to the most even match possible
+    """
+    env = env or trueskill.global_env()
+    variance = 2 * env.beta ** 2 + sigma ** 2 + opponent_sigma ** 2
+    return np.sqrt(2 * env.beta ** 2 / variance) * np.exp(-(mu - opponent_mu) ** 2 / (2 * variance))
+
+
+class RatingArrays:
+    """
+    Ratings of a single leaderboard kept in NumPy arrays, players are addressed by their index
+    """
+
+    def __init__(self, env=None):
+        self.env = env or trueskill.global_env()
+        self.index = {}
+        self.mu = np.empty(0)
+        self.sigma = np.empty(0)
+
+    def __len__(self):
+        return len(self.index)
+
+    def indices(self, players):
+        """
+        Returns indices of the players, players seen for the first time get the initial rating of the environment
+        """
+        for player in players:
+            if player not in self.index:
+                self.index[player] = len(self.index)
+        if len(self.index) > len(self.mu):
+            # Capacity is doubled, so adding players one by one stays linear
+            capacity = max(len(self.index), 2 * len(self.mu))
+            self.mu = np.concatenate([self.mu, np.full(capacity - len(self.mu), float(self.env.mu))])
+            self.sigma = np.concatenate([self.sigma, np.full(capacity - len(self.sigma), float(self.env.sigma))])
+        return np.fromiter((self.index[player] for player in players), dtype=np.intp, count=len(players))
+
+    def rating(self, player):
+        index = self.index[player]
+        return self.env.create_rating(float(self.mu[index]), float(self.sigma[index]))
+
+
+def rate_1vs1_batch(mu, sigma, winners, losers, env=None):
+    """
+    Applies a batch of 1v1 wins in place, the same update trueskill.rate_1vs1 makes for every pair. No player may
+    appear twice in the batch, waves returned by schedule_waves satisfy that.
+
+    :param mu: Array of means of all players
+    :param sigma: Array of standard deviations of all players
+    :param winners: Array of winner indices
+    :param losers: Array of loser indices, losers[i] lost to winners[i]
+    """
+    env = env or trueskill.global_env()
+    draw_margin = trueskill.calc_draw_margin(env.draw_probability, 2, env)
+    winner_variance = sigma[winners] ** 2 + env.tau ** 2
+    loser_variance = sigma[losers] ** 2 + env.tau ** 2
+    c = np.sqrt(2 * env.beta ** 2 + winner_variance + loser_variance)
+    x = (mu[winners] - mu[losers]) / c - draw_margin / c
+    denominator = cdf(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.where(denominator > 0, pdf(x) / denominator, -x)
+    w = v * (v + x)
+    mu[winners] += winner_variance / c * v
+    mu[losers] -= loser_variance / c * v
+    sigma[winners] = np.sqrt(winner_variance * (1 - winner_variance / c ** 2 * w))
+    sigma[losers] = np.sqrt(loser_variance * (1 - loser_variance / c ** 2 * w))
+
+
+def replay_waves_batched(waves, env=None):
+    """
+    Replays waves returned by schedule_waves with one rate_1vs1_batch call per wave and ruleset repeat, results are
+    the same as replay_waves up to floating point rounding
+
+    :return: Racers dictionary and number of rating updates
+    """
+    ratings = RatingArrays(env)
+    racers = defaultdict(dict)
+    last_tournament = {}
+    rating_updates = 0
+    for wave in waves:
+        for step in wave:
+            for player, player_id in ((step.match.winner, step.match.winner_id),
+                                      (step.match.loser, step.match.loser_id)):
+                if player not in racers:
+                    racers[player].update(id=player_id, matches_played=0, tournaments_played=0)
+                if last_tournament.get(player) != step.tournament_id:
+                    last_tournament[player] = step.tournament_id
+                    racers[player]['tournaments_played'] += 1
+                racers[player]['matches_played'] += 1
+        winners = ratings.indices([step.match.winner for step in wave])
+        losers = ratings.indices([step.match.loser for step in wave])
+        repeats = np.array([step.repeats for step in wave], dtype=np.intp)
+        for repeat in range(int(repeats.max(initial=0))):
+            mask = repeats > repeat
+            rate_1vs1_batch(ratings.mu, ratings.sigma, winners[mask], losers[mask], env)
+        rating_updates += int(repeats.sum())
+    for player in racers:
+        racers[player]['rating'] = ratings.rating(player) if player in ratings.index else ratings.env.create_rating()
+    return racers, rating_updates
@@ -0,0 +1,81 @@
+import math
+from collections import defaultdict
+
+import trueskill
+
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations
+
+# Probabilities are clipped before taking the logarithm, so a single confident miss doesn't make log loss infinite
+EPSILON = 1e-15
+
+# History shared by worker processes of a sweep, set once per process by init_worker
+_history = None
+
+
+def win_probability(rating, opponent_rating, env=None):
+    """
+    Probability that the player beats the opponent, according to their TrueSkill ratings
+    """
+    env = env or trueskill.global_env()
+    denominator = math.sqrt(2 * env.beta ** 2 + rating.sigma ** 2 + opponent_rating.sigma ** 2)
+    return env.cdf((rating.mu - opponent_rating.mu) / denominator)
+
+
+class PredictionScorer(TrueskillCalculations):
+    """
+    Replays the history without touching the database and scores how well the ratings before each match predicted
+    its result. Only matches between players that played at least tournament_limit tournaments are scored.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.log_loss = defaultdict(float)
+        self.hits = defaultdict(float)
+        self.scored = defaultdict(int)
+
+    def initiate_player(self, match, players_in_tourney, **kwargs):
+        super().initiate_player(match, players_in_tourney, **kwargs)
+        self.score_match(match, 'mixed', self.racers)
+        if 'unseeded' in kwargs:
+            self.score_match(match, 'unseeded', self.unseeded_racers)
+        if 'seeded' in kwargs:
+            self.score_match(match, 'seeded', self.seeded_racers)
+
+    def score_match(self, match, leaderboard_type, racers_dict):
+        winner = racers_dict[match.winner]
+        loser = racers_dict[match.loser]
+        if min(winner['tournaments_played'], loser['tournaments_played']) < self.tournament_limit:
+            return
+        probability = win_probability(winner['rating'], loser['rating'])
+        self.log_loss[leaderboard_type] -= math.log(max(probability, EPSILON))
+        if math.isclose(probability, 0.5, abs_tol=1e-6):  # Equal ratings, trueskill.cdf is an approximation
+            self.hits[leaderboard_type] += 0.5
+        elif probability > 0.5:
+            self.hits[leaderboard_type] += 1
+        self.scored[leaderboard_type] += 1
+
+    def results(self):
+        return {
+            leaderboard_type: {
+                'log_loss': self.log_loss[leaderboard_type] / self.scored[leaderboard_type],
+                'hit_rate': self.hits[leaderboard_type] / self.scored[leaderboard_type],
+                'matches': self.scored[leaderboard_type],
+            } for leaderboard_type in ('mixed', 'unseeded', 'seeded') if self.scored[leaderboard_type]
+        }
+
+
+def init_worker(history):
+    global _history
+    _history = history
+
+
+def evaluate_parameters(parameters, history=None):
+    """
+    Replays the history with given engine parameters and returns them together with prediction scores
+
+    :param parameters: Dictionary of TrueskillCalculations keyword arguments
+    :param history: List of TournamentRecord, if None history set by init_worker is used
+    """
+    scorer = PredictionScorer(**parameters)
+    scorer.replay(_history if history is None else history)
+    return parameters, scorer.results()
@@ -0,0 +1,52 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from leaderboards.db import execute_wrapper
+
+
+class RecalculationMetrics:
+    """
+    Collects timings, query counts and counters for every phase of leaderboard recalculation
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measures wall time and number of queries issued inside the block, repeated phases are summed up
+        """
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with execute_wrapper(count_queries):
+                yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+            self.queries[name] += queries
+
+    def increment(self, counter, value=1):
+        self.counters[counter] += value
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+    @property
+    def total_queries(self):
+        return sum(self.queries.values())
+
+    def summary(self):
+        phases = ', '.join(f'{name} {duration:.3f}s/{self.queries[name]}q' for name, duration in self.timings.items())
+        counters = ', '.join(f'{name}={value}' for name, value in self.counters.items())
+        return f'Recalculation took {self.total_time:.3f}s and {self.total_queries} queries ({phases}); {counters}'
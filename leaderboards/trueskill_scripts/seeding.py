@@ -0,0 +1,81 @@
+import numpy as np
+import trueskill
+
+from leaderboards.trueskill_scripts.batch import match_qualities
+
+
+def exposures(mu, sigma, env=None):
+    """
+    Element-wise conservative rating, the same value leaderboards are sorted by
+    """
+    env = env or trueskill.global_env()
+    return mu - env.mu / env.sigma * sigma
+
+
+def seed_order(mu, sigma, env=None):
+    """
+    Returns indices of entrants from the best to the worst conservative rating, ties keep the entrant order
+    """
+    return np.argsort(-exposures(mu, sigma, env), kind='stable')
+
+
+def assignment(cost):
+    """
+    Minimum cost assignment of a square cost matrix with the Hungarian algorithm in O(n^3), the inner loop over
+    columns is vectorized
+
+    :return: Array with the assigned column of every row
+    """
+    size = cost.shape[0]
+    # Potentials and matching use 1-based columns, column 0 is the row being added
+    row_potential = np.zeros(size + 1)
+    column_potential = np.zeros(size + 1)
+    column_row = np.zeros(size + 1, dtype=np.intp)
+    previous_column = np.zeros(size + 1, dtype=np.intp)
+    for row in range(1, size + 1):
+        column_row[0] = row
+        column = 0
+        min_slack = np.full(size + 1, np.inf)
+        used = np.zeros(size + 1, dtype=bool)
+        while column_row[column] != 0:  # Until the path reaches a free column
+            used[column] = True
+            current_row = column_row[column]
+            slack = np.full(size + 1, np.inf)
+            slack[1:] = cost[current_row - 1] - row_potential[current_row] - column_potential[1:]
+            improved = ~used & (slack < min_slack)
+            min_slack[improved] = slack[improved]
+            previous_column[improved] = column
+            free_slack = np.where(used, np.inf, min_slack)
+            next_column = int(np.argmin(free_slack))
+            delta = free_slack[next_column]
+            row_potential[column_row[used]] += delta
+            column_potential[used] -= delta
+            min_slack[~used] -= delta
+            column = next_column
+        while column != 0:  # Augmenting path
+            column_row[column] = column_row[previous_column[column]]
+            column = previous_column[column]
+    result = np.empty(size, dtype=np.intp)
+    result[column_row[1:] - 1] = np.arange(size)
+    return result
+
+
+def pair_first_round(mu, sigma, env=None):
+    """
+    Pairs the top half of seeds with the bottom half so that the total match quality is the highest possible, with an
+    odd number of entrants the top seed gets a bye
+
+    :param mu: Means of the entrants in seeding order
+    :param sigma: Standard deviations of the entrants in seeding order
+    :return: List of (seed index, seed index, quality) and index of the entrant with a bye or None
+    """
+    bye = 0 if len(mu) % 2 else None
+    offset = len(mu) % 2
+    half = (len(mu) - offset) // 2
+    top = np.arange(offset, offset + half)
+    bottom = np.arange(offset + half, len(mu))
+    qualities = match_qualities(mu[top, None], sigma[top, None], mu[None, bottom], sigma[None, bottom], env)
+    opponents = assignment(-qualities)
+    pairs = [(int(top[index]), int(bottom[opponent]), float(qualities[index, opponent]))
+             for index, opponent in enumerate(opponents)]
+    return pairs, bye
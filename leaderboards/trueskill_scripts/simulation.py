@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from leaderboards.trueskill_scripts.batch import win_probabilities
+
+SINGLE_ELIMINATION = 'single_elimination'
+SWISS = 'swiss'
+FORMATS = (SINGLE_ELIMINATION, SWISS)
+# Simulations done at once by a single task, bounds memory of the sampled arrays
+CHUNK_SIZE = 10000
+
+
+def rounds_to_winner(entrants):
+    """
+    Rounds of a single elimination bracket of the entrants, also the usual number of Swiss rounds
+    """
+    return max(len(entrants) - 1, 1).bit_length()
+
+
+def bracket_indices(entrants):
+    """
+    Splits a bracket with None for byes into the list of entrant names and the bracket of their indices
+    """
+    names = [entrant for entrant in entrants if entrant is not None]
+    bracket = np.full(len(entrants), -1, dtype=np.intp)
+    bracket[[entrant is not None for entrant in entrants]] = np.arange(len(names))
+    return names, bracket
+
+
+def simulate_single_elimination(probabilities, bracket, simulations, rng):
+    """
+    :param probabilities: Matrix of win probabilities of every player against every other
+    :param bracket: Player indices in bracket order, -1 for byes, padded with byes to a power of two
+    :return: Matrix of how many times every player reached every round, the last column counts tournament wins
+    """
+    players = len(probabilities)
+    rounds = rounds_to_winner(bracket)
+    slots = np.full((simulations, 1 << rounds), -1, dtype=np.intp)
+    slots[:, :len(bracket)] = bracket
+    reached = np.zeros((players, rounds + 1), dtype=np.int64)
+    for round_number in range(rounds + 1):
+        reached[:, round_number] = np.bincount(slots[slots >= 0], minlength=players)
+        if round_number == rounds:
+            break
+        first, second = slots[:, 0::2], slots[:, 1::2]
+        probability = probabilities[np.maximum(first, 0), np.maximum(second, 0)]
+        probability = np.where(second < 0, 1, np.where(first < 0, 0, probability))
+        slots = np.where(rng.random(first.shape) < probability, first, second)
+    return reached
+
+
+def simulate_swiss(probabilities, rounds, simulations, rng):
+    """
+    Pairs players with the same score every round, ties in score are paired randomly and with an odd number of
+    players the lowest player gets a bye (counted as a win). Rematches are not avoided.
+
+    :return: Matrix of how many times every player finished with 0 to rounds wins, with an extra last column
+        counting first places (ties broken randomly)
+    """
+    players = len(probabilities)
+    rows = np.arange(simulations)[:, None]
+    scores = np.zeros((simulations, players), dtype=np.intp)
+    for _ in range(rounds):
+        # Random fractions below 1 break ties in score without reordering different scores
+        order = np.argsort(-(scores + rng.random((simulations, players))), axis=1)
+        if players % 2:
+            scores[rows[:, 0], order[:, -1]] += 1
+        first, second = order[:, 0:players - 1:2], order[:, 1:players:2]
+        winners = np.where(rng.random(first.shape) < probabilities[first, second], first, second)
+        scores[rows, winners] += 1
+    results = np.zeros((players, rounds + 2), dtype=np.int64)
+    for wins in range(rounds + 1):
+        results[:, wins] = (scores == wins).sum(axis=0)
+    results[:, -1] = np.bincount(np.argmax(scores + rng.random(scores.shape) / 2, axis=1), minlength=players)
+    return results
+
+
+def simulate_chunk(bracket_format, probabilities, bracket, rounds, simulations, seed):
+    rng = np.random.default_rng(seed)
+    if bracket_format == SINGLE_ELIMINATION:
+        return simulate_single_elimination(probabilities, bracket, simulations, rng)
+    return simulate_swiss(probabilities, rounds, simulations, rng)
+
+
+def simulate(bracket_format, mu, sigma, simulations, bracket=None, rounds=None, workers=1, seed=None, env=None):
+    """
+    Simulates tournaments with match results sampled from win probabilities of the players
+
+    :param bracket_format: SINGLE_ELIMINATION or SWISS
+    :param mu: Means of the players
+    :param sigma: Standard deviations of the players
+    :param bracket: Player indices in bracket order with -1 for byes, by default the order of the players
+    :param rounds: Number of Swiss rounds
+    :param workers: Number of processes the simulations are spread across
+    :return: Matrix of probabilities, see simulate_single_elimination and simulate_swiss for its columns
+    """
+    probabilities = win_probabilities(mu[:, None], sigma[:, None], mu[None, :], sigma[None, :], env)
+    if bracket is None:
+        bracket = np.arange(len(mu))
+    chunks = [CHUNK_SIZE] * (simulations // CHUNK_SIZE) + ([simulations % CHUNK_SIZE] if simulations % CHUNK_SIZE
+                                                           else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    arguments = ([bracket_format] * len(chunks), [probabilities] * len(chunks), [bracket] * len(chunks),
+                 [rounds] * len(chunks), chunks, seeds)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(simulate_chunk, *arguments))
+    else:
+        results = list(map(simulate_chunk, *arguments))
+    return sum(results) / simulations
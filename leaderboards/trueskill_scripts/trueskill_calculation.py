@@ -1,13 +1,50 @@
-from collections import defaultdict
+import hashlib
+import json
+import logging
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import trueskill
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
+
+from leaderboards.trueskill_scripts.metrics import RecalculationMetrics
+
+logger = logging.getLogger(__name__)
+
+# Plain copies of the rating relevant data, they are cheap to keep in memory and can be sent to other processes
+TournamentRecord = namedtuple('TournamentRecord', ['id', 'date', 'ruleset', 'matches'])
+MatchRecord = namedtuple('MatchRecord', ['id', 'winner_id', 'winner', 'loser_id', 'loser', 'ruleset', 'score'])
+# Match applied to a single leaderboard, repeats is the number of rating updates it makes (the ruleset multiplier)
+RatingStep = namedtuple('RatingStep', ['tournament_id', 'match', 'repeats'])
+# Ratings of both players of a match in a single leaderboard, before and after all repeats of the match
+RatingChange = namedtuple('RatingChange', ['match_id', 'winner_id', 'loser_id', 'winner_before', 'loser_before',
+                                           'winner_after', 'loser_after'])
 
 
 class TrueskillCalculations:
 
     def __init__(self, tournament_limit=2, seeded_multiplier=4, mixed_multiplier=2, tournament_model=object,
-                 leaderboard_model=object, player_model=object):
+                 leaderboard_model=object, player_model=object, run_model=None, tolerance=1e-9,
+                 generations_kept=None, warm_caches=None, parallel=None, checkpoint_model=None,
+                 checkpoint_interval=None, force=False, change_model=None, head_to_head_model=None):
         """
+        :param head_to_head_model: Model with head-to-head records of player pairs, refreshed for the replayed
+            tournaments, if None they are not kept
+        :param change_model: Model in which rating changes of every match are saved, if None they are not recorded
+        :param force: Recalculate even when the fingerprint of the rating inputs matches the live generation
+        :param checkpoint_interval: Number of tournaments between rating checkpoints, by default CHECKPOINT_INTERVAL
+            setting, 0 disables checkpoints
+        :param checkpoint_model: Model in which rating checkpoints are saved, if None the whole history is replayed
+        :param parallel: Replay every leaderboard in its own worker process, by default PARALLEL_REPLAY setting
+        :param warm_caches: Render cached views after a new leaderboard generation is published, by default
+            WARM_CACHES setting
+        :param generations_kept: Number of leaderboard generations kept for rollback, by default
+            LEADERBOARD_GENERATIONS_KEPT setting
+        :param tolerance: Smallest change of mu or sigma that is written into the database
+        :param run_model: Model in which recalculation metrics are saved, if None they are only logged
         :param player_model: Model containing players
         :param leaderboard_model: Model in which leaderboard is created
         :param tournament_model: Model containing all tournaments
@@ -24,69 +61,373 @@ class TrueskillCalculations:
         self.mixed_multiplier = mixed_multiplier
         self.seeded_multiplier = seeded_multiplier
         self.tournament_limit = tournament_limit
+        self.run_model = run_model
+        self.tolerance = tolerance
+        self.generations_kept = generations_kept or settings.LEADERBOARD_GENERATIONS_KEPT
+        self.warm_caches = settings.WARM_CACHES if warm_caches is None else warm_caches
+        self.parallel = settings.PARALLEL_REPLAY if parallel is None else parallel
+        self.checkpoint = checkpoint_model
+        self.checkpoint_interval = settings.CHECKPOINT_INTERVAL if checkpoint_interval is None else checkpoint_interval
+        self.checkpoints = []
+        self.force = force
+        self.change = change_model
+        self.changes = defaultdict(list)
+        self.head_to_head = head_to_head_model
+        self.fingerprint = None
+        self.generation = None
+        self.metrics = RecalculationMetrics()
 
     def create_leaderboards(self):
-        for tournament in self.tournament.objects.all().order_by('date', 'id'):
-            players_in_tourney = []
-            players_in_seeded_tourney = []
-            players_in_unseeded_tourney = []
-            for match in tournament.match_set.all().order_by('id'):
-                ruleset = tournament.ruleset.ruleset
-                if ruleset == 'diversity' or ruleset == 'unseeded':
-                    self.initiate_player(match, players_in_tourney, unseeded=players_in_unseeded_tourney)
-                    self.calculate_rating(match, self.racers)
-                    self.calculate_rating(match, self.unseeded_racers)
-                elif ruleset == 'seeded':
-                    self.initiate_player(match, players_in_tourney, seeded=players_in_seeded_tourney)
-                    for _ in range(self.seeded_multiplier):
-                        self.calculate_rating(match, self.racers)
-                    self.calculate_rating(match, self.seeded_racers)
-                elif ruleset == 'mixed':
-                    self.initiate_player(match, players_in_tourney, unseeded=players_in_unseeded_tourney)
-                    for _ in range(self.mixed_multiplier):
-                        self.calculate_rating(match, self.racers)
-                    self.calculate_rating(match, self.unseeded_racers)
-                elif ruleset == 'multiple':
-                    if match.ruleset is not None and match.ruleset.ruleset != 'multiple':
-                        if match.ruleset.ruleset == 'seeded':
-                            self.initiate_player(match, players_in_tourney, seeded=players_in_seeded_tourney)
-                            for _ in range(self.seeded_multiplier):
-                                self.calculate_rating(match, self.racers)
-                            self.calculate_rating(match, self.seeded_racers)
-                        elif match.ruleset.ruleset in ['unseeded', 'diversity']:
-                            self.initiate_player(match, players_in_tourney, unseeded=players_in_unseeded_tourney)
-                            self.calculate_rating(match, self.racers)
-                            self.calculate_rating(match, self.unseeded_racers)
-                        elif match.ruleset.ruleset == 'mixed':
-                            self.initiate_player(match, players_in_tourney, unseeded=players_in_unseeded_tourney)
-                            for _ in range(self.mixed_multiplier):
-                                self.calculate_rating(match, self.racers)
-                            self.calculate_rating(match, self.unseeded_racers)
-                else:  # team, other, and any undefined ruleset
-                    continue
-        mixed_leaderboard = self.calculate_places(self.racers)
-        unseeded_leaderboard = self.calculate_places(self.unseeded_racers)
-        seeded_leaderboard = self.calculate_places(self.seeded_racers)
-        self.export_leaderboard_to_db('mixed', mixed_leaderboard)
-        self.export_leaderboard_to_db('unseeded', unseeded_leaderboard)
-        self.export_leaderboard_to_db('seeded', seeded_leaderboard)
-
-    def export_leaderboard_to_db(self, leaderboard_type: str, leaderboard_list):
+        with self.metrics.phase('loading'):
+            live_generation = self.generation_model().objects.live()
+            self.fingerprint = self.inputs_fingerprint()
+            if not self.force and live_generation is not None and live_generation.fingerprint == self.fingerprint:
+                self.metrics.increment('skipped')
+                self.save_metrics()
+                return
+            checkpoint = self.load_checkpoint()
+            tournaments = self.load_tournaments(after=checkpoint)
+        with self.metrics.phase('rating'):
+            position = checkpoint.tournaments if checkpoint else 0
+            if self.parallel:
+                self.replay_parallel(tournaments)
+            else:
+                self.replay(tournaments, position)
+            if tournaments:
+                self.add_checkpoint(tournaments[-1], position + len(tournaments))
+        with self.metrics.phase('sorting'):
+            leaderboards = {
+                'mixed': self.calculate_places(self.racers),
+                'unseeded': self.calculate_places(self.unseeded_racers),
+                'seeded': self.calculate_places(self.seeded_racers),
+            }
+        # Published leaderboards, rating changes, head-to-head records, the fingerprint and checkpoints are committed
+        # together, a failure in any of them leaves the previous results live and the next run repeats the work
+        with self.metrics.phase('export'), transaction.atomic():
+            self.generation = self.export_leaderboards(leaderboards)
+            self.save_rating_changes(after=checkpoint)
+            self.save_head_to_head(after=checkpoint)
+            if self.generation is None and live_generation is not None:
+                # Leaderboards didn't change, so the live generation is the result of the current inputs as well
+                live_generation.fingerprint = self.fingerprint
+                live_generation.save(update_fields=['fingerprint'])
+            self.save_checkpoints()
+        self.save_metrics()
+        if self.warm_caches and self.generation is not None:
+            # Runs after publish invalidated the views, so they are cached under the new generation
+            transaction.on_commit(self.warm_views)
+
+    @staticmethod
+    def warm_views():
+        from leaderboards.cache import warm_views
+        try:
+            warm_views()
+        except Exception:  # Leaderboards are already published, visitors will render the views themselves
+            logger.exception('Warming caches failed')
+
+    def generation_model(self):
+        return self.leaderboard._meta.get_field('generation').related_model
+
+    def inputs_fingerprint(self):
+        """
+        Hashes everything ratings depend on, tournaments with their dates and rulesets, matches with players, rulesets
+        and scores and the engine parameters. Descriptions, videos, urls and other edits don't change it.
+        """
+        match_model = self.tournament.match_set.rel.related_model
+        env = trueskill.global_env()
+        fingerprint = hashlib.sha256(repr((
+            self.tournament_limit, self.seeded_multiplier, self.mixed_multiplier, env.mu, env.sigma, env.beta, env.tau,
+            env.draw_probability)).encode())
+        for row in self.tournament.objects.order_by('id').values_list('id', 'date', 'ruleset__ruleset').iterator():
+            fingerprint.update(repr(row).encode())
+        for row in match_model.objects.order_by('id').values_list(
+                'id', 'tournament_id', 'winner_id', 'loser_id', 'ruleset__ruleset', 'score__score').iterator():
+            fingerprint.update(repr(row).encode())
+        return fingerprint.hexdigest()
+
+    def load_tournaments(self, after=None):
+        """
+        Loads the whole match history with two queries
+
+        :param after: Checkpoint, only tournaments it doesn't include are loaded
+        :return: List of TournamentRecord ordered by date, each with MatchRecord list ordered by id
+        """
+        match_model = self.tournament.match_set.rel.related_model
+        tournaments = self.tournament.objects.all()
+        match_queryset = match_model.objects.all()
+        if after is not None:
+            tournaments = tournaments.filter(after_checkpoint(after))
+            match_queryset = match_queryset.filter(after_checkpoint(after, 'tournament__'))
+        matches = defaultdict(list)
+        for tournament_id, *match in match_queryset.order_by('id').values_list(
+                'tournament_id', 'id', 'winner_id', 'winner__name', 'loser_id', 'loser__name', 'ruleset__ruleset',
+                'score__score'):
+            matches[tournament_id].append(MatchRecord(*match))
+        tournaments = [
+            TournamentRecord(tournament_id, date, ruleset, matches[tournament_id])
+            for tournament_id, date, ruleset in tournaments.order_by('date', 'id').values_list(
+                'id', 'date', 'ruleset__ruleset')
+        ]
+        self.metrics.increment('tournaments_loaded', len(tournaments))
+        return tournaments
+
+    def replay(self, tournaments, position=0):
+        """
+        :param position: Number of tournaments already included in the ratings, used to place interval checkpoints
+        """
+        for number, tournament in enumerate(tournaments, start=position + 1):
+            self.process_tournament(tournament)
+            if self.checkpoint_interval and number % self.checkpoint_interval == 0:
+                self.add_checkpoint(tournament, number)
+
+    def checkpoint_parameters(self):
+        return f'seeded_multiplier={self.seeded_multiplier},mixed_multiplier={self.mixed_multiplier}'
+
+    def load_checkpoint(self):
+        """
+        Restores ratings from the latest checkpoint, checkpoints after changed tournaments were already deleted
+
+        :return: Restored checkpoint or None
+        """
+        if self.checkpoint is None or not self.checkpoint_interval:
+            return None
+        checkpoint = self.checkpoint.objects.filter(parameters=self.checkpoint_parameters()).order_by(
+            '-date', '-tournament_id').first()
+        if checkpoint is None:
+            return None
+        names = dict(self.player.objects.values_list('id', 'name'))
+        state = json.loads(checkpoint.state)
+        for leaderboard_type, racers in self.leaderboard_racers().items():
+            for player_id, (mu, sigma, tournaments_played, matches_played) in state[leaderboard_type].items():
+                racers[names[int(player_id)]] = {'id': int(player_id), 'rating': trueskill.Rating(mu, sigma),
+                                                 'tournaments_played': tournaments_played,
+                                                 'matches_played': matches_played}
+        self.metrics.increment('tournaments_restored', checkpoint.tournaments)
+        return checkpoint
+
+    def add_checkpoint(self, tournament, number):
+        if self.checkpoint is None or not self.checkpoint_interval or (
+                self.checkpoints and self.checkpoints[-1].tournament_id == tournament.id):
+            return
+        # Racers are kept in insertion order, so ties in the leaderboard stay the same after a restore
+        state = {
+            leaderboard_type: {racer['id']: [racer['rating'].mu, racer['rating'].sigma, racer['tournaments_played'],
+                                             racer['matches_played']] for racer in racers.values()}
+            for leaderboard_type, racers in self.leaderboard_racers().items()
+        }
+        self.checkpoints.append(self.checkpoint(tournament_id=tournament.id, date=tournament.date, tournaments=number,
+                                                parameters=self.checkpoint_parameters(), state=json.dumps(state)))
+
+    def save_checkpoints(self):
+        """
+        Saves new checkpoints, the previous checkpoint after the last tournament is replaced by the new one unless it
+        falls on the interval
+        """
+        if not self.checkpoints:
+            return
+        self.checkpoint.objects.filter(parameters=self.checkpoint_parameters()).alias(
+            remainder=Mod('tournaments', self.checkpoint_interval)).exclude(remainder=0).delete()
+        self.checkpoint.objects.bulk_create(self.checkpoints)
+        self.metrics.increment('checkpoints_created', len(self.checkpoints))
+
+    def save_rating_changes(self, after=None):
+        """
+        Replaces rating changes of the replayed matches, matches before the checkpoint weren't replayed and keep theirs
+        """
+        if self.change is None:
+            return
+        old_changes = self.change.objects.all()
+        if after is not None:
+            old_changes = old_changes.filter(after_checkpoint(after, 'match__tournament__'))
+        old_changes.delete()
+        rows = [
+            self.change(match_id=change.match_id, leaderboard_type=leaderboard_type, player_id=player_id,
+                        mu_before=before.mu, sigma_before=before.sigma, mu_after=after.mu, sigma_after=after.sigma)
+            for leaderboard_type, changes in self.changes.items() for change in changes
+            for player_id, before, after in ((change.winner_id, change.winner_before, change.winner_after),
+                                             (change.loser_id, change.loser_before, change.loser_after))
+        ]
+        self.change.objects.bulk_create(rows, batch_size=1000)
+        self.metrics.increment('rating_changes_written', len(rows))
+
+    def save_head_to_head(self, after=None):
+        """
+        Recalculates head-to-head records of pairs that played in the replayed tournaments, all of them after a full
+        replay
+        """
+        if self.head_to_head is None:
+            return
+        records = self.head_to_head.objects.refresh(after=after.date if after is not None else None)
+        self.metrics.increment('head_to_head_written', records)
+
+    def leaderboard_racers(self):
+        return {'mixed': self.racers, 'unseeded': self.unseeded_racers, 'seeded': self.seeded_racers}
+
+    def replay_parallel(self, tournaments):
+        """
+        Replays the leaderboards in separate worker processes, results are the same as with replay. Only the
+        checkpoint after the last tournament is created, intermediate states stay in the workers.
+        """
+        steps = self.partition(tournaments)
+        racers = self.leaderboard_racers()  # Restored from a checkpoint or empty
+        with ProcessPoolExecutor(max_workers=len(steps)) as executor:
+            results = dict(zip(steps, executor.map(record_steps, steps.values(),
+                                                   (racers[leaderboard_type] for leaderboard_type in steps),
+                                                   [self.change is not None] * len(steps))))
+        self.racers, self.unseeded_racers, self.seeded_racers = [
+            results[leaderboard_type][0] for leaderboard_type in ('mixed', 'unseeded', 'seeded')]
+        for leaderboard_type, (_, _, changes) in results.items():
+            self.changes[leaderboard_type].extend(changes)
+        self.metrics.increment('matches_processed', len(steps['mixed']))  # Every rated match counts towards mixed
+        self.metrics.increment('rating_updates', sum(rating_updates for _, rating_updates, _ in results.values()))
+
+    def rated_leaderboards(self, tournament, match):
+        """
+        Leaderboards the match is rated in, shared by process_tournament and partition so both apply the same rules
+
+        :return: Tuple of (leaderboard type, repeats) pairs in rating order, empty for matches that are not rated
+            (team, other, and any undefined ruleset)
+        """
+        ruleset = match.ruleset if tournament.ruleset == 'multiple' else tournament.ruleset
+        if ruleset in ('unseeded', 'diversity'):
+            return ('mixed', 1), ('unseeded', 1)
+        if ruleset == 'seeded':
+            return ('mixed', self.seeded_multiplier), ('seeded', 1)
+        if ruleset == 'mixed':
+            return ('mixed', self.mixed_multiplier), ('unseeded', 1)
+        return ()
+
+    def partition(self, tournaments):
+        """
+        Splits the match history into independent streams of rating steps, one for every leaderboard, with the same
+        rules and order as process_tournament
+
+        :return: Dictionary of RatingStep lists keyed by leaderboard type
+        """
+        steps = {'mixed': [], 'unseeded': [], 'seeded': []}
+        for tournament in tournaments:
+            for match in tournament.matches:
+                for leaderboard_type, repeats in self.rated_leaderboards(tournament, match):
+                    steps[leaderboard_type].append(RatingStep(tournament.id, match, repeats))
+        return steps
+
+    def process_tournament(self, tournament):
+        players_in_tourney = []
+        players_in_leaderboard_tourney = {'unseeded': [], 'seeded': []}
+        for match in tournament.matches:
+            leaderboards = self.rated_leaderboards(tournament, match)
+            if not leaderboards:
+                continue
+            self.initiate_player(match, players_in_tourney, **{
+                leaderboard_type: players_in_leaderboard_tourney[leaderboard_type]
+                for leaderboard_type, _ in leaderboards if leaderboard_type != 'mixed'})
+            for leaderboard_type, repeats in leaderboards:
+                self.rate(match, leaderboard_type, repeats)
+
+    def rate(self, match, leaderboard_type, repeats=1):
+        """
+        Rates the match repeats times in the leaderboard and records the rating change
+        """
+        racers_dict = self.leaderboard_racers()[leaderboard_type]
+        winner_before, loser_before = racers_dict[match.winner]['rating'], racers_dict[match.loser]['rating']
+        for _ in range(repeats):
+            self.calculate_rating(match, racers_dict)
+        if self.change is not None:
+            self.changes[leaderboard_type].append(RatingChange(
+                match.id, match.winner_id, match.loser_id, winner_before, loser_before,
+                racers_dict[match.winner]['rating'], racers_dict[match.loser]['rating']))
+
+    def export_leaderboards(self, leaderboards):
+        """
+        Compares calculated leaderboards with the live generation. If anything changed more than the tolerance, all
+        leaderboards are written as a new generation that is published afterwards, so readers keep getting the old
+        generation until the switch. Old generations above generations_kept are removed. Runs in the export
+        transaction of create_leaderboards, the switch becomes visible when it commits.
+
+        :param leaderboards: Dictionary of leaderboard lists returned by calculate_places, keyed by leaderboard type
+        :return: Published generation or None if nothing changed
+        """
+        live_rows = defaultdict(dict)
+        for row in self.leaderboard.objects.live().order_by():
+            live_rows[row.leaderboard_type][row.player_id] = row
+        changes = sum(self.count_changes(leaderboard_list, live_rows[leaderboard_type])
+                      for leaderboard_type, leaderboard_list in leaderboards.items())
+        if not changes:
+            return None
+        generation_model = self.generation_model()
+        generation = generation_model.objects.create(fingerprint=self.fingerprint)
+        rows = [
+            self.leaderboard(generation=generation, leaderboard_type=leaderboard_type,
+                             player_id=record['player_id'], exposure=record['exposure'], mu=record['mu'],
+                             sigma=record['sigma'], tournaments_played=record['tournaments_played'],
+                             matches_played=record['matches_played'])
+            for leaderboard_type, leaderboard_list in leaderboards.items() for record in leaderboard_list
+        ]
+        self.leaderboard.objects.bulk_create(rows)
+        generation.publish()
+        self.metrics.increment('rows_written', len(rows))
+        self.prune_generations(generation_model, generation)
+        return generation
+
+    def count_changes(self, leaderboard_list, live_rows):
+        """
+        Counts players that were added to, changed on or removed from the leaderboard compared to the live rows
+        """
+        removed = set(live_rows)
+        created = 0
+        updated = 0
         for record in leaderboard_list:
-            player = self.leaderboard.objects.get_or_create(player=self.player.objects.get(name=record['name']),
-                                                            leaderboard_type=leaderboard_type)[0]
-            player.exposure = record['exposure']
-            player.mu = record['mu']
-            player.sigma = record['sigma']
-            player.tournaments_played = record['tournaments_played']
-            player.matches_played = record['matches_played']
-            player.save()
+            removed.discard(record['player_id'])
+            row = live_rows.get(record['player_id'])
+            if row is None:
+                created += 1
+            elif self.row_changed(row, record):
+                updated += 1
+        self.metrics.increment('rows_created', created)
+        self.metrics.increment('rows_updated', updated)
+        self.metrics.increment('rows_deleted', len(removed))
+        return created + updated + len(removed)
+
+    def prune_generations(self, generation_model, live_generation):
+        kept = list(generation_model.objects.order_by('-id').values_list('id', flat=True)[:self.generations_kept])
+        old_generations = generation_model.objects.exclude(id__in=kept + [live_generation.id])
+        # Rows are deleted first, so the cascade doesn't have to collect them one by one
+        self.leaderboard.objects.filter(Q(generation__in=old_generations) | Q(generation__isnull=True)).delete()
+        old_generations.delete()
+
+    def row_changed(self, row, record):
+        return (row.tournaments_played != record['tournaments_played']
+                or row.matches_played != record['matches_played']
+                or row.mu is None or abs(row.mu - record['mu']) > self.tolerance
+                or row.sigma is None or abs(row.sigma - record['sigma']) > self.tolerance)
+
+    def save_metrics(self):
+        logger.info(self.metrics.summary())
+        if self.run_model is None:
+            return
+        self.run_model.objects.create(
+            duration=self.metrics.total_time,
+            loading_time=self.metrics.timings['loading'],
+            rating_time=self.metrics.timings['rating'],
+            sorting_time=self.metrics.timings['sorting'],
+            export_time=self.metrics.timings['export'],
+            tournaments_loaded=self.metrics.counters['tournaments_loaded'],
+            matches_processed=self.metrics.counters['matches_processed'],
+            rating_updates=self.metrics.counters['rating_updates'],
+            rows_written=self.metrics.counters['rows_written'],
+            rows_created=self.metrics.counters['rows_created'],
+            rows_updated=self.metrics.counters['rows_updated'],
+            rows_deleted=self.metrics.counters['rows_deleted'],
+            queries=self.metrics.total_queries,
+            generation=self.generation
+        )
 
     def calculate_places(self, racers_dict):
         # Creating leaderboard, sorting by exposure value
         leaderboards_list = [
             {
                 'name': key,
+                'player_id': value['id'],
                 'tournaments_played': value['tournaments_played'],
                 'matches_played': value['matches_played'],
                 'exposure': value['rating'].exposure,
@@ -100,6 +441,7 @@ class TrueskillCalculations:
         return leaderboards_list
 
     def initiate_player(self, match, players_in_tourney, **kwargs):
+        self.metrics.increment('matches_processed')
         self.check_players(match, self.racers)
         self.increment_tourney_played(match, self.racers, players_in_tourney)
         self.increment_match_played(match, self.racers)
@@ -115,21 +457,23 @@ class TrueskillCalculations:
 
     @staticmethod
     def check_players(match, racers_dict):
-        winner = match.winner.name
-        loser = match.loser.name
+        winner = match.winner
+        loser = match.loser
         if winner not in racers_dict:
+            racers_dict[winner]['id'] = match.winner_id
             racers_dict[winner]['rating'] = trueskill.Rating(25)
             racers_dict[winner]['matches_played'] = 0
             racers_dict[winner]['tournaments_played'] = 0
         if loser not in racers_dict:
+            racers_dict[loser]['id'] = match.loser_id
             racers_dict[loser]['rating'] = trueskill.Rating(25)
             racers_dict[loser]['matches_played'] = 0
             racers_dict[loser]['tournaments_played'] = 0
 
     @staticmethod
     def increment_tourney_played(match, racers_dict, tourney_players):
-        winner = match.winner.name
-        loser = match.loser.name
+        winner = match.winner
+        loser = match.loser
         if winner not in tourney_players:
             tourney_players.append(winner)
             racers_dict[winner]['tournaments_played'] += 1
@@ -139,15 +483,73 @@ class TrueskillCalculations:
 
     @staticmethod
     def increment_match_played(match, racers_dict):
-        winner = match.winner.name
-        loser = match.loser.name
+        winner = match.winner
+        loser = match.loser
         racers_dict[winner]['matches_played'] += 1
         racers_dict[loser]['matches_played'] += 1
 
-    @staticmethod
-    def calculate_rating(match, racers_dict):
-        winner = match.winner.name
-        loser = match.loser.name
-        if match.score != 'draw':
-            racers_dict[winner]['rating'], racers_dict[loser]['rating'] = \
-                trueskill.rate_1vs1(racers_dict[winner]['rating'], racers_dict[loser]['rating'])
+    def calculate_rating(self, match, racers_dict):
+        winner = match.winner
+        loser = match.loser
+        self.metrics.increment('rating_updates')
+        racers_dict[winner]['rating'], racers_dict[loser]['rating'] = \
+            trueskill.rate_1vs1(racers_dict[winner]['rating'], racers_dict[loser]['rating'])
+
+
+def after_checkpoint(checkpoint, prefix=''):
+    """
+    Condition matching tournaments the checkpoint doesn't include, prefix is the lookup path to the tournament
+    """
+    return (Q(**{f'{prefix}date__gt': checkpoint.date})
+            | Q(**{f'{prefix}date': checkpoint.date, f'{prefix}id__gt': checkpoint.tournament_id}))
+
+
+def record_steps(steps, racers=None, record=False):
+    """
+    Worker of the parallel replay, replay_steps that also returns RatingChange list when record is set
+    """
+    changes = [] if record else None
+    racers, rating_updates = replay_steps(steps, racers, changes)
+    return racers, rating_updates, changes or []
+
+
+def replay_steps(steps, racers=None, changes=None):
+    """
+    Replays rating steps of a single leaderboard, used by worker processes of the parallel replay
+
+    :param steps: RatingStep list returned by TrueskillCalculations.partition
+    :param racers: Racers dictionary to continue from, e.g. restored from a checkpoint
+    :param changes: List to which RatingChange of every rated step is appended
+    :return: Racers dictionary and number of rating updates
+    """
+    racers = defaultdict(dict, racers or {})
+    tournament_id = None
+    players_in_tourney = []
+    rating_updates = 0
+    for step in steps:
+        if step.tournament_id != tournament_id:
+            tournament_id = step.tournament_id
+            players_in_tourney = []
+        TrueskillCalculations.check_players(step.match, racers)
+        TrueskillCalculations.increment_tourney_played(step.match, racers, players_in_tourney)
+        TrueskillCalculations.increment_match_played(step.match, racers)
+        rating_updates += rate_step(step, racers, changes)
+    return racers, rating_updates
+
+
+def rate_step(step, racers, changes=None):
+    """
+    Applies rating updates of the step
+
+    :param changes: List to which RatingChange of the step is appended
+    :return: Number of rating updates
+    """
+    match = step.match
+    winner_before, loser_before = racers[match.winner]['rating'], racers[match.loser]['rating']
+    for _ in range(step.repeats):
+        racers[match.winner]['rating'], racers[match.loser]['rating'] = \
+            trueskill.rate_1vs1(racers[match.winner]['rating'], racers[match.loser]['rating'])
+    if changes is not None:
+        changes.append(RatingChange(match.id, match.winner_id, match.loser_id, winner_before, loser_before,
+                                    racers[match.winner]['rating'], racers[match.loser]['rating']))
+    return step.repeats
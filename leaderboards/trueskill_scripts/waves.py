@@ -0,0 +1,54 @@
+from collections import defaultdict, namedtuple
+
+from leaderboards.trueskill_scripts.trueskill_calculation import TrueskillCalculations, rate_step
+
+# Width of a wave is the number of its steps, mean width is the speedup an ideal parallel execution could reach
+WaveStatistics = namedtuple('WaveStatistics', ['steps', 'waves', 'max_width', 'mean_width'])
+
+
+def schedule_waves(steps):
+    """
+    Groups rating steps of a leaderboard into waves in which no player appears twice. Every step is placed into the
+    wave after the last wave of both its players, so steps of every player keep their order. Applying the waves one
+    after another, with steps of a wave in any order or concurrently, gives the same ratings as the sequential replay.
+
+    :param steps: RatingStep list returned by TrueskillCalculations.partition
+    :return: List of waves, each a list of RatingStep
+    """
+    last_wave = {}
+    waves = []
+    for step in steps:
+        wave = max(last_wave.get(step.match.winner, -1), last_wave.get(step.match.loser, -1)) + 1
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(step)
+        last_wave[step.match.winner] = last_wave[step.match.loser] = wave
+    return waves
+
+
+def wave_statistics(waves):
+    steps = sum(len(wave) for wave in waves)
+    return WaveStatistics(steps=steps, waves=len(waves), max_width=max((len(wave) for wave in waves), default=0),
+                          mean_width=steps / len(waves) if waves else 0.0)
+
+
+def replay_waves(waves):
+    """
+    Replays waves returned by schedule_waves, results are the same as replay_steps of the original steps
+
+    :return: Racers dictionary and number of rating updates
+    """
+    racers = defaultdict(dict)
+    # Tournaments of a player are interleaved with other tournaments in waves, so they are counted per player
+    last_tournament = {}
+    rating_updates = 0
+    for wave in waves:
+        for step in wave:  # Steps of a wave touch different players, each of them could run on its own
+            TrueskillCalculations.check_players(step.match, racers)
+            for player in (step.match.winner, step.match.loser):
+                if last_tournament.get(player) != step.tournament_id:
+                    last_tournament[player] = step.tournament_id
+                    racers[player]['tournaments_played'] += 1
+            TrueskillCalculations.increment_match_played(step.match, racers)
+            rating_updates += rate_step(step, racers)
+    return racers, rating_updates
@@ -5,5 +5,12 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('ajax/leaderboards/<str:leaderboard_type>', views.get_leaderboard, name='get_leaderboard'),
-    path('api/ratings/<str:rating_type>', views.get_ratings, name='get_ratings')
+    path('api/ratings/<str:rating_type>', views.get_ratings, name='get_ratings'),
+    path('api/ratings/<str:rating_type>/<int:player_id>', views.get_rating_changes, name='get_rating_changes'),
+    path('api/h2h/<int:player_a>/<int:player_b>', views.get_head_to_head, name='get_head_to_head'),
+    path('api/predict/<str:rating_type>', views.predict, name='predict'),
+    path('api/seeding/<str:rating_type>', views.seeding, name='seeding'),
+    path('api/simulate/<str:rating_type>', views.simulate_tournament, name='simulate_tournament'),
+    path('api/players/search', views.search_players, name='search_players'),
+    path('metrics', views.metrics, name='metrics'),
 ]
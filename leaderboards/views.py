@@ -1,15 +1,63 @@
 import datetime
+import hashlib
+import json
+
+import numpy as np
 from dateutil.relativedelta import relativedelta
 
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models import Q
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, HttpResponse
 from django.shortcuts import render
-from django.views.decorators.cache import cache_page
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import prometheus
+from .cache import cache_view, get_generation
+from .middleware import TIMED_VIEWS
+from .models import Leaderboard, Tournament, RecalculationRun, LeaderboardGeneration, PlayerSearchTerm, \
+    MatchRatingChange, HeadToHead, head_to_head_key, normalize_alias
+from .routers import use_replica
+from .snapshots import get_snapshot
+from .trueskill_scripts.batch import win_probabilities, match_qualities
+from .trueskill_scripts.seeding import exposures, seed_order, pair_first_round
+from .trueskill_scripts.simulation import FORMATS, SINGLE_ELIMINATION, bracket_indices, rounds_to_winner, simulate
+
+# Limits of a single prediction request, a pool is predicted as a full matrix
+MAX_PREDICTED_PAIRS = 1000
+MAX_PREDICTED_PLAYERS = 256
+MAX_SEEDED_ENTRANTS = 512
+# Limits and defaults of a single simulation request, results are cached for the leaderboard generation in the
+# simulations cache. Work is simulations * entrants (bracket slots in single elimination) * rounds, the cap keeps a
+# request within about 250 ms of a web worker (Swiss, the slower format, simulates about 20 million of them per
+# second), larger runs belong to the simulate_tournament command.
+MAX_SIMULATED_ENTRANTS = 256
+MAX_SIMULATIONS = 500000
+MAX_SWISS_ROUNDS = 20
+MAX_SIMULATION_WORK = 5000000
+DEFAULT_SIMULATIONS = 100000
+SIMULATION_CACHE_TIMEOUT = 60 * 60 * 24
+
 
-from .models import Leaderboard, Tournament
+def generation_rows(leaderboard_type, *fields):
+    """
+    Values of the leaderboard rows of the generation the views are cached under. A replica that hasn't received the
+    generation yet has no rows of it, they are read from the primary then, so the old leaderboard is never cached under
+    the new generation.
+    """
+    generation = get_generation()
+    rows = Leaderboard.objects.of_generation(generation).filter(leaderboard_type=leaderboard_type)
+    values = list(rows.values(*fields))
+    if not values and generation and rows.db != DEFAULT_DB_ALIAS:
+        values = list(rows.using(DEFAULT_DB_ALIAS).values(*fields))
+    return values
 
 
-@cache_page(60 * 15)
+@cache_view(60 * 15)
+@use_replica
 def index(request):
     context = {
         'mixed_events': Tournament.objects.filter(~Q(ruleset__ruleset='other') & ~Q(ruleset__ruleset='team')).order_by(
@@ -24,16 +72,15 @@ def index(request):
     return render(request, 'leaderboards/index.html', context)
 
 
-@cache_page(60 * 15)
+@cache_view(60 * 15)
+@use_replica
 def get_leaderboard(request, leaderboard_type):
     if leaderboard_type not in ['seeded', 'unseeded', 'mixed']:
         raise Http404("This leaderboard doesn't exist")
 
     # Get the leaderboard from the database and make it a list
-    queryset_object = Leaderboard.objects.select_related('player__id').filter(
-        leaderboard_type=leaderboard_type)
-    leaderboard_list = list(
-        queryset_object.values('player__name', 'player__last_played', 'exposure', 'tournaments_played', 'matches_played'))
+    leaderboard_list = generation_rows(leaderboard_type, 'player__name', 'player__last_played', 'exposure',
+                                       'tournaments_played', 'matches_played')
 
     # Add an entry for adjusted exposure
     # (we want the rating to decay for players who have not played in a tournament for a while)
@@ -75,16 +122,307 @@ def get_leaderboard(request, leaderboard_type):
     })
 
 
-# This is meant to be used by bots that need up-to-date rating information
+# This is meant to be used by bots that need up-to-date rating information, publishing a generation invalidates the
+# cache
+@cache_view(60 * 15)
+@use_replica
 def get_ratings(request, rating_type):
     if rating_type not in ['seeded', 'unseeded', 'mixed']:
         raise Http404("This rating type doesn't exist")
 
-    leaderboards = Leaderboard.objects.select_related('player__name')
-    querydict = leaderboards.filter(leaderboard_type=rating_type).values('player__name', 'mu', 'sigma')
+    querydict = generation_rows(rating_type, 'player__name', 'mu', 'sigma')
     player_data = {
         p['player__name']: {'mu': p['mu'], 'sigma': p['sigma']} for p in querydict
     }
     return JsonResponse({
         'data': player_data,
     })
+
+
+# Rating movement of the player in every rated match, newest first. Used by match history and player pages.
+@cache_view(60 * 15)
+@use_replica
+def get_rating_changes(request, rating_type, player_id):
+    if rating_type not in ['seeded', 'unseeded', 'mixed']:
+        raise Http404("This rating type doesn't exist")
+
+    # Same order as the replay, newest first, match ids alone would misplace back-dated tournaments
+    changes = MatchRatingChange.objects.filter(player_id=player_id, leaderboard_type=rating_type).order_by(
+        '-match__tournament__date', '-match__tournament_id', '-match_id').values(
+            'match_id', 'match__winner_id', 'match__tournament__name', 'match__tournament__date', 'mu_before',
+            'sigma_before', 'mu_after', 'sigma_after')
+    change_data = [
+        {
+            'match': change['match_id'],
+            'tournament': change['match__tournament__name'],
+            'date': change['match__tournament__date'],
+            'won': change['match__winner_id'] == player_id,
+            'before': {'mu': change['mu_before'], 'sigma': change['sigma_before']},
+            'after': {'mu': change['mu_after'], 'sigma': change['sigma_after']},
+        } for change in changes
+    ]
+    return JsonResponse({
+        'data': change_data,
+    })
+
+
+# Results of all matches between two players, from the point of view of the first one. Served from the precomputed
+# record of the pair.
+@cache_view(60 * 15)
+@use_replica
+def get_head_to_head(request, player_a, player_b):
+    try:
+        record = HeadToHead.objects.select_related('player_low', 'player_high').get(
+            pk=head_to_head_key(player_a, player_b))
+    except HeadToHead.DoesNotExist:
+        raise Http404("These players haven't played each other")
+
+    swapped = player_a != record.player_low_id
+    players = [record.player_low.name, record.player_high.name]
+    ruleset_data = {
+        ruleset: {'wins': [high_wins, low_wins] if swapped else [low_wins, high_wins], 'draws': draws}
+        for ruleset, (low_wins, high_wins, draws) in json.loads(record.rulesets).items()
+    }
+    return JsonResponse({
+        'players': players[::-1] if swapped else players,
+        'wins': [record.high_wins, record.low_wins] if swapped else [record.low_wins, record.high_wins],
+        'draws': record.draws,
+        'rulesets': ruleset_data,
+        'last_played': record.last_played,
+    })
+
+
+def is_name_list(value, max_length):
+    return isinstance(value, list) and len(value) <= max_length and all(isinstance(name, str) for name in value)
+
+
+# Win probabilities and match quality from live ratings, so bots don't have to download all ratings to get odds of a
+# few matches. JSON body has either "pairs": [[name, name], ...] or "players": [name, ...] for the pairwise matrix,
+# names can also be aliases.
+@csrf_exempt
+@require_POST
+@use_replica
+def predict(request, rating_type):
+    if rating_type not in ['seeded', 'unseeded', 'mixed']:
+        raise Http404("This rating type doesn't exist")
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    players = body.get('players') if isinstance(body, dict) else None
+    if pairs is not None:
+        if not (isinstance(pairs, list) and len(pairs) <= MAX_PREDICTED_PAIRS
+                and all(is_name_list(pair, 2) and len(pair) == 2 for pair in pairs)):
+            return JsonResponse({'error': f'pairs must be a list of at most {MAX_PREDICTED_PAIRS} name pairs'},
+                                status=400)
+        names = [name for pair in pairs for name in pair]
+    elif players is not None:
+        if not is_name_list(players, MAX_PREDICTED_PLAYERS):
+            return JsonResponse({'error': f'players must be a list of at most {MAX_PREDICTED_PLAYERS} names'},
+                                status=400)
+        names = list(dict.fromkeys(players))
+    else:
+        return JsonResponse({'error': 'Request body must contain pairs or players'}, status=400)
+
+    snapshot = get_snapshot(rating_type)
+    indices = snapshot.resolve(names)
+    unknown = sorted({name for name in names if name not in indices})
+    if pairs is not None:
+        pairs = [pair for pair in pairs if pair[0] in indices and pair[1] in indices]
+        players = np.array([indices[player] for player, _ in pairs], dtype=np.intp)
+        opponents = np.array([indices[opponent] for _, opponent in pairs], dtype=np.intp)
+        arguments = (snapshot.mu[players], snapshot.sigma[players], snapshot.mu[opponents], snapshot.sigma[opponents])
+        pair_data = [
+            {'players': pair, 'win_probability': win_probability, 'quality': quality}
+            for pair, win_probability, quality in zip(pairs, win_probabilities(*arguments).tolist(),
+                                                      match_qualities(*arguments).tolist())
+        ]
+        return JsonResponse({
+            'data': pair_data,
+            'unknown': unknown,
+        })
+    players = [name for name in names if name in indices]
+    pool = np.array([indices[name] for name in players], dtype=np.intp)
+    mu, sigma = snapshot.mu[pool], snapshot.sigma[pool]
+    # Rows are players and columns their opponents
+    arguments = (mu[:, None], sigma[:, None], mu[None, :], sigma[None, :])
+    return JsonResponse({
+        'players': players,
+        'win_probability': win_probabilities(*arguments).tolist(),
+        'quality': match_qualities(*arguments).tolist(),
+        'unknown': unknown,
+    })
+
+
+# Seeding of a bracket by conservative rating. JSON body has "entrants": [name, ...], names can also be aliases, and
+# optionally "pairings": true for first round pairings of top and bottom half seeds with the best total match quality.
+# Entrants without rating get the initial rating.
+@csrf_exempt
+@require_POST
+@use_replica
+def seeding(request, rating_type):
+    if rating_type not in ['seeded', 'unseeded', 'mixed']:
+        raise Http404("This rating type doesn't exist")
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    entrants = body.get('entrants') if isinstance(body, dict) else None
+    if not is_name_list(entrants, MAX_SEEDED_ENTRANTS):
+        return JsonResponse({'error': f'entrants must be a list of at most {MAX_SEEDED_ENTRANTS} names'}, status=400)
+    entrants = list(dict.fromkeys(entrants))
+
+    snapshot = get_snapshot(rating_type)
+    mu, sigma, rated, indices = snapshot.entrant_ratings(entrants)
+    order = seed_order(mu, sigma)
+    mu, sigma, rated = mu[order], sigma[order], rated[order]
+    entrant_data = [
+        {
+            'seed': seed,
+            'name': entrants[entrant],
+            'player': snapshot.names[indices[entrants[entrant]]] if is_rated else None,
+            'mu': entrant_mu,
+            'sigma': entrant_sigma,
+            'exposure': exposure,
+        } for seed, (entrant, is_rated, entrant_mu, entrant_sigma, exposure) in enumerate(zip(
+            order.tolist(), rated.tolist(), mu.tolist(), sigma.tolist(), exposures(mu, sigma).tolist()), start=1)
+    ]
+    response = {'data': entrant_data}
+    if body.get('pairings'):
+        pairs, bye = pair_first_round(mu, sigma)
+        response['pairings'] = [{'seeds': [seed + 1, opponent_seed + 1], 'quality': quality}
+                                for seed, opponent_seed, quality in pairs]
+        response['bye'] = bye + 1 if bye is not None else None
+    return JsonResponse(response)
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)  # JSON true would pass as 1
+
+
+def simulation_cache_key(generation, request_data):
+    digest = hashlib.sha256(json.dumps(request_data, sort_keys=True).encode()).hexdigest()
+    return f'leaderboards:simulation:{generation}:{digest}'
+
+
+# Monte Carlo simulation of a tournament from live ratings. JSON body has "format": "single_elimination" or "swiss",
+# "entrants": [name, ...] in bracket order (null for byes in single elimination), optionally "rounds" of Swiss
+# and number of "simulations", by default as many as MAX_SIMULATION_WORK allows up to DEFAULT_SIMULATIONS. Entrants
+# without rating get the initial rating. Returns probabilities of reaching every round and winning for single
+# elimination, of every final number of wins and first place for Swiss. Runs in the web worker, never in a process pool.
+@csrf_exempt
+@require_POST
+@use_replica
+def simulate_tournament(request, rating_type):
+    if rating_type not in ['seeded', 'unseeded', 'mixed']:
+        raise Http404("This rating type doesn't exist")
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+    bracket_format = body.get('format', SINGLE_ELIMINATION)
+    if bracket_format not in FORMATS:
+        return JsonResponse({'error': f'format must be one of {", ".join(FORMATS)}'}, status=400)
+    entrants = body.get('entrants')
+    byes_allowed = bracket_format == SINGLE_ELIMINATION
+    if not (isinstance(entrants, list) and len(entrants) <= MAX_SIMULATED_ENTRANTS
+            and all(isinstance(name, str) or (byes_allowed and name is None) for name in entrants)):
+        return JsonResponse({'error': f'entrants must be a list of at most {MAX_SIMULATED_ENTRANTS} names'},
+                            status=400)
+    names, bracket = bracket_indices(entrants)
+    if len(names) < 2 or len(set(names)) != len(names):
+        return JsonResponse({'error': 'entrants must contain at least two different names, each only once'},
+                            status=400)
+    if bracket_format == SINGLE_ELIMINATION:
+        # Rounds and slots of the bracket padded with byes to a power of two, as simulated
+        rounds = rounds_to_winner(bracket)
+        slots = 1 << rounds
+    else:
+        rounds = body.get('rounds', rounds_to_winner(names))
+        slots = len(names)
+    if not (is_integer(rounds) and 1 <= rounds <= MAX_SWISS_ROUNDS):
+        return JsonResponse({'error': f'rounds must be between 1 and {MAX_SWISS_ROUNDS}'}, status=400)
+    max_simulations = min(MAX_SIMULATIONS, MAX_SIMULATION_WORK // (slots * rounds))
+    simulations = body.get('simulations', min(DEFAULT_SIMULATIONS, max_simulations))
+    if not (is_integer(simulations) and 1 <= simulations <= max_simulations):
+        return JsonResponse({'error': f'simulations must be between 1 and {max_simulations} for this bracket'},
+                            status=400)
+
+    snapshot = get_snapshot(rating_type)
+    request_data = {'rating_type': rating_type, 'format': bracket_format, 'entrants': entrants,
+                    'simulations': simulations}
+    if bracket_format != SINGLE_ELIMINATION:
+        request_data['rounds'] = rounds
+    key = simulation_cache_key(snapshot.generation, request_data)
+    simulation_cache = caches['simulations']
+    response = simulation_cache.get(key)
+    if response is not None:
+        request.cache_status = 'hit'
+        return JsonResponse(response)
+
+    request.cache_status = 'miss'
+    mu, sigma, rated, indices = snapshot.entrant_ratings(names)
+    probabilities = simulate(bracket_format, mu, sigma, simulations, bracket=bracket, rounds=rounds)
+    entrant_data = []
+    for name, is_rated, entrant_mu, entrant_sigma, results in zip(names, rated.tolist(), mu.tolist(),
+                                                                  sigma.tolist(), probabilities.tolist()):
+        data = {
+            'name': name,
+            'player': snapshot.names[indices[name]] if is_rated else None,
+            'mu': entrant_mu,
+            'sigma': entrant_sigma,
+        }
+        if bracket_format == SINGLE_ELIMINATION:
+            data.update(rounds=results[:-1], win=results[-1])
+        else:
+            data.update(wins=results[:-1], first=results[-1])
+        entrant_data.append(data)
+    response = dict(request_data, data=entrant_data)
+    simulation_cache.set(key, response, SIMULATION_CACHE_TIMEOUT)
+    return JsonResponse(response)
+
+
+# Players whose name or alias contains q, with their current ratings. Used for autocomplete by the site and bots.
+# Not cached, every keystroke would add an entry to the shared cache and push out the leaderboard pages, and the search
+# is a single indexed query anyway.
+@use_replica
+def search_players(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    if len(normalize_alias(query)) < 2:  # Single characters match most of the players
+        return JsonResponse({'data': []})
+
+    player_data = []
+    for match in PlayerSearchTerm.objects.search(query)[:limit]:
+        ratings = {
+            rating_type: {'mu': match[f'{rating_type}_mu'], 'sigma': match[f'{rating_type}_sigma']}
+            for rating_type in ['mixed', 'unseeded', 'seeded'] if match[f'{rating_type}_mu'] is not None
+        }
+        player_data.append({'name': match['player__name'], 'ratings': ratings})
+    return JsonResponse({
+        'data': player_data,
+    })
+
+
+# Prometheus scrape endpoint, available only when METRICS setting is enabled
+def metrics(request):
+    if not settings.METRICS:
+        raise Http404("Metrics are disabled")
+
+    last_run = RecalculationRun.objects.first()
+    live_generation = LeaderboardGeneration.objects.live()
+    gauges = [
+        ('leaderboards_recalculation_duration_seconds', 'Duration of the last leaderboard recalculation',
+         last_run.duration if last_run else None),
+        ('leaderboards_generation_age_seconds', 'Time since the live leaderboard generation was published',
+         (timezone.now() - live_generation.published).total_seconds() if live_generation else None),
+        ('leaderboards_generation_id', 'Id of the live leaderboard generation',
+         live_generation.id if live_generation else None),
+    ]
+    return HttpResponse(prometheus.render(TIMED_VIEWS, gauges), content_type='text/plain; version=0.0.4')